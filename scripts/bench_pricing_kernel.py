@@ -0,0 +1,63 @@
+# scripts/bench_pricing_kernel.py
+#
+# Benchmarks the vectorised overage kernel against the per-row pricing loop
+# on 1M (subscriber, metric) pairs and checks that totals match exactly.
+#
+# Usage: python scripts/bench_pricing_kernel.py [--pairs 1000000] [--seed 7]
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from services.pricing_kernel import price_pairs
+
+
+def per_row_totals(pair_subscriber, usage, limits, rates, base_fees):
+    totals = base_fees.tolist()
+    for row, used, limit, rate in zip(pair_subscriber.tolist(), usage.tolist(), limits.tolist(), rates.tolist()):
+        overage = max(0, used - limit)
+        if overage > 0:
+            totals[row] += overage * rate
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the overage pricing kernel")
+    parser.add_argument("--pairs", type=int, default=1_000_000)
+    parser.add_argument("--metrics-per-subscriber", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    n_subscribers = args.pairs // args.metrics_per_subscriber
+    pair_subscriber = np.repeat(np.arange(n_subscribers), args.metrics_per_subscriber)
+    usage = rng.integers(0, 10_000, size=len(pair_subscriber))
+    limits = rng.integers(0, 8_000, size=len(pair_subscriber))
+    rates = np.round(rng.uniform(0.01, 2.0, size=len(pair_subscriber)), 3)
+    base_fees = np.round(rng.uniform(100, 2000, size=n_subscribers), 2)
+
+    start = time.perf_counter()
+    _, _, totals = price_pairs(pair_subscriber, usage, limits, rates, base_fees)
+    kernel_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = per_row_totals(pair_subscriber, usage, limits, rates, base_fees)
+    loop_seconds = time.perf_counter() - start
+
+    print(f"📊 {len(pair_subscriber):,} pairs / {n_subscribers:,} subscribers")
+    print(f"⚡ Vectorised kernel: {kernel_seconds * 1000:.1f} ms")
+    print(f"🐢 Per-row loop:      {loop_seconds * 1000:.1f} ms ({loop_seconds / kernel_seconds:.1f}x slower)")
+
+    if totals.tolist() != expected:
+        print("❌ Kernel totals differ from the per-row loop")
+        sys.exit(1)
+    print("✅ Totals match the per-row loop exactly")
+
+
+if __name__ == "__main__":
+    main()
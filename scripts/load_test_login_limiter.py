@@ -0,0 +1,69 @@
+# scripts/load_test_login_limiter.py
+#
+# Load test for the SQLite login rate limiter: several processes hammer
+# is_rate_limited + log_attempt against one scratch database, then the stored
+# counters are checked against the number of attempts made, so lost updates
+# between processes show up as a mismatch.
+#
+# Usage: python scripts/load_test_login_limiter.py [--processes 4] [--attempts 5000] [--users 500]
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from config import settings
+
+
+def worker(args):
+    db_path, worker_id, attempts, users = args
+    settings.LOGIN_ATTEMPTS_DB = db_path
+    from utils.login_attempts import is_rate_limited, log_attempt
+
+    limited = 0
+    for i in range(attempts):
+        username = f"user{(worker_id * 7919 + i) % users}"
+        address = f"10.0.{worker_id}.{i % 250}"
+        limited += is_rate_limited(username, address)
+        log_attempt(username, address)
+    return limited
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the login rate limiter across processes")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--attempts", type=int, default=5000, help="Attempts per process")
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+
+    from utils.login_attempts import WINDOW_SECONDS
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="login_limiter_"), "login_attempts.db")
+
+    started = time.perf_counter()
+    with Pool(args.processes) as pool:
+        limited = sum(pool.map(worker, [(db_path, w, args.attempts, args.users) for w in range(args.processes)]))
+    elapsed = time.perf_counter() - started
+
+    total = args.processes * args.attempts
+    conn = sqlite3.connect(db_path)
+    counted = conn.execute("SELECT SUM(count + prev_count) FROM login_attempts WHERE key LIKE 'user:%'").fetchone()[0]
+    conn.close()
+
+    print(f"📊 {total:,} attempts from {args.processes} processes in {elapsed:.2f}s "
+          f"({total / elapsed:,.0f} attempts/s, {limited:,} rate limited)")
+    if int(time.time()) // WINDOW_SECONDS != int(time.time() - elapsed) // WINDOW_SECONDS:
+        print("⚠️ The run crossed a window boundary; counts were split across windows")
+    if counted != total:
+        print(f"❌ Stored {counted:,} attempts, expected {total:,}")
+        sys.exit(1)
+    print("✅ Every attempt was counted exactly once")
+
+
+if __name__ == "__main__":
+    main()
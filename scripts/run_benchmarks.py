@@ -0,0 +1,363 @@
+# scripts/run_benchmarks.py
+#
+# Benchmark suite over a generated dataset (db.synthetic_data): usage CSV
+# import, one-event-at-a-time usage recording, invoice runs per tenant,
+# invoice previews, invoice PDFs, the superadmin PDF report by tenant count,
+# and headless renders of the dashboard pages (their query sets included).
+# Each case runs --repeat times; results go to a JSON file, and --compare
+# fails the run when a case's median time per unit is more than --threshold
+# times the baseline's, so regressions are caught between versions. Mail is
+# never sent.
+#
+# Usage: python scripts/run_benchmarks.py [--tenants 5 --users 100 --events-per-day 5]
+#            [--report-tenants 10,20] [--output logs/benchmarks/latest.json]
+#            [--compare logs/benchmarks/baseline.json --threshold 1.25] [--only csv_import]
+
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from config import settings
+from db.query_stats import query_stats
+from db.synthetic_data import generate_dataset
+
+# (case, username the page is rendered as, script)
+DASHBOARD_PAGES = (
+    ("dashboard_superadmin", "bench_superadmin",
+     "from views.superadmin.superadmin_dashboard import superadmin_dashboard\nsuperadmin_dashboard()"),
+    ("dashboard_admin_analytics", "bench_superadmin",
+     "from views.superadmin.admin_analytics_dashboard import render_admin_analytics_dashboard\n"
+     "render_admin_analytics_dashboard()"),
+    ("dashboard_admin", "admin_t1", "from views.admin.admin_dashboard import admin_dashboard\nadmin_dashboard()"),
+)
+
+
+def _query_count():
+    return sum(row["calls"] for row in query_stats.snapshot())
+
+
+def run_case(name, fn, units, unit, repeat, setup=None):
+    """Time fn() `repeat` times (setup() untimed before each); returns the case's result dict."""
+    timings = []
+    queries_before = _query_count()
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    median = statistics.median(timings)
+    result = {
+        "unit": unit,
+        "units": units,
+        "repeat": repeat,
+        "min_s": round(min(timings), 6),
+        "median_s": round(median, 6),
+        "max_s": round(max(timings), 6),
+        "per_second": round(units / median, 2) if median else None,
+        "ms_per_unit": round(median * 1000 / units, 4) if units else None,
+        "queries_per_run": round((_query_count() - queries_before) / repeat, 1),
+    }
+    print(f"⏱️ {name}: {median * 1000:.1f} ms median, {result['per_second']:,} {unit}/s "
+          f"({result['ms_per_unit']} ms/{unit}, {result['queries_per_run']} queries)")
+    return result
+
+
+def tenant_fixture(tenant_id):
+    conn = sqlite3.connect(settings.DB_FILE)
+    users = [row[0] for row in conn.execute(
+        "SELECT id FROM users WHERE tenant_id = ? AND role = 'client' ORDER BY id", (tenant_id,)
+    )]
+    metrics = [row[0] for row in conn.execute(
+        "SELECT name FROM usage_metrics WHERE tenant_id = ? ORDER BY id", (tenant_id,)
+    )]
+    invoice_ids = [row[0] for row in conn.execute(
+        "SELECT id FROM invoices WHERE tenant_id = ? ORDER BY id LIMIT 50", (tenant_id,)
+    )]
+    conn.close()
+    return users, metrics, invoice_ids
+
+
+def bench_csv_import(tenant_id, users, metrics, rows, repeat):
+    from services.usage_import import import_usage_csv
+
+    day = date.today().isoformat()
+    lines = ["user_id,metric_name,usage_amount,usage_date"]
+    lines.extend(f"{users[i % len(users)]},{metrics[i % len(metrics)]},{i % 97 + 1},{day}" for i in range(rows))
+    data = "\n".join(lines)
+
+    def run():
+        valid, failed = import_usage_csv(tenant_id, io.StringIO(data))
+        assert valid == rows and not failed, failed[:3]
+
+    return run_case("csv_import", run, rows, "rows", repeat)
+
+
+def bench_record_usage(tenant_id, users, events, repeat):
+    from db.database import get_db_connection
+    from services.usage_meter import get_usage_meter
+
+    conn = get_db_connection(tenant_id)
+    metric_names = dict(conn.execute("SELECT id, name FROM usage_metrics WHERE tenant_id = ?", (tenant_id,)).fetchall())
+    metric_ids = list(metric_names)
+    conn.close()
+    day = date.today().isoformat()
+
+    def run():
+        # One committed row and one meter sync per event, as a single API/meter call would do
+        for i in range(events):
+            metric_id = metric_ids[i % len(metric_ids)]
+            conn = get_db_connection(tenant_id)
+            conn.execute("""
+                INSERT INTO usage_records (user_id, tenant_id, metric_id, metric_name, usage_amount, usage_date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (users[i % len(users)], tenant_id, metric_id, metric_names[metric_id], 1, day))
+            conn.commit()
+            conn.close()
+            get_usage_meter().sync(tenant_id)
+
+    return run_case("record_usage", run, events, "events", repeat)
+
+
+def bench_generate_invoices(tenant_id, users, repeat):
+    from billing_engine import generate_invoices
+    from db.database import get_db_connection
+
+    period = date.today().strftime("%Y-%m")
+
+    def reset():
+        # Un-bill the period so every repeat invoices the whole tenant
+        conn = get_db_connection(tenant_id)
+        conn.execute("""
+            DELETE FROM invoice_items WHERE invoice_id IN (
+                SELECT invoice_id FROM billing_ledger WHERE tenant_id = ? AND period = ?)
+        """, (tenant_id, period))
+        conn.execute("""
+            DELETE FROM invoices WHERE id IN (
+                SELECT invoice_id FROM billing_ledger WHERE tenant_id = ? AND period = ?)
+        """, (tenant_id, period))
+        conn.execute("DELETE FROM billing_ledger WHERE tenant_id = ? AND period = ?", (tenant_id, period))
+        conn.commit()
+        conn.close()
+
+    def run():
+        assert generate_invoices(tenant_id, period), "no invoices generated"
+
+    result = run_case("generate_invoices", run, len(users), "invoices", repeat, setup=reset)
+    reset()
+    return result
+
+
+def bench_estimate_invoice(tenant_id, users, repeat):
+    from billing_engine import estimate_invoice_for_user
+    from services.invoice_preview_cache import get_preview_cache
+
+    def cold():
+        get_preview_cache().invalidate(tenant_id)
+
+    def run():
+        for user_id in users:
+            estimate_invoice_for_user(user_id, tenant_id)
+
+    return {
+        "estimate_invoice_cold": run_case("estimate_invoice_cold", run, len(users), "previews", repeat, setup=cold),
+        "estimate_invoice_warm": run_case("estimate_invoice_warm", run, len(users), "previews", repeat),
+    }
+
+
+def bench_invoice_pdf(tenant_id, invoice_ids, repeat):
+    from billing_engine import get_client_info, get_invoice_summary, get_tenant_info
+    from db.database import get_db_connection
+    from utils.pdf_utils import generate_invoice_pdf
+
+    conn = get_db_connection(tenant_id)
+    cursor = conn.cursor()
+    documents = []
+    for invoice_id in invoice_ids:
+        invoice, items = get_invoice_summary(invoice_id, tenant_id)
+        documents.append((invoice, items, get_tenant_info(cursor, tenant_id), get_client_info(cursor, invoice["user_id"])))
+    conn.close()
+
+    def run():
+        for invoice, items, tenant_info, client_info in documents:
+            generate_invoice_pdf(invoice, items, tenant_info, client_info)
+
+    return run_case("generate_invoice_pdf", run, len(documents), "pdfs", repeat)
+
+
+def bench_superadmin_report(tenant_count, start, end, repeat):
+    from utils.report_utils import generate_superadmin_pdf_report
+
+    return run_case(f"superadmin_pdf_report_{tenant_count}_tenants",
+                    lambda: generate_superadmin_pdf_report(start, end), tenant_count, "tenants", repeat)
+
+
+def bench_dashboards(repeat):
+    from streamlit.testing.v1 import AppTest
+    from db.database import get_db_connection
+    from services.session_store import get_session_store
+
+    conn = get_db_connection()
+    conn.execute("""
+        INSERT OR IGNORE INTO users (first_name, last_name, company_name, username, password, email, role, is_verified)
+        VALUES ('Bench', 'Superadmin', 'Platform', 'bench_superadmin', '', 'superadmin@bench.example', 'superadmin', 1)
+    """)
+    conn.commit()
+    conn.close()
+
+    results = {}
+    for name, username, script in DASHBOARD_PAGES:
+        principal = get_session_store().create(username)
+
+        def run():
+            app = AppTest.from_string(script, default_timeout=300)
+            app.session_state["session_id"] = principal["session_id"]
+            app.session_state["authenticated"] = True
+            app.session_state["role"] = principal["role"]
+            app.session_state["tenant_id"] = principal["tenant_id"]
+            app.run()
+            assert not app.exception, [e.message for e in app.exception]
+
+        results[name] = run_case(name, run, 1, "renders", repeat)
+    return results
+
+
+def silence_mail():
+    """Invoice runs and usage alerts email clients; benchmarks only build the messages."""
+    import billing_engine
+    import services.usage_alerts
+    import utils.email_utils
+
+    billing_engine.send_invoce_email = lambda **kwargs: None
+    services.usage_alerts.send_usage_alert_email = lambda *args, **kwargs: True
+    utils.email_utils.send_email = lambda *args, **kwargs: None
+    utils.email_utils.send_email_with_attachment = lambda *args, **kwargs: None
+
+
+def compare(report, baseline_path, threshold):
+    """Print per-unit time ratios against a baseline file; returns the names of regressed cases."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["meta"]["dataset"] != report["meta"]["dataset"]:
+        print("⚠️ Baseline was run on a different dataset; ratios are only indicative")
+    regressions = []
+    for name, result in report["results"].items():
+        before = baseline["results"].get(name)
+        if not before or not before["ms_per_unit"]:
+            continue
+        ratio = result["ms_per_unit"] / before["ms_per_unit"]
+        marker = "❌" if ratio > threshold else "✅"
+        print(f"{marker} {name}: {ratio:.2f}x baseline ({before['ms_per_unit']} → {result['ms_per_unit']} ms/{result['unit']})")
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the billing benchmark suite")
+    parser.add_argument("--tenants", type=int, default=5)
+    parser.add_argument("--users", type=int, default=100, help="Clients per tenant")
+    parser.add_argument("--events-per-day", type=int, default=5)
+    parser.add_argument("--days", type=int, default=90, help="Days of usage up to today")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--csv-rows", type=int, default=10_000)
+    parser.add_argument("--events", type=int, default=500, help="Events for the record_usage case")
+    parser.add_argument("--report-tenants", default="",
+                        help="Comma-separated tenant counts above --tenants to re-run the superadmin report at")
+    parser.add_argument("--only", action="append", help="Run only cases starting with this name (repeatable)")
+    parser.add_argument("--workdir", help="Directory for the generated databases (default: a temp dir)")
+    parser.add_argument("--output", default=os.path.join("logs", "benchmarks", f"bench_{datetime.utcnow():%Y%m%d_%H%M%S}.json"))
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Per-unit time ratio that counts as a regression")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="trackbilling_bench_")
+    settings.DB_FILE = os.path.join(workdir, "bench.db")
+    settings.DB_SHARD_DIR = None
+    settings.ANALYTICS_SNAPSHOT_DIR = None
+    settings.SLOW_QUERY_LOG = None
+    settings.RENDER_PROFILING = False
+
+    end = date.today()
+    start = end - timedelta(days=args.days - 1)
+    dataset = {"tenants": args.tenants, "users_per_tenant": args.users, "events_per_user_per_day": args.events_per_day,
+               "start_date": start.isoformat(), "end_date": end.isoformat(), "seed": args.seed}
+    print(f"🏭 Generating dataset in {workdir} ...")
+    started = time.perf_counter()
+    counts = generate_dataset(settings.DB_FILE, tenants=args.tenants, users_per_tenant=args.users,
+                              events_per_user_per_day=args.events_per_day, start_date=start, end_date=end,
+                              seed=args.seed)
+    print(f"📦 {counts['usage_records']:,} usage rows in {time.perf_counter() - started:.1f}s")
+
+    silence_mail()
+    tenant_id = 1
+    users, metrics, invoice_ids = tenant_fixture(tenant_id)
+    wanted = lambda name: not args.only or any(name.startswith(prefix) for prefix in args.only)
+    results = {}
+
+    if wanted("estimate_invoice"):
+        results.update(bench_estimate_invoice(tenant_id, users, args.repeat))
+    if wanted("generate_invoice_pdf"):
+        results["generate_invoice_pdf"] = bench_invoice_pdf(tenant_id, invoice_ids, args.repeat)
+    if wanted("generate_invoices"):
+        results["generate_invoices"] = bench_generate_invoices(tenant_id, users, args.repeat)
+    if wanted("dashboard"):
+        results.update(bench_dashboards(args.repeat))
+    if wanted("csv_import"):
+        results["csv_import"] = bench_csv_import(tenant_id, users, metrics, args.csv_rows, args.repeat)
+    if wanted("record_usage"):
+        results["record_usage"] = bench_record_usage(tenant_id, users, args.events, args.repeat)
+
+    if wanted("superadmin_pdf_report"):
+        report_start, report_end = end - timedelta(days=30), end
+        tenant_counts = sorted({args.tenants, *(int(n) for n in args.report_tenants.split(",") if n)})
+        total = args.tenants
+        for tenant_count in tenant_counts:
+            if tenant_count > total:
+                # Same shape as the base dataset, appended; a different seed keeps the new tenants distinct
+                generate_dataset(settings.DB_FILE, tenants=tenant_count - total, users_per_tenant=args.users,
+                                 events_per_user_per_day=args.events_per_day, start_date=start, end_date=end,
+                                 seed=args.seed + tenant_count)
+                total = tenant_count
+            name = f"superadmin_pdf_report_{tenant_count}_tenants"
+            results[name] = bench_superadmin_report(tenant_count, report_start, report_end, args.repeat)
+
+    report = {
+        "meta": {
+            "at": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "dataset": dataset,
+            "rows": counts,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Results written to {args.output}")
+
+    if args.compare:
+        regressions = compare(report, args.compare, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} case(s) regressed beyond {args.threshold}x: {', '.join(regressions)}")
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
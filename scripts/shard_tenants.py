@@ -0,0 +1,37 @@
+# scripts/shard_tenants.py
+#
+# Move each tenant's billing data out of the shared database into its own
+# SQLite file under DB_SHARD_DIR. Row counts are verified per table; with
+# --prune the copied rows are then deleted from the shared database, which
+# keeps tenants, users and auth. Safe to re-run.
+#
+# Usage: DB_SHARD_DIR=data/tenants python scripts/shard_tenants.py [--tenant 1 --tenant 2] [--prune]
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from config import settings
+from db.shard_tenants import shard_all_tenants
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split the shared database into one file per tenant")
+    parser.add_argument("--tenant", type=int, action="append", help="Only shard this tenant id (repeatable)")
+    parser.add_argument("--prune", action="store_true", help="Delete copied rows from the shared database")
+    args = parser.parse_args()
+
+    if not settings.DB_SHARD_DIR:
+        parser.error("DB_SHARD_DIR is not set")
+
+    results = shard_all_tenants(args.tenant, prune=args.prune)
+    for tenant_id, copied in results.items():
+        print(f"✅ Tenant {tenant_id}: {sum(copied.values())} rows across {len(copied)} tables")
+    if args.prune:
+        print("🧹 Copied rows pruned from the shared database")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# scripts/simulate_billing_run.py
+#
+# Dry-run a billing period against the live database and print totals per
+# tenant and per plan with deltas vs last month. Nothing is written, so it is
+# safe to schedule hourly ahead of the month-end run.
+#
+# Usage: python scripts/simulate_billing_run.py [--period 2025-07] [--tenant 1 --tenant 2]
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from services.billing_simulation import simulate_billing_run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a billing run without writing invoices")
+    parser.add_argument("--period", default=datetime.utcnow().strftime("%Y-%m"), help="Billing period (YYYY-MM)")
+    parser.add_argument("--tenant", type=int, action="append", help="Limit to a tenant id (repeatable)")
+    args = parser.parse_args()
+
+    report = simulate_billing_run(args.period, tenant_ids=args.tenant)
+
+    print(f"🧪 Simulated billing run for {report['period']} in {report['elapsed']:.2f}s")
+    print(f"{'tenant':<24} {'invoices':>8} {'billed':>7} {'total':>14} {'last month':>14} {'delta':>14}")
+    for row in report["tenants"]:
+        name = row["tenant_name"] or f"#{row['tenant_id']}"
+        print(f"{name:<24} {row['invoices']:>8} {row['already_billed']:>7} {row['total']:>14.2f} "
+              f"{row['last_month']:>14.2f} {row['delta']:>+14.2f}")
+
+    print()
+    print(f"{'tenant':>6} {'plan':<24} {'invoices':>8} {'total':>14} {'last month':>14} {'delta':>14}")
+    for row in report["plans"]:
+        print(f"{row['tenant_id']:>6} {row['plan_name'] or row['plan_id']:<24} {row['invoices']:>8} "
+              f"{row['total']:>14.2f} {row['last_month']:>14.2f} {row['delta']:>+14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,15 @@
 
-import bcrypt
 import sqlite3
-import secrets
-import socket
 from datetime import datetime, timedelta
 from email_validator import validate_email, EmailNotValidError
 
 from db.database import get_db_connection
 from config import settings
 from utils.email_service import send_verification_email
+from services.resend_log import get_resend_log_writer
+from services.token_store import VERIFY, consume_token, issue_token
+from utils.session import get_client_address
+from services.password_hasher import hash_password, verify_password, needs_rehash, rehash_in_background
 
 # Checks if a password meets strength requirements
 def is_strong_password(password: str) -> bool:
@@ -30,9 +31,11 @@ def register_user(username, password, first_name, last_name, company, email, ten
     if not is_strong_password(password):
         return {"success": False, "error": "Weak password."}
 
-    hashed_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+    try:
+        hashed_pw = hash_password(password)
+    except TimeoutError:
+        return {"success": False, "error": "Server busy, please try again."}
     reg_date = datetime.utcnow().isoformat()
-    token = secrets.token_urlsafe(32)
 
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -46,10 +49,11 @@ def register_user(username, password, first_name, last_name, company, email, ten
 
     try:
         cursor.execute("""
-            INSERT INTO users (username, password, first_name, last_name, company_name, email, registration_date, verification_token, tenant_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (username, hashed_pw, first_name, last_name, company, validated_email, reg_date, token, tenant_id))
+            INSERT INTO users (username, password, first_name, last_name, company_name, email, registration_date, tenant_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (username, hashed_pw, first_name, last_name, company, validated_email, reg_date, tenant_id))
         conn.commit()
+        token = issue_token(cursor.lastrowid, VERIFY)
         send_verification_email(to_email=validated_email, username=first_name, token=token)
 
         return {"success": True, "token": token}
@@ -71,52 +75,40 @@ def authenticate_user(username, password):
         user_id, stored_pw, role, is_verified, tenant_id = user
         if not is_verified:
             return "unverified", None, None
-        if bcrypt.checkpw(password.encode(), stored_pw):
+        if verify_password(password, stored_pw):
+            if needs_rehash(stored_pw):
+                rehash_in_background(password, lambda new_hash: save_password_hash(user_id, new_hash, stored_pw))
             return True, role, tenant_id
     return False, None, None
 
-# Verifies a user's email using a token, updates verification status in the database
-def verify_token(token: str):
+# Stores a password re-hashed at the current bcrypt cost, unless the password
+# was changed (e.g. reset) since old_hash was read; returns True if saved
+def save_password_hash(user_id, hashed_pw, old_hash):
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users WHERE verification_token = ?", (token,))
-    user = cursor.fetchone()
+    cursor = conn.execute("UPDATE users SET password = ? WHERE id = ? AND password = ?", (hashed_pw, user_id, old_hash))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount == 1
 
-    if user:
-        cursor.execute("""
-            UPDATE users SET is_verified = 1, verification_token = NULL WHERE id = ?
-        """, (user[0],))
-        conn.commit()
-        result = {"success": True}
-    else:
-        result = {"success": False, "error": "Invalid or expired token"}
+# Verifies a user's email using a token, updates verification status in the database
+def verify_token(token: str):
+    user_id = consume_token(token, VERIFY)
+    if user_id is None:
+        return {"success": False, "error": "Invalid or expired token"}
 
+    conn = get_db_connection()
+    conn.execute("UPDATE users SET is_verified = 1 WHERE id = ?", (user_id,))
+    conn.commit()
     conn.close()
-    return result
+    return {"success": True}
 
-# Initializes session state for authentication
+# Client address of the current session (from the request, never a DNS lookup)
 def get_client_ip():
-    try:
-        return socket.gethostbyname(socket.gethostname())
-    except:
-        return "unknown"
+    return get_client_address() or "unknown"
 
-# Logs the attempt to resend verification email, including user ID, timestamp, IP address, status, and reason
+# Queues a resend-attempt log row (user ID, timestamp, IP address, status, reason); written in batches
 def log_resend_attempt(user_id, status, reason=""):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO verification_resend_log (user_id, timestamp, ip_address, status, reason)
-        VALUES (?, ?, ?, ?, ?)
-    """, (
-        user_id,
-        datetime.utcnow().isoformat(),
-        get_client_ip(),
-        status,
-        reason
-    ))
-    conn.commit()
-    conn.close()
+    get_resend_log_writer().log(user_id, status, reason, get_client_ip())
 
 
 # Resends a verification email if user exists and is not verified
@@ -156,15 +148,16 @@ def resend_verification_email(username):
             # fallback in case parsing fails
             pass
 
-    token = secrets.token_urlsafe(32)
     now_iso = datetime.utcnow().isoformat()
 
     try:
+        # A new link replaces any earlier one
+        token = issue_token(user_id, VERIFY)
         cursor.execute("""
             UPDATE users 
-            SET verification_token = ?, last_verification_sent = ? 
+            SET last_verification_sent = ? 
             WHERE id = ?
-        """, (token, now_iso, user_id))
+        """, (now_iso, user_id))
         conn.commit()
         send_verification_email(to_email=email, username=first_name, token=token)
         log_resend_attempt(user_id, "sent", "Verification email sent")
@@ -1,27 +1,13 @@
 # auto_invoice_generator.py
-import sqlite3
-from datetime import datetime, timedelta
-from billing_engine import generate_invoices
+#
+# Kept for callers that import or run the job from here. It used to bill each
+# subscriber from data/app.db through its own loop; invoices are now priced
+# and written by billing_engine.auto_generate_invoices, like every other
+# entry point.
 
-def generate_monthly_invoices():
-    conn = sqlite3.connect("data/app.db")
-    cursor = conn.cursor()
+from billing_engine import auto_generate_invoices
 
-    # Get all active subscriptions
-    cursor.execute("""
-        SELECT id, user_id, plan_id, tenant_id FROM subscriptions
-        WHERE is_active = 1
-    """)
-    subscriptions = cursor.fetchall()
-
-    for sub_id, user_id, plan_id, tenant_id in subscriptions:
-        try:
-            print(f"🔄 Generating invoice for User ID: {user_id}")
-            generate_invoices(user_id, tenant_id)
-        except Exception as e:
-            print(f"❌ Error invoicing user {user_id}: {e}")
-
-    conn.close()
+generate_monthly_invoices = auto_generate_invoices
 
 if __name__ == "__main__":
-    generate_monthly_invoices()
+    auto_generate_invoices()
@@ -1,10 +1,19 @@
 import sqlite3
 from datetime import datetime, timedelta
 import os   
-from db.database import get_db_connection
+from db.database import get_db_connection, query_all_tenants
 from services.record_usage import get_user_email
 from utils.pdf_utils import generate_invoice_pdf
 from utils.email_service import send_invoce_email
+from services.pricing_kernel import (
+    BASE_FEE_DESCRIPTION, OVERAGE_DESCRIPTION, load_pricing_inputs, price_inputs
+)
+from services.invoice_preview_cache import get_preview_cache
+from services.billing_ledger import (
+    begin_billing_run, billing_period as ledger_period, insert_invoices, ledger_invoice_id, unbilled_user_ids
+)
+from services.usage_meter import get_usage_meter
+from services.subscriptions import active_plan
 
 
 # def get_user_id(user_id):
@@ -20,8 +29,8 @@ def get_billing_period_range(billing_period):
     end_date = (start_date + timedelta(days=32)).replace(day=1) - timedelta(days=1)
     return start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")
 
-def get_invoice_summary(invoice_id):
-    conn = get_db_connection()
+def get_invoice_summary(invoice_id, tenant_id=None):
+    conn = get_db_connection(tenant_id)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
 
@@ -64,53 +73,31 @@ def get_client_info(cursor, user_id):
 
 def generate_invoices(tenant_id, billing_period):
     start_date, end_date = get_billing_period_range(billing_period)
-    conn = get_db_connection()
+    conn = get_db_connection(tenant_id)
     cursor = conn.cursor()
 
-    generated_ids = []
+    # Only subscribers without a ledger entry for this period are invoiced,
+    # so re-running a period is a no-op
+    begin_billing_run(conn)
+    pending = unbilled_user_ids(cursor, tenant_id, ledger_period(start_date))
+    invoice_ids = {}
+    if pending:
+        # Same pricing engine as the preview, for the whole billing period
+        inputs = load_pricing_inputs(cursor, tenant_id, start_date, end_date)
+        priced = price_inputs(inputs, BASE_FEE_DESCRIPTION, OVERAGE_DESCRIPTION)
+        priced = {user_id: result for user_id, result in priced.items() if user_id in pending}
+        try:
+            invoice_ids = insert_invoices(cursor, tenant_id, start_date, end_date, priced)
+        except sqlite3.IntegrityError as e:
+            conn.rollback()
+            conn.close()
+            print(f"⚠️ Invoices for tenant {tenant_id} period {billing_period} already generated: {e}")
+            return []
+    conn.commit()
 
-    cursor.execute("""
-        SELECT s.user_id, s.plan_id, p.name, p.monthly_fee, p.included_units, p.overage_rate
-        FROM subscriptions s
-        JOIN plans p ON s.plan_id = p.id
-        WHERE s.is_active = 1 AND p.tenant_id = ?
-    """, (tenant_id,))
-    subscriptions = cursor.fetchall()
-
-    for sub in subscriptions:
-        user_id, plan_id, plan_name, monthly_fee, included_units, overage_rate = sub
-
-        cursor.execute("""
-            SELECT SUM(usage_amount) FROM usage_records
-            WHERE tenant_id = ? AND user_id = ? AND usage_date BETWEEN ? AND ?
-        """, (tenant_id, user_id, start_date, end_date))
-        usage = cursor.fetchone()[0] or 0
-
-        overage_units = max(0, usage - included_units)
-        overage_cost = overage_units * overage_rate
-        total_amount = monthly_fee + overage_cost
-
-        cursor.execute("""
-            INSERT INTO invoices (tenant_id, user_id, period_start, period_end, invoice_date, total_amount, is_paid)
-            VALUES (?, ?, ?, ?, DATE('now'), ?, 0)
-        """, (tenant_id, user_id, start_date, end_date, total_amount))
-        invoice_id = cursor.lastrowid
-
-        cursor.execute("""
-            INSERT INTO invoice_items (invoice_id, description, quantity, unit_price, total_price)
-            VALUES (?, ?, ?, ?, ?)
-        """, (invoice_id, f"Base Plan: {plan_name}", 1, monthly_fee, monthly_fee))
-
-        if overage_units > 0:
-            cursor.execute("""
-                INSERT INTO invoice_items (invoice_id, description, quantity, unit_price, total_price)
-                VALUES (?, ?, ?, ?, ?)
-            """, (invoice_id, f"Overage: {overage_units} units", overage_units, overage_rate, overage_cost))
-
-        conn.commit()
-        generated_ids.append(invoice_id)
-
-        invoice, items = get_invoice_summary(invoice_id)
+    generated_ids = list(invoice_ids.values())
+    for user_id, invoice_id in invoice_ids.items():
+        invoice, items = get_invoice_summary(invoice_id, tenant_id)
         if invoice is None:
             print(f"❌ Could not fetch summary for invoice_id: {invoice_id}")
             continue
@@ -144,143 +131,72 @@ def generate_invoices(tenant_id, billing_period):
 def generate_invoice_for_user(user_id, tenant_id, billing_period):
     """
     Create a real invoice for a single user and commit to DB.
+    Returns the existing invoice id if the period was already billed.
     """
-    conn = get_db_connection()
+    conn = get_db_connection(tenant_id)
     cursor = conn.cursor()
 
     start_date, end_date = get_billing_period_range(billing_period)
 
     # Ensure user has active subscription
-    cursor.execute("""
-        SELECT s.plan_id FROM subscriptions s
-        WHERE s.user_id = ? AND s.is_active = 1
-    """, (user_id,))
-    row = cursor.fetchone()
-    if not row:
+    plan_id = active_plan(cursor, tenant_id, user_id)
+    if plan_id is None:
         conn.close()
         return None
-
-    plan_id = row[0]
-    # Estimate again using same logic
+    # Estimate again using same logic, with every committed usage row folded in
+    get_usage_meter().sync(tenant_id)
     items, total_amount = estimate_invoice_for_user(user_id, tenant_id)
 
-    cursor.execute("""
-        INSERT INTO invoices (tenant_id, user_id, period_start, period_end, invoice_date, total_amount, is_paid)
-        VALUES (?, ?, ?, ?, DATE('now'), ?, 0)
-    """, (tenant_id, user_id, start_date, end_date, total_amount))
-    invoice_id = cursor.lastrowid
-
-    for item in items:
-        cursor.execute("""
-            INSERT INTO invoice_items (invoice_id, description, quantity, unit_price, total_price)
-            VALUES (?, ?, ?, ?, ?)
-        """, (
-            invoice_id,
-            item["description"],
-            item["quantity"],
-            item["unit_price"],
-            item["total_price"]
-        ))
+    begin_billing_run(conn)
+    existing_id = ledger_invoice_id(cursor, user_id, ledger_period(start_date))
+    if existing_id:
+        conn.rollback()
+        conn.close()
+        return existing_id
 
+    invoice_ids = insert_invoices(cursor, tenant_id, start_date, end_date, {user_id: (items, total_amount)})
     conn.commit()
     conn.close()
-    return invoice_id
+    return invoice_ids[user_id]
 
 
 def estimate_invoice_for_user(user_id, tenant_id):
     """
     Estimate the current invoice for a user based on usage vs plan limits (preview only).
+    Served from the preview cache, which the usage meter keeps up to date.
     Returns:
         - List of itemized line items
         - Total estimated cost
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    return get_preview_cache().get(tenant_id, user_id)
 
-    # Get active subscription for user
-    cursor.execute("""
-        SELECT s.plan_id, p.name, p.monthly_fee
-        FROM subscriptions s
-        JOIN plans p ON s.plan_id = p.id
-        WHERE s.user_id = ? AND s.is_active = 1
-    """, (user_id,))
-    sub = cursor.fetchone()
-
-    if not sub:
-        conn.close()
-        return [], 0.0
 
-    plan_id, plan_name, monthly_fee = sub
-
-    # 1. Start with the monthly base fee
-    items = [{
-        "description": f"Base Plan: {plan_name}",
-        "quantity": 1,
-        "unit_price": monthly_fee,
-        "total_price": monthly_fee,
-        "date": datetime.now().strftime("%Y-%m-%d")
-    }]
-    total = monthly_fee
-
-    # 2. Get plan metric limits and overage rates
-    cursor.execute("""
-        SELECT pml.metric_id, m.name, pml.metric_limit, pml.overage_rate
-        FROM plan_metric_limits pml
-        JOIN usage_metrics m ON m.id = pml.metric_id
-        WHERE pml.plan_id = ?
-    """, (plan_id,))
-    limits = cursor.fetchall()
-
-    if not limits:
-        conn.close()
-        return items, total  # Plan has no usage-based charges
-
-    # 3. For each metric, get total usage for current month
-    today = datetime.now()
-    start_date = today.replace(day=1).strftime("%Y-%m-%d")
-    end_date = today.strftime("%Y-%m-%d")
-
-    for metric_id, metric_name, metric_limit, overage_rate in limits:
-        cursor.execute("""
-            SELECT SUM(usage_amount) FROM usage_records
-            WHERE tenant_id = ? AND user_id = ? AND metric_id = ? AND usage_date BETWEEN ? AND ?
-        """, (tenant_id, user_id, metric_id, start_date, end_date))
-        usage = cursor.fetchone()[0] or 0
-
-        overage = max(0, usage - metric_limit)
-        overage_cost = overage * overage_rate if overage > 0 else 0.0
-
-        # Add line if there's overage
-        if overage > 0:
-            items.append({
-                "description": f"Overage - {metric_name} (Limit: {metric_limit})",
-                "quantity": overage,
-                "unit_price": overage_rate,
-                "total_price": overage_cost,
-                "date": today.strftime("%Y-%m-%d")
-            })
-            total += overage_cost
+def estimate_invoices_for_tenant(tenant_id, start_date, end_date):
+    """
+    Estimate invoices for every active subscriber of a tenant in one pass.
+    Returns {user_id: (items, total)} with the same line items as
+    estimate_invoice_for_user.
+    """
+    conn = get_db_connection(tenant_id)
+    cursor = conn.cursor()
+    inputs = load_pricing_inputs(cursor, tenant_id, start_date, end_date)
     conn.close()
-    return items, total
+
+    return price_inputs(inputs, BASE_FEE_DESCRIPTION, OVERAGE_DESCRIPTION, date=end_date)
 
 
 def finalize_invoice_for_user(user_id, tenant_id):
-    conn = get_db_connection()
+    conn = get_db_connection(tenant_id)
     cursor = conn.cursor()
 
     # Step 1: Get active subscription
-    cursor.execute("""
-        SELECT plan_id FROM subscriptions 
-        WHERE user_id = ? AND is_active = 1
-    """, (user_id,))
-    sub = cursor.fetchone()
-    if not sub:
+    plan_id = active_plan(cursor, tenant_id, user_id)
+    if plan_id is None:
         conn.close()
         return False, "No active subscription found."
 
-    plan_id = sub[0]
-
-    # Step 2: Estimate invoice again (safety)
+    # Step 2: Estimate invoice again (safety), with every committed usage row folded in
+    get_usage_meter().sync(tenant_id)
     items, estimated_total = estimate_invoice_for_user(user_id, tenant_id)
     if not items:
         conn.close()
@@ -291,80 +207,60 @@ def finalize_invoice_for_user(user_id, tenant_id):
     period_start = now.replace(day=1).strftime("%Y-%m-%d")
     period_end = now.strftime("%Y-%m-%d")
 
-    # Step 3: Insert invoice record
-    cursor.execute("""
-        INSERT INTO invoices (user_id, tenant_id, invoice_date, period_start, period_end, total_amount, is_paid)
-        VALUES (?, ?, ?, ?, ?, ?, 0)
-    """, (user_id, tenant_id, invoice_date, period_start, period_end, estimated_total))
-    invoice_id = cursor.lastrowid
-
-    # Step 4: Insert invoice items
-    for item in items:
-        cursor.execute("""
-            INSERT INTO invoice_items (invoice_id, description, quantity, unit_price, total_price)
-            VALUES (?, ?, ?, ?, ?)
-        """, (
-            invoice_id,
-            item["description"],
-            item["quantity"],
-            item["unit_price"],
-            item["total_price"]
-        ))
+    # Step 3: Insert invoice, items and ledger entry, once per period
+    begin_billing_run(conn)
+    if ledger_invoice_id(cursor, user_id, ledger_period(period_start)):
+        conn.rollback()
+        conn.close()
+        return False, "An invoice has already been issued for this period."
 
+    invoice_ids = insert_invoices(
+        cursor, tenant_id, period_start, period_end, {user_id: (items, estimated_total)}, invoice_date=invoice_date
+    )
     conn.commit()
     conn.close()
-    return True, invoice_id
+    return True, invoice_ids[user_id]
 
 
 def auto_generate_invoices():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     today = datetime.utcnow().strftime("%Y-%m-%d")
     start_period = datetime.utcnow().replace(day=1).strftime("%Y-%m-%d")
     end_period = datetime.utcnow().strftime("%Y-%m-%d")
+    period = ledger_period(start_period)
 
-    # Get all active subscriptions
-    cursor.execute("""
-        SELECT user_id, plan_id, tenant_id 
+    # Get all tenants with active subscriptions
+    tenant_ids = sorted({row[0] for row in query_all_tenants("""
+        SELECT DISTINCT tenant_id
         FROM subscriptions 
         WHERE is_active = 1
-    """)
-    subscriptions = cursor.fetchall()
-
-    for user_id, plan_id, tenant_id in subscriptions:
-        # Skip if invoice already exists for this user for the current period
-        cursor.execute("""
-            SELECT 1 FROM invoices
-            WHERE user_id = ? AND strftime('%Y-%m', invoice_date) = strftime('%Y-%m', ?)
-        """, (user_id, today))
-        if cursor.fetchone():
-            continue  # Already billed this period
-
-        # Estimate invoice
-        items, estimated_total = estimate_invoice_for_user(user_id, tenant_id)
-        if not items:
+    """)})
+
+    for tenant_id in tenant_ids:
+        conn = get_db_connection(tenant_id)
+        cursor = conn.cursor()
+        # One write transaction per tenant; subscribers already in the ledger are skipped
+        begin_billing_run(conn)
+        pending = unbilled_user_ids(cursor, tenant_id, period)
+        if not pending:
+            conn.rollback()
+            conn.close()
             continue
 
-        # Insert invoice
-        cursor.execute("""
-            INSERT INTO invoices (user_id, tenant_id, invoice_date, period_start, period_end, total_amount, is_paid)
-            VALUES (?, ?, ?, ?, ?, ?, 0)
-        """, (get_user_id(user_id), tenant_id, today, start_period, end_period, estimated_total))
-        invoice_id = cursor.lastrowid
-
-        # Insert invoice items
-        for item in items:
-            cursor.execute("""
-                INSERT INTO invoice_items (invoice_id, description, quantity, unit_price, total_price)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                invoice_id,
-                item['description'],
-                item['quantity'],
-                item['unit_price'],
-                item['total_price']
-            ))
+        # Price every subscriber of the tenant in one vectorised pass
+        estimates = estimate_invoices_for_tenant(tenant_id, start_period, end_period)
+        estimates = {
+            user_id: (items, total) for user_id, (items, total) in estimates.items()
+            if user_id in pending and items
+        }
+        try:
+            invoice_ids = insert_invoices(cursor, tenant_id, start_period, end_period, estimates, invoice_date=today)
+            conn.commit()
+        except sqlite3.IntegrityError as e:
+            conn.rollback()
+            print(f"⚠️ Tenant {tenant_id} already billed for {period}: {e}")
+            continue
+        finally:
+            conn.close()
 
-    conn.commit()
-    conn.close()
+        for user_id, invoice_id in invoice_ids.items():
+            print(f"✅ Invoice generated for user_id {user_id} (Invoice #{invoice_id})")
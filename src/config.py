@@ -7,6 +7,34 @@ class Settings:
     APP_NAME = "SaaS Billing Platform"
     APP_URL = os.getenv("APP_URL", "http://localhost:8501")
     DB_FILE = os.getenv("DB_FILE", "src/db/billing.db")
+    # Optional: one SQLite file per tenant in this directory; DB_FILE keeps tenants/users/auth
+    DB_SHARD_DIR = os.getenv("DB_SHARD_DIR")
+    # Optional: analytics read from backup-API copies in this directory, refreshed when older than the TTL
+    ANALYTICS_SNAPSHOT_DIR = os.getenv("ANALYTICS_SNAPSHOT_DIR")
+    ANALYTICS_SNAPSHOT_TTL = int(os.getenv("ANALYTICS_SNAPSHOT_TTL", 300))
+    # Per-query timing on every connection; statements slower than SLOW_QUERY_MS go to SLOW_QUERY_LOG
+    QUERY_STATS = os.getenv("QUERY_STATS", "1") == "1"
+    SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+    SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "logs/slow_queries.log")
+    # Page render timing in the router; captures of single renders go to RENDER_PROFILE_DIR
+    RENDER_PROFILING = os.getenv("RENDER_PROFILING", "1") == "1"
+    # tracemalloc slows every render it covers, so memory peaks are opt-in
+    RENDER_PROFILE_MEMORY = os.getenv("RENDER_PROFILE_MEMORY", "0") == "1"
+    RENDER_PROFILE_LOG = os.getenv("RENDER_PROFILE_LOG", "logs/render_profile.log")
+    RENDER_PROFILE_DIR = os.getenv("RENDER_PROFILE_DIR", "logs/profiles")
+    # Failed-login counters shared by every process; defaults to login_attempts.db beside DB_FILE
+    LOGIN_ATTEMPTS_DB = os.getenv("LOGIN_ATTEMPTS_DB")
+    # bcrypt runs in a pool at BCRYPT_COST; 0 calibrates it to BCRYPT_TARGET_MS (never below 12)
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+    PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", 64))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 10))
+    BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", 250))
+    BCRYPT_COST = int(os.getenv("BCRYPT_COST", 12))
+    # Server-side sessions: idle lifetime in seconds and principals cached per process
+    SESSION_TTL = int(os.getenv("SESSION_TTL", 12 * 3600))
+    SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", 10_000))
+    # Payment receipts, stored once per content hash under <RECEIPTS_DIR>/<ab>/<cd>/<sha256><ext>
+    RECEIPTS_DIR = os.getenv("RECEIPTS_DIR", "uploaded_receipts")
     SENDER_EMAIL = os.getenv("EMAIL_SENDER")
     SENDER_PASSWORD = os.getenv("EMAIL_PASSWORD")
     SMTP_HOST = os.getenv("EMAIL_HOST", "smtp.gmail.com")
@@ -1,5 +1,169 @@
+import os
 import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 from config import settings
+from db.query_stats import InstrumentedConnection
+
+# Tables that stay in settings.DB_FILE when tenants are sharded; everything else
+# (plans, subscriptions, usage, invoices, payments, ...) lives in the tenant's file
+GLOBAL_TABLES = ("tenants", "users", "verification_resend_log", "auth_tokens", "sessions")
+
+FAN_OUT_WORKERS = 8
+
+_shard_init_lock = threading.Lock()
+_snapshot_locks = {}
+_snapshot_locks_guard = threading.Lock()
+
+
+def is_sharded():
+    return bool(settings.DB_SHARD_DIR)
+
+
+def tenant_db_path(tenant_id):
+    return os.path.join(settings.DB_SHARD_DIR, f"tenant_{int(tenant_id)}.db")
+
+
+def _read_only_uri(path):
+    return Path(path).resolve().as_uri() + "?mode=ro"
+
+
+def _connect(path, read_only=False):
+    factory = InstrumentedConnection if settings.QUERY_STATS else sqlite3.Connection
+    if not read_only:
+        return sqlite3.connect(path, factory=factory)
+    conn = sqlite3.connect(_read_only_uri(path), uri=True, factory=factory)
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def get_db_connection(tenant_id=None, read_only=False):
+    """
+    Connection for a tenant's data. By default every tenant shares
+    settings.DB_FILE. With DB_SHARD_DIR set, tenant rows live in one file per
+    tenant and the global DB (tenants, users, auth) is attached as `global_db`;
+    SQLite resolves unqualified table names across both, so queries joining
+    tenant tables to users work unchanged. tenant_id=None is the global DB.
+
+    read_only=True opens the files with mode=ro and query_only, so the
+    connection can never take the write lock.
+    """
+    if tenant_id is None or not is_sharded():
+        return _connect(settings.DB_FILE, read_only)
+
+    path = tenant_db_path(tenant_id)
+    if not os.path.exists(path):
+        ensure_tenant_db(tenant_id)
+    conn = _connect(path, read_only)
+    conn.execute("ATTACH DATABASE ? AS global_db",
+                 (_read_only_uri(settings.DB_FILE) if read_only else settings.DB_FILE,))
+    return conn
+
+
+def refresh_snapshot(source, max_age=None):
+    """
+    Path of the analytics snapshot of `source`, re-copied with the SQLite
+    backup API when it is older than max_age seconds (default
+    ANALYTICS_SNAPSHOT_TTL). The copy is written beside the snapshot and
+    renamed over it, so open snapshot readers are never disturbed.
+    """
+    max_age = settings.ANALYTICS_SNAPSHOT_TTL if max_age is None else max_age
+    target = os.path.join(settings.ANALYTICS_SNAPSHOT_DIR, os.path.basename(source))
+    with _snapshot_locks_guard:
+        lock = _snapshot_locks.setdefault(target, threading.Lock())
+
+    with lock:
+        if os.path.exists(target) and time.time() - os.path.getmtime(target) < max_age:
+            return target
+
+        os.makedirs(settings.ANALYTICS_SNAPSHOT_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=settings.ANALYTICS_SNAPSHOT_DIR)
+        os.close(fd)
+        src = _connect(source, read_only=True)
+        dst = sqlite3.connect(tmp_path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+        os.replace(tmp_path, target)
+    return target
+
+
+def get_analytics_connection(tenant_id=None):
+    """
+    Read-only connection for heavy reporting queries. With
+    ANALYTICS_SNAPSHOT_DIR set it reads a periodically refreshed snapshot, so
+    long aggregates never hold a read lock on the live files; otherwise it is
+    a read-only connection to the live database.
+    """
+    if not settings.ANALYTICS_SNAPSHOT_DIR:
+        return get_db_connection(tenant_id, read_only=True)
+    if tenant_id is None or not is_sharded():
+        return _connect(refresh_snapshot(settings.DB_FILE), read_only=True)
+
+    path = tenant_db_path(tenant_id)
+    if not os.path.exists(path):
+        ensure_tenant_db(tenant_id)
+    conn = _connect(refresh_snapshot(path), read_only=True)
+    conn.execute("ATTACH DATABASE ? AS global_db", (_read_only_uri(refresh_snapshot(settings.DB_FILE)),))
+    return conn
+
+
+def ensure_tenant_db(tenant_id):
+    """Create the tenant's database file with the tenant-scoped schema if missing."""
+    from db.init_billing_schema import init_billing_schema
+
+    path = tenant_db_path(tenant_id)
+    with _shard_init_lock:
+        if not os.path.exists(path):
+            os.makedirs(settings.DB_SHARD_DIR, exist_ok=True)
+            init_billing_schema(path, shard=True)
+    return path
+
+
+def list_tenant_ids():
+    conn = get_db_connection()
+    tenant_ids = [row[0] for row in conn.execute("SELECT id FROM tenants ORDER BY id").fetchall()]
+    conn.close()
+    return tenant_ids
+
+
+def query_all_tenants(sql, params=(), tenant_ids=None, snapshot=False):
+    """
+    Run one read query over every tenant's data and return all rows.
+
+    Unsharded this is a single query on DB_FILE. Sharded, it runs on each
+    tenant database in parallel and concatenates the rows, so callers merge
+    aggregates (sum scalar counts, re-group GROUP BY results). Connections are
+    read-only; snapshot=True reads the analytics snapshots instead.
+    """
+    def connect(tenant_id=None):
+        if snapshot:
+            return get_analytics_connection(tenant_id)
+        return get_db_connection(tenant_id, read_only=True)
+
+    if not is_sharded():
+        conn = connect()
+        rows = conn.execute(sql, params).fetchall()
+        conn.close()
+        return rows
+
+    if tenant_ids is None:
+        tenant_ids = list_tenant_ids()
+
+    def run(tenant_id):
+        conn = connect(tenant_id)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
 
-def get_db_connection():
-    return sqlite3.connect(settings.DB_FILE)
\ No newline at end of file
+    if not tenant_ids:
+        return []
+    with ThreadPoolExecutor(max_workers=min(FAN_OUT_WORKERS, len(tenant_ids))) as pool:
+        return [row for rows in pool.map(run, tenant_ids) for row in rows]
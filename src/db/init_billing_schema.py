@@ -1,6 +1,19 @@
+import hashlib
+import os
 import sqlite3
 
-def init_billing_schema(db_path="data/billing.db"):
+def add_missing_columns(cursor, table, columns):
+    """Add each column in {name: definition} that the table doesn't have yet; returns the names added."""
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_xinfo({table})")}
+    added = []
+    for name, definition in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            added.append(name)
+    return added
+
+def init_billing_schema(db_path="data/billing.db", shard=False):
+    """Create or migrate the schema. shard=True builds a per-tenant file without the global tables."""
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
@@ -74,8 +87,17 @@ def init_billing_schema(db_path="data/billing.db"):
             FOREIGN KEY (user_id) REFERENCES users(id),
             FOREIGN KEY (plan_id) REFERENCES plans(id)
         );
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_user_active ON subscriptions (user_id, is_active);
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_tenant_active ON subscriptions (tenant_id, is_active);
+
+        -- Bumped with every subscription change; keys the in-process cache in services.subscriptions
+        CREATE TABLE IF NOT EXISTS subscription_versions (
+            tenant_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (tenant_id) REFERENCES tenants(id)
+        );
 
-        
         -- Usage Metrics Table
         CREATE TABLE IF NOT EXISTS usage_metrics (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -99,10 +121,31 @@ def init_billing_schema(db_path="data/billing.db"):
             metric_limit INTEGER NOT NULL DEFAULT 0,
             included_units INTEGER NOT NULL DEFAULT 0,
             overage_rate REAL NOT NULL DEFAULT 0.0,
+            pricing_model TEXT NOT NULL DEFAULT 'flat',  -- 'flat', 'graduated', 'volume'
+            max_charge REAL,                             -- nullable cap on the line charge
             UNIQUE(plan_id, metric_id),
             FOREIGN KEY (plan_id) REFERENCES plans(id),
             FOREIGN KEY (metric_id) REFERENCES usage_metrics(id)
         ); 
+
+        -- Catalogue Versions: bumped on every plan, limit or metric change so
+        -- in-process catalogue caches know when to reload a tenant
+        CREATE TABLE IF NOT EXISTS catalogue_versions (
+            tenant_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (tenant_id) REFERENCES tenants(id)
+        );
+
+        -- Plan Metric Tiers Table (brackets over units above the included limit)
+        CREATE TABLE IF NOT EXISTS plan_metric_tiers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plan_metric_limit_id INTEGER NOT NULL,
+            up_to INTEGER,                   -- upper bound of the bracket, NULL = unbounded
+            unit_price REAL NOT NULL DEFAULT 0.0,
+            UNIQUE(plan_metric_limit_id, up_to),
+            FOREIGN KEY (plan_metric_limit_id) REFERENCES plan_metric_limits(id)
+        );
        
         -- Usage Records Table
         CREATE TABLE IF NOT EXISTS usage_records (
@@ -119,6 +162,50 @@ def init_billing_schema(db_path="data/billing.db"):
             FOREIGN KEY (metric_id) REFERENCES plan_metrics(id)
         );
 
+        CREATE INDEX IF NOT EXISTS idx_usage_records_tenant_date
+            ON usage_records (tenant_id, usage_date);
+
+        -- Month-to-date usage counters checkpointed by services.usage_meter
+        CREATE TABLE IF NOT EXISTS usage_counters (
+            tenant_id INTEGER NOT NULL,
+            period TEXT NOT NULL,            -- 'YYYY-MM'
+            user_id INTEGER NOT NULL,
+            metric_id INTEGER NOT NULL,
+            total_usage INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (tenant_id, period, user_id, metric_id)
+        );
+
+        -- Highest usage_records.id folded into usage_counters per tenant/period
+        CREATE TABLE IF NOT EXISTS usage_counter_checkpoints (
+            tenant_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            last_record_id INTEGER NOT NULL,
+            checkpointed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (tenant_id, period)
+        );
+
+        -- Usage threshold crossings, one row per (user, metric, period, threshold)
+        CREATE TABLE IF NOT EXISTS usage_notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tenant_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            metric_id INTEGER NOT NULL,
+            period TEXT NOT NULL,            -- 'YYYY-MM'
+            threshold INTEGER NOT NULL,      -- 80, 90 or 100 (% of metric_limit)
+            used INTEGER NOT NULL,
+            metric_limit INTEGER NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            delivered_at TEXT,
+            claimed_at TEXT,                 -- set by the sender while the email is going out
+            UNIQUE(user_id, metric_id, period, threshold),
+            FOREIGN KEY (tenant_id) REFERENCES tenants(id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_usage_notifications_tenant_period
+            ON usage_notifications (tenant_id, period);
+
         -- Invoices Table
         CREATE TABLE IF NOT EXISTS invoices (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -129,6 +216,8 @@ def init_billing_schema(db_path="data/billing.db"):
             invoice_date TEXT DEFAULT CURRENT_DATE,
             total_amount REAL NOT NULL,
             is_paid INTEGER DEFAULT 0,
+            amount_paid REAL NOT NULL DEFAULT 0,  -- verified payments, kept by payment_logic
+            balance_due REAL GENERATED ALWAYS AS (ROUND(total_amount - amount_paid, 2)) VIRTUAL,
             due_date TEXT DEFAULT (DATE('now', '+30 days')),
             created_at TEXT DEFAULT CURRENT_TIMESTAMP,
             updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
@@ -146,6 +235,22 @@ def init_billing_schema(db_path="data/billing.db"):
             total_price REAL NOT NULL,
             FOREIGN KEY (invoice_id) REFERENCES invoices(id)
         );
+
+        -- Billing Ledger: at most one invoice per user per billing period
+        CREATE TABLE IF NOT EXISTS billing_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tenant_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            period TEXT NOT NULL,                 -- 'YYYY-MM'
+            invoice_id INTEGER NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (user_id, period),
+            FOREIGN KEY (tenant_id) REFERENCES tenants(id),
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (invoice_id) REFERENCES invoices(id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_billing_ledger_tenant_period
+            ON billing_ledger (tenant_id, period);
         
         
         -- Payments Table
@@ -159,12 +264,18 @@ def init_billing_schema(db_path="data/billing.db"):
             payment_method TEXT,
             receipt_path TEXT,
             notes TEXT,
-            is_verified INTEGER DEFAULT 0,
+            is_verified INTEGER DEFAULT 0,  -- 0 pending, 1 verified, -1 rejected
+            rejection_reason TEXT,
+            receipt_size INTEGER,  -- bytes stored at upload; NULL when there is no receipt file
+            receipt_sha256 TEXT,   -- content hash; receipt_path is then the receipt store path
+            receipt_mime TEXT,
+            bank_ref TEXT,  -- bank statement transaction id, set when reconciled
+            bank_tenant_id INTEGER,  -- tenant whose statement it came from; refs are unique per tenant
             created_at TEXT DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users(id),
             FOREIGN KEY (invoice_id) REFERENCES invoices(id)
         );
-        
+        CREATE INDEX IF NOT EXISTS idx_payments_invoice ON payments (invoice_id, is_verified);
 
 
         CREATE TABLE IF NOT EXISTS subscription_audit (
@@ -179,6 +290,8 @@ def init_billing_schema(db_path="data/billing.db"):
             FOREIGN KEY(old_plan_id) REFERENCES plans(id),
             FOREIGN KEY(new_plan_id) REFERENCES plans(id)
         );
+        CREATE INDEX IF NOT EXISTS idx_subscription_audit_tenant_user
+            ON subscription_audit (tenant_id, user_id, timestamp);
 
         CREATE TABLE IF NOT EXISTS verification_resend_log (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -189,6 +302,107 @@ def init_billing_schema(db_path="data/billing.db"):
             reason TEXT,         -- nullable, e.g., 'rate limit', 'already verified'
             FOREIGN KEY(user_id) REFERENCES users(id)
         );
+
+        -- Email verification and password reset tokens (services.token_store); only hashes are stored
+        CREATE TABLE IF NOT EXISTS auth_tokens (
+            token_hash TEXT PRIMARY KEY,     -- SHA-256 hex of the token
+            purpose TEXT NOT NULL,           -- 'verify' or 'reset'
+            user_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,     -- epoch seconds
+            expires_at INTEGER NOT NULL,     -- epoch seconds
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_auth_tokens_user ON auth_tokens (user_id, purpose);
+        CREATE INDEX IF NOT EXISTS idx_auth_tokens_expiry ON auth_tokens (expires_at);
+
+        -- Server-side sessions (services.session_store): principal and permissions resolved at login
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            role TEXT,
+            tenant_id INTEGER,
+            permissions TEXT NOT NULL DEFAULT '',  -- comma-separated
+            created_at INTEGER NOT NULL,     -- epoch seconds
+            last_seen INTEGER NOT NULL,      -- epoch seconds, refreshed every few minutes of use
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id);
+        CREATE INDEX IF NOT EXISTS idx_sessions_last_seen ON sessions (last_seen);
+    """)
+
+    # Columns added after the first release; CREATE TABLE IF NOT EXISTS won't add them
+    add_missing_columns(cursor, "plan_metric_limits", {
+        "pricing_model": "TEXT NOT NULL DEFAULT 'flat'",
+        "max_charge": "REAL",
+    })
+    if "amount_paid" in add_missing_columns(cursor, "invoices", {
+        "amount_paid": "REAL NOT NULL DEFAULT 0",
+        "balance_due": "REAL GENERATED ALWAYS AS (ROUND(total_amount - amount_paid, 2)) VIRTUAL",
+    }):
+        # Backfill from verified payments; invoices already marked paid count as settled in full
+        cursor.execute("""
+            UPDATE invoices SET amount_paid = ROUND(MAX(
+                COALESCE((SELECT SUM(p.amount) FROM payments p
+                          WHERE p.invoice_id = invoices.id AND p.is_verified = 1), 0),
+                CASE WHEN is_paid = 1 THEN total_amount ELSE 0 END
+            ), 2)
+        """)
+    add_missing_columns(cursor, "usage_notifications", {"claimed_at": "TEXT"})
+    added = add_missing_columns(cursor, "payments", {
+        "bank_ref": "TEXT",
+        "rejection_reason": "TEXT",
+        "receipt_size": "INTEGER",
+        "receipt_sha256": "TEXT",
+        "receipt_mime": "TEXT",
+        "bank_tenant_id": "INTEGER",
+    })
+    if "receipt_size" in added:
+        # One last stat per existing receipt; views read the stored size from now on
+        sizes = [
+            (os.path.getsize(path), payment_id)
+            for payment_id, path in cursor.execute(
+                "SELECT id, receipt_path FROM payments WHERE receipt_path IS NOT NULL"
+            ).fetchall()
+            if os.path.isfile(path)
+        ]
+        cursor.executemany("UPDATE payments SET receipt_size = ? WHERE id = ?", sizes)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_pending ON payments (is_verified, payment_date)")
+    if "bank_tenant_id" in added:
+        # Bank refs were unique across tenants; they are only unique per tenant's bank account
+        cursor.execute("DROP INDEX IF EXISTS idx_payments_bank_ref")
+        cursor.execute("""
+            UPDATE payments SET bank_tenant_id = (SELECT tenant_id FROM invoices WHERE id = payments.invoice_id)
+            WHERE bank_ref IS NOT NULL
+        """)
+    # A statement line can only ever be reconciled once per tenant
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_bank_ref ON payments (bank_tenant_id, bank_ref)")
+
+    if not shard:
+        # Outstanding verification links issued before the token store keep working
+        # (hashed as services.token_store.hash_token, with its 7-day verify TTL)
+        conn.create_function("sha256_hex", 1, lambda token: hashlib.sha256(token.encode()).hexdigest())
+        cursor.execute("""
+            INSERT OR IGNORE INTO auth_tokens (token_hash, purpose, user_id, created_at, expires_at)
+            SELECT sha256_hex(verification_token), 'verify', id,
+                   CAST(strftime('%s', 'now') AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER) + 7 * 24 * 3600
+            FROM users
+            WHERE verification_token IS NOT NULL AND is_verified = 0
+        """)
+        cursor.execute("UPDATE users SET verification_token = NULL WHERE verification_token IS NOT NULL")
+
+    if shard:
+        # Tenant shards attach the global DB for these; a local copy would shadow it
+        from db.database import GLOBAL_TABLES
+        for table in GLOBAL_TABLES:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+    # Record invoices issued before the ledger existed, so re-runs skip them
+    cursor.execute("""
+        INSERT OR IGNORE INTO billing_ledger (tenant_id, user_id, period, invoice_id)
+        SELECT tenant_id, user_id, strftime('%Y-%m', period_start), MIN(id)
+        FROM invoices
+        GROUP BY user_id, strftime('%Y-%m', period_start)
     """)
     conn.commit()
 
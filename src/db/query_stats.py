@@ -0,0 +1,229 @@
+# src/db/query_stats.py
+#
+# Query instrumentation. get_db_connection hands out InstrumentedConnection,
+# whose cursors time every statement, count the rows it returns and remember
+# the first caller outside this module. Timings are aggregated per normalised
+# SQL text (literals replaced by ?, whitespace collapsed) in a process-wide
+# table for the superadmin "DB performance" page, and statements slower than
+# SLOW_QUERY_MS are appended to the slow-query log.
+
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import weakref
+from functools import lru_cache
+from sqlite3 import Connection, Cursor
+
+from config import settings
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+_THIS_FILE = os.path.abspath(__file__)
+
+
+@lru_cache(maxsize=2048)
+def normalise_sql(sql):
+    """SQL text with literals and IN (...) lists collapsed, so repeated statements group together."""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("IN (?...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def _call_site():
+    frame = sys._getframe(1)
+    while frame is not None and os.path.abspath(frame.f_code.co_filename) == _THIS_FILE:
+        frame = frame.f_back
+    if frame is None:
+        return "?"
+    return f"{os.path.relpath(frame.f_code.co_filename)}:{frame.f_lineno}"
+
+
+class QueryStats:
+    """Process-wide aggregate: normalised SQL -> calls, time, rows and call sites."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queries = {}
+        self._slow_log = None
+        self._local = threading.local()
+
+    def record(self, sql, seconds, rows, call_site):
+        key = normalise_sql(sql)
+        elapsed_ms = seconds * 1000
+        counter = getattr(self._local, "counter", None)
+        if counter is not None:
+            counter["queries"] += 1
+            counter["rows"] += rows
+            counter["ms"] += elapsed_ms
+        with self._lock:
+            entry = self._queries.get(key)
+            if entry is None:
+                entry = self._queries[key] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "call_sites": {}}
+            entry["calls"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["rows"] += rows
+            entry["call_sites"][call_site] = entry["call_sites"].get(call_site, 0) + 1
+
+        if elapsed_ms >= settings.SLOW_QUERY_MS:
+            self._slow_logger().warning(f"{elapsed_ms:.1f} ms | {rows} rows | {call_site} | {key}")
+
+    def snapshot(self):
+        """Aggregated stats, slowest total time first."""
+        with self._lock:
+            rows = [
+                {"sql": sql, "calls": e["calls"], "total_ms": round(e["total_ms"], 3),
+                 "avg_ms": round(e["total_ms"] / e["calls"], 3), "max_ms": round(e["max_ms"], 3),
+                 "rows": e["rows"], "call_sites": dict(e["call_sites"])}
+                for sql, e in self._queries.items()
+            ]
+        return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def start_counting(self):
+        """Count this thread's queries, rows and time from now on; returns the live counter dict."""
+        self._local.counter = {"queries": 0, "rows": 0, "ms": 0.0}
+        return self._local.counter
+
+    def stop_counting(self):
+        counter, self._local.counter = getattr(self._local, "counter", None), None
+        return counter
+
+    def reset(self):
+        with self._lock:
+            self._queries.clear()
+
+    def _slow_logger(self):
+        if self._slow_log is None:
+            slow_log = logging.getLogger("db.slow_queries")
+            if settings.SLOW_QUERY_LOG and not slow_log.handlers:
+                os.makedirs(os.path.dirname(settings.SLOW_QUERY_LOG) or ".", exist_ok=True)
+                handler = logging.FileHandler(settings.SLOW_QUERY_LOG)
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                slow_log.addHandler(handler)
+            self._slow_log = slow_log
+        return self._slow_log
+
+
+query_stats = QueryStats()
+
+
+class InstrumentedCursor(Cursor):
+    """
+    Cursor that records each statement once its rows have been consumed:
+    on exhaustion, on the next execute, or when the cursor or its connection
+    is closed. Time spent fetching counts towards the statement.
+    """
+
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._track(sql, started)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._track(sql, started)
+        return self
+
+    def executescript(self, sql_script):
+        self._finish()
+        started = time.perf_counter()
+        super().executescript(sql_script)
+        query_stats.record(sql_script, time.perf_counter() - started, 0, _call_site())
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._consumed(started, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._consumed(started, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._consumed(started, len(rows), True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._consumed(started, 0, True)
+            raise
+        self._consumed(started, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def _track(self, sql, started):
+        elapsed = time.perf_counter() - started
+        if self.description is None:
+            # Writes and DDL return no rows; record them right away
+            query_stats.record(sql, elapsed, max(self.rowcount, 0), _call_site())
+        else:
+            self._pending = [sql, elapsed, 0, _call_site()]
+
+    def _consumed(self, started, rows, exhausted):
+        if self._pending is not None:
+            self._pending[1] += time.perf_counter() - started
+            self._pending[2] += rows
+            if exhausted:
+                self._finish()
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            query_stats.record(*pending)
+
+
+class InstrumentedConnection(Connection):
+    """Connection whose cursors (including execute shortcuts) are InstrumentedCursor."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cursors = weakref.WeakSet()
+
+    def cursor(self, factory=InstrumentedCursor):
+        cursor = super().cursor(factory)
+        if isinstance(cursor, InstrumentedCursor):
+            self._cursors.add(cursor)
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def close(self):
+        for cursor in list(self._cursors):
+            cursor._finish()
+        super().close()
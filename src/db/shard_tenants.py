@@ -0,0 +1,94 @@
+# src/db/shard_tenants.py
+#
+# Split the shared database into one file per tenant. Each tenant-scoped table
+# is copied with its ids intact into DB_SHARD_DIR/tenant_<id>.db, row counts
+# are checked against the source, and the tenant's rows can then be pruned
+# from the shared file, which keeps tenants, users and auth.
+
+import logging
+import sqlite3
+
+from config import settings
+from db.database import ensure_tenant_db, list_tenant_ids, tenant_db_path
+
+logger = logging.getLogger(__name__)
+
+# Tenant-scoped tables and how to select one tenant's rows, parents before children
+TENANT_TABLE_FILTERS = (
+    ("plans", "tenant_id = :tenant_id"),
+    ("plan_metrics", "plan_id IN (SELECT id FROM src.plans WHERE tenant_id = :tenant_id)"),
+    ("plan_metric_limits", "plan_id IN (SELECT id FROM src.plans WHERE tenant_id = :tenant_id)"),
+    ("plan_metric_tiers", """plan_metric_limit_id IN (
+        SELECT pml.id FROM src.plan_metric_limits pml
+        JOIN src.plans p ON p.id = pml.plan_id
+        WHERE p.tenant_id = :tenant_id)"""),
+    ("usage_metrics", "tenant_id = :tenant_id"),
+    ("catalogue_versions", "tenant_id = :tenant_id"),
+    ("subscriptions", "tenant_id = :tenant_id"),
+    ("subscription_audit", "tenant_id = :tenant_id"),
+    ("subscription_versions", "tenant_id = :tenant_id"),
+    ("usage_records", "tenant_id = :tenant_id"),
+    ("usage_counters", "tenant_id = :tenant_id"),
+    ("usage_counter_checkpoints", "tenant_id = :tenant_id"),
+    ("usage_notifications", "tenant_id = :tenant_id"),
+    ("invoices", "tenant_id = :tenant_id"),
+    ("invoice_items", "invoice_id IN (SELECT id FROM src.invoices WHERE tenant_id = :tenant_id)"),
+    ("billing_ledger", "tenant_id = :tenant_id"),
+    ("payments", """invoice_id IN (SELECT id FROM src.invoices WHERE tenant_id = :tenant_id)
+        OR (invoice_id IS NULL AND user_id IN (SELECT id FROM src.users WHERE tenant_id = :tenant_id))"""),
+)
+
+
+def shard_tenant(tenant_id, prune=False):
+    """
+    Copy one tenant's rows from settings.DB_FILE into its shard. Returns
+    {table: rows copied}. Raises RuntimeError if a count does not match, in
+    which case nothing is pruned.
+    """
+    ensure_tenant_db(tenant_id)
+    conn = sqlite3.connect(tenant_db_path(tenant_id))
+    conn.execute("ATTACH DATABASE ? AS src", (settings.DB_FILE,))
+    params = {"tenant_id": tenant_id}
+    copied = {}
+    try:
+        for table, condition in TENANT_TABLE_FILTERS:
+            shard_columns = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+            source_columns = {row[1] for row in conn.execute(f"PRAGMA src.table_info({table})")}
+            if not source_columns:
+                continue
+            columns = ", ".join(c for c in shard_columns if c in source_columns)
+
+            conn.execute(
+                f"INSERT OR IGNORE INTO main.{table} ({columns}) SELECT {columns} FROM src.{table} WHERE {condition}",
+                params
+            )
+            expected = conn.execute(f"SELECT COUNT(*) FROM src.{table} WHERE {condition}", params).fetchone()[0]
+            # The shard holds only this tenant, so re-runs (even after a prune) keep passing
+            actual = conn.execute(f"SELECT COUNT(*) FROM main.{table}").fetchone()[0]
+            if actual < expected:
+                raise RuntimeError(f"{table}: copied {actual} of {expected} rows for tenant {tenant_id}")
+            copied[table] = actual
+        conn.commit()
+
+        if prune:
+            # Children first, while the parent rows they are selected through still exist
+            for table, condition in reversed(TENANT_TABLE_FILTERS):
+                if table in copied:
+                    conn.execute(f"DELETE FROM src.{table} WHERE {condition}", params)
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    logger.info(f"🗂️ Tenant {tenant_id} sharded: {sum(copied.values())} rows")
+    return copied
+
+
+def shard_all_tenants(tenant_ids=None, prune=False):
+    """Shard every tenant (or `tenant_ids`); returns {tenant_id: {table: rows}}."""
+    return {
+        tenant_id: shard_tenant(tenant_id, prune=prune)
+        for tenant_id in (tenant_ids or list_tenant_ids())
+    }
@@ -0,0 +1,258 @@
+# src/db/synthetic_data.py
+#
+# Seeded, production-shaped datasets for benchmarks. Every tenant gets plans
+# with several metrics (flat and graduated), an admin and M clients with
+# subscriptions, K usage events per client per day over a date range, and an
+# invoice (with items, ledger row and, mostly, a payment) for each month that
+# has closed. Rows are generated with NumPy and bulk-loaded with executemany
+# in large transactions, journaling off and the usage_records index built
+# after the load, so tens of millions of usage rows take minutes. The same
+# seed and parameters always produce the same database.
+
+import logging
+import sqlite3
+import time
+from datetime import date, timedelta
+
+import bcrypt
+import numpy as np
+
+from db.init_billing_schema import init_billing_schema
+
+logger = logging.getLogger(__name__)
+
+METRICS = (
+    ("API Calls", "calls", 5_000, 40),
+    ("SMS", "messages", 500, 6),
+    ("Call Minutes", "minutes", 1_000, 12),
+    ("Data (MB)", "MB", 20_000, 150),
+    ("Storage (GB)", "GB", 50, 1),
+    ("Seats", "users", 10, 1),
+)  # name, unit, included units on the entry plan, mean amount per event
+
+PLAN_TIERS = (
+    ("Starter", 299.0, 1),
+    ("Growth", 999.0, 4),
+    ("Scale", 2_999.0, 12),
+    ("Enterprise", 9_999.0, 40),
+)  # name, monthly fee, allowance multiplier
+
+INDUSTRIES = ("Telecom", "SaaS", "Fintech", "Logistics", "Media", "Retail")
+REGIONS = ("Africa", "Europe", "North America", "Asia", "South America")
+PAYMENT_METHODS = ("eft", "credit_card", "manual")
+
+
+def _next_id(cursor, table):
+    return (cursor.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 0) + 1
+
+
+def _months(start, end):
+    """(first day, last day) of every month that closes on or before `end`."""
+    first = start.replace(day=1)
+    while True:
+        last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        if last > end:
+            return
+        yield first, last
+        first = last + timedelta(days=1)
+
+
+def generate_dataset(db_path, tenants=5, users_per_tenant=100, plans_per_tenant=3, metrics_per_tenant=4,
+                     events_per_user_per_day=5, start_date=None, end_date=None, seed=42,
+                     batch_size=200_000, paid_ratio=0.8):
+    """
+    Append a synthetic dataset to db_path (schema created if missing) and
+    return {table: rows inserted}. Dates default to the 90 days up to today.
+    """
+    end_date = date.fromisoformat(str(end_date)) if end_date else date.today()
+    start_date = date.fromisoformat(str(start_date)) if start_date else end_date - timedelta(days=89)
+    plans_per_tenant = min(plans_per_tenant, len(PLAN_TIERS))
+    metrics_per_tenant = min(metrics_per_tenant, len(METRICS))
+    rng = np.random.default_rng(seed)
+    started = time.perf_counter()
+
+    init_billing_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -200000")
+    cursor = conn.cursor()
+    counts = dict.fromkeys((
+        "tenants", "users", "usage_metrics", "plans", "plan_metric_limits", "plan_metric_tiers",
+        "subscriptions", "subscription_audit", "usage_records", "invoices", "invoice_items",
+        "billing_ledger", "payments"), 0)
+
+    # One hash for every generated login ('testpass'); bcrypt per user would dominate the run
+    password = bcrypt.hashpw(b"testpass", bcrypt.gensalt(rounds=4)).decode()
+    days = [(start_date + timedelta(days=offset)).isoformat() for offset in range((end_date - start_date).days + 1)]
+    months = list(_months(start_date, end_date))
+
+    tenant_id = _next_id(cursor, "tenants")
+    user_id = _next_id(cursor, "users")
+    metric_id = _next_id(cursor, "usage_metrics")
+    plan_id = _next_id(cursor, "plans")
+    limit_id = _next_id(cursor, "plan_metric_limits")
+    invoice_id = _next_id(cursor, "invoices")
+
+    # Built once after the bulk load instead of maintained row by row
+    cursor.execute("DROP INDEX IF EXISTS idx_usage_records_tenant_date")
+
+    for _ in range(tenants):
+        cursor.execute("BEGIN")
+        cursor.execute("""
+            INSERT INTO tenants (id, name, company_name, email, region, industry, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (tenant_id, f"Tenant {tenant_id:05d}", f"Company {tenant_id:05d}", f"billing@tenant{tenant_id}.example",
+              REGIONS[tenant_id % len(REGIONS)], INDUSTRIES[tenant_id % len(INDUSTRIES)], start_date.isoformat()))
+
+        # Catalogue: metrics, plans, limits (the top plan is graduated)
+        metric_rows = METRICS[:metrics_per_tenant]
+        metric_ids = list(range(metric_id, metric_id + len(metric_rows)))
+        cursor.executemany("""
+            INSERT INTO usage_metrics (id, tenant_id, name, metric_name, unit) VALUES (?, ?, ?, ?, ?)
+        """, [(mid, tenant_id, name, name, unit) for mid, (name, unit, _, _) in zip(metric_ids, metric_rows)])
+        metric_id += len(metric_rows)
+
+        plan_ids = list(range(plan_id, plan_id + plans_per_tenant))
+        cursor.executemany("""
+            INSERT INTO plans (id, tenant_id, name, description, monthly_fee, included_units, overage_rate)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(pid, tenant_id, name, f"{name} plan", fee, 1_000 * multiplier, 0.5)
+              for pid, (name, fee, multiplier) in zip(plan_ids, PLAN_TIERS)])
+        plan_id += plans_per_tenant
+
+        limits, tiers = [], []
+        for pid, (_, _, multiplier) in zip(plan_ids, PLAN_TIERS):
+            graduated = pid == plan_ids[-1] and plans_per_tenant > 1
+            for mid, (_, _, included, _) in zip(metric_ids, metric_rows):
+                allowance = included * multiplier
+                rate = round(float(rng.uniform(0.01, 2.0)), 3)
+                limits.append((limit_id, pid, mid, allowance, allowance, rate,
+                               "graduated" if graduated else "flat", None))
+                if graduated:
+                    tiers.extend([(limit_id, allowance, rate), (limit_id, None, round(rate / 2, 3))])
+                limit_id += 1
+        cursor.executemany("""
+            INSERT INTO plan_metric_limits
+                (id, plan_id, metric_id, metric_limit, included_units, overage_rate, pricing_model, max_charge)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, limits)
+        cursor.executemany(
+            "INSERT INTO plan_metric_tiers (plan_metric_limit_id, up_to, unit_price) VALUES (?, ?, ?)", tiers
+        )
+
+        # Users: one admin, then the clients
+        users = [(user_id, tenant_id, "Admin", f"T{tenant_id}", f"Company {tenant_id:05d}", f"admin_t{tenant_id}",
+                  password, f"admin@tenant{tenant_id}.example", "admin", start_date.isoformat(), 1)]
+        client_ids = np.arange(user_id + 1, user_id + 1 + users_per_tenant)
+        users.extend(
+            (uid, tenant_id, "Client", str(uid), f"Client Co {uid}", f"client_{uid}", password,
+             f"client{uid}@tenant{tenant_id}.example", "client", start_date.isoformat(), 1)
+            for uid in client_ids.tolist()
+        )
+        cursor.executemany("""
+            INSERT INTO users (id, tenant_id, first_name, last_name, company_name, username, password, email,
+                               role, registration_date, is_verified)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, users)
+        user_id += users_per_tenant + 1
+
+        # Subscriptions, weighted towards the cheaper plans
+        weights = np.array([2.0 ** -i for i in range(plans_per_tenant)])
+        user_plans = rng.choice(plan_ids, size=len(client_ids), p=weights / weights.sum())
+        subscriptions = list(zip(client_ids.tolist(), user_plans.tolist()))
+        cursor.executemany("""
+            INSERT INTO subscriptions (user_id, plan_id, tenant_id, start_date, is_active)
+            VALUES (?, ?, ?, ?, 1)
+        """, [(uid, pid, tenant_id, start_date.isoformat()) for uid, pid in subscriptions])
+        cursor.executemany("""
+            INSERT INTO subscription_audit (user_id, tenant_id, action, old_plan_id, new_plan_id, timestamp)
+            VALUES (?, ?, 'subscribed', NULL, ?, ?)
+        """, [(uid, tenant_id, pid, f"{start_date.isoformat()}T00:00:00") for uid, pid in subscriptions])
+
+        # Usage: K events per client per day
+        metric_names = np.array([name for name, _, _, _ in metric_rows], dtype=object)
+        mean_amounts = np.array([mean for _, _, _, mean in metric_rows], dtype=float)
+        events_per_day = len(client_ids) * events_per_user_per_day
+        event_users = np.repeat(client_ids, events_per_user_per_day).tolist()
+        batch = []
+        for day in days:
+            if not events_per_day:
+                break
+            metric_index = rng.integers(0, len(metric_rows), size=events_per_day)
+            amounts = rng.poisson(mean_amounts[metric_index]) + 1
+            batch.extend(zip(
+                [tenant_id] * events_per_day, event_users, (metric_index + metric_ids[0]).tolist(),
+                amounts.tolist(), metric_names[metric_index].tolist(), [day] * events_per_day
+            ))
+            if len(batch) >= batch_size:
+                counts["usage_records"] += _insert_usage(cursor, batch)
+                batch = []
+        counts["usage_records"] += _insert_usage(cursor, batch)
+
+        # Closed months: invoice per subscriber, base + overage line, most of them paid
+        fees = {pid: fee for pid, (_, fee, _) in zip(plan_ids, PLAN_TIERS)}
+        invoices, items, ledger, payments = [], [], [], []
+        for first, last in months:
+            overage = np.round(rng.gamma(1.5, 60.0, size=len(subscriptions)), 2).tolist()
+            paid = (rng.random(len(subscriptions)) < paid_ratio).tolist()
+            due = (last + timedelta(days=30)).isoformat()
+            for (uid, pid), extra, is_paid in zip(subscriptions, overage, paid):
+                total = round(fees[pid] + extra, 2)
+                invoices.append((invoice_id, tenant_id, uid, first.isoformat(), last.isoformat(),
+                                 last.isoformat(), total, int(is_paid), total if is_paid else 0.0, due))
+                items.append((invoice_id, f"Base Plan: {PLAN_TIERS[plan_ids.index(pid)][0]}", 1, fees[pid], fees[pid]))
+                if extra:
+                    items.append((invoice_id, "Overage", 1, extra, extra))
+                ledger.append((tenant_id, uid, first.isoformat()[:7], invoice_id))
+                if is_paid:
+                    payments.append((uid, invoice_id, total, (last + timedelta(days=7)).isoformat(),
+                                     PAYMENT_METHODS[invoice_id % len(PAYMENT_METHODS)], 1))
+                invoice_id += 1
+        cursor.executemany("""
+            INSERT INTO invoices (id, tenant_id, user_id, period_start, period_end, invoice_date, total_amount,
+                                  is_paid, amount_paid, due_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, invoices)
+        cursor.executemany("""
+            INSERT INTO invoice_items (invoice_id, description, quantity, unit_price, total_price)
+            VALUES (?, ?, ?, ?, ?)
+        """, items)
+        cursor.executemany(
+            "INSERT INTO billing_ledger (tenant_id, user_id, period, invoice_id) VALUES (?, ?, ?, ?)", ledger
+        )
+        cursor.executemany("""
+            INSERT INTO payments (user_id, invoice_id, amount, payment_date, payment_method, is_verified)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, payments)
+        conn.commit()
+
+        counts["tenants"] += 1
+        counts["users"] += len(users)
+        counts["usage_metrics"] += len(metric_rows)
+        counts["plans"] += plans_per_tenant
+        counts["plan_metric_limits"] += len(limits)
+        counts["plan_metric_tiers"] += len(tiers)
+        counts["subscriptions"] += len(subscriptions)
+        counts["subscription_audit"] += len(subscriptions)
+        counts["invoices"] += len(invoices)
+        counts["invoice_items"] += len(items)
+        counts["billing_ledger"] += len(ledger)
+        counts["payments"] += len(payments)
+        logger.info(f"🏭 Tenant {tenant_id} generated ({counts['usage_records']:,} usage rows so far)")
+        tenant_id += 1
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_usage_records_tenant_date ON usage_records (tenant_id, usage_date)")
+    cursor.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    logger.info(f"✅ Dataset generated in {time.perf_counter() - started:.1f}s: {counts}")
+    return counts
+
+
+def _insert_usage(cursor, rows):
+    cursor.executemany("""
+        INSERT INTO usage_records (tenant_id, user_id, metric_id, usage_amount, metric_name, usage_date)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, rows)
+    return len(rows)
@@ -2,12 +2,16 @@
 
 import streamlit as st
 from utils.session import init_session_state
+from utils.session_guard import current_principal
+from services.session_store import get_session_store
 
 # --- Auth views
 from views.auth.auth_view import auth_view
 from views.auth.reset_password import reset_password
 from views.auth.reset_password_request import reset_password_request
 from auth_manager import verify_token 
+from services.usage_alerts import install_usage_alerts
+from utils.render_profiler import profile_render
 
 # --- SuperAdmin views
 from views.superadmin.superadmin_dashboard import superadmin_dashboard
@@ -15,6 +19,8 @@ from views.superadmin.tenant_manager import tenant_manager
 from views.superadmin.admin_analytics_dashboard import render_admin_analytics_dashboard
 from views.superadmin.resend_log_view import resend_log_view
 from views.superadmin.monthly_report_scheduler import run_monthly_report
+from views.superadmin.db_performance_view import db_performance_view
+from views.superadmin.render_profile_view import render_profile_view
 
 # --- Admin views
 from views.admin.admin_dashboard import admin_dashboard
@@ -28,6 +34,7 @@ from views.admin.usage_metric_admin import usage_metric_admin
 from views.admin.plan_metric_limits_admin import plan_metric_limits_admin
 from views.admin.admin_payment_verification import admin_payment_verification
 from views.admin.admin_billing_report import admin_tenant_billing_report
+from views.admin.bank_reconciliation import bank_reconciliation
 
 # --- Client views
 from views.client.client_dashboard import client_dashboard
@@ -43,7 +50,9 @@ SUPERADMIN_MENU = {
     "📊 Platform Overview": superadmin_dashboard,
     "📈 Analytics Dashboard": render_admin_analytics_dashboard,
     "🏢 Manage Tenants": tenant_manager,
-    "📜 Resend Log Viewer": resend_log_view
+    "📜 Resend Log Viewer": resend_log_view,
+    "🐢 DB Performance": db_performance_view,
+    "⏱️ Page Performance": render_profile_view
 }
 
 ADMIN_MENU = {
@@ -57,6 +66,7 @@ ADMIN_MENU = {
     "📊 Usage Metrics": usage_metric_admin,
     "📊 Plan Metric Limits": plan_metric_limits_admin,
     "🧾 Payment Verification": admin_payment_verification,
+    "🏦 Bank Reconciliation": bank_reconciliation,
     "💳 Payment Admin": payment_admin
 }
 
@@ -69,9 +79,16 @@ CLIENT_MENU = {
 }
 
 
+def render_page(role, page, view):
+    """Render a menu page through the profiling hook; a pending capture request applies to this render."""
+    capture = st.session_state.pop("capture_next_render", False)
+    profile_render(f"{role}/{page}", view, capture=capture)
+
+
 def main():
     st.set_page_config(page_title="SaaS Billing Platform", layout="wide")
     init_session_state()
+    install_usage_alerts()
 
     query_params = st.query_params
 
@@ -94,17 +111,19 @@ def main():
         reset_password_request()
         return
 
-    # --- Not logged in
-    if not st.session_state.get("authenticated"):
+    # --- Not logged in (or the server-side session has expired / been ended)
+    principal = current_principal()
+    if principal is None:
+        st.session_state.authenticated = False
         auth_view()
         return
 
     # --- Role-based routing
-    role = st.session_state.get("role")
+    role = principal["role"]
     if role == "superadmin":
         st.sidebar.subheader("🛠️ SuperAdmin Panel")
         menu = st.sidebar.radio("Navigate", list(SUPERADMIN_MENU.keys()))
-        SUPERADMIN_MENU[menu]()
+        render_page(role, menu, SUPERADMIN_MENU[menu])
         if st.sidebar.button("📜 Run monthly billing"):
             run_monthly_report()
             st.success("Monthly billing reports generated and emailed to admins.")
@@ -113,17 +132,18 @@ def main():
     elif role == "admin":
         st.sidebar.subheader("🧑‍💼 Admin Panel")
         menu = st.sidebar.radio("Navigate", list(ADMIN_MENU.keys()))
-        ADMIN_MENU[menu]()
+        render_page(role, menu, ADMIN_MENU[menu])
 
     elif role == "client":
         st.sidebar.subheader("🙋 Client Panel")
         menu = st.sidebar.radio("Navigate", list(CLIENT_MENU.keys()))
-        CLIENT_MENU[menu]()
+        render_page(role, menu, CLIENT_MENU[menu])
 
     else:
         st.error("🚫 Unauthorized role.")
 
     if st.sidebar.button("🔓 Logout"):
+        get_session_store().end(principal["session_id"])
         st.session_state.clear()
         st.rerun()
 
@@ -1,45 +1,204 @@
 # payment_logic.py
 #
-# This module provides logic for recording payments against invoices.
-# It inserts payment records into the database and updates the invoice status to "paid"
-# if the total payments meet or exceed the invoice amount.
+# This module provides logic for recording, verifying and rejecting payments against invoices.
+# Invoices carry a running amount_paid (and the derived balance_due); each payment
+# that counts is added to it in the same transaction that records or verifies the
+# payment, and the invoice is marked paid once nothing is left to pay.
 
-from datetime import datetime
 from db.database import get_db_connection
+from services.mail_outbox import get_mail_outbox
 
-def record_payment(invoice_id, amount, method='manual', notes=None):
+# Rounding slack when comparing money stored as REAL
+SETTLED_TOLERANCE = 0.005
+# Restricts payment updates to the acting tenant's invoices
+_TENANT_FILTER = "AND invoice_id IN (SELECT id FROM invoices WHERE tenant_id = ?)"
+
+
+def apply_payment(cursor, invoice_id, amount):
+    """
+    Add amount to the invoice's running total inside the caller's transaction.
+    Returns (balance_due, is_paid), or None if the invoice doesn't exist.
+    """
+    cursor.execute("""
+        UPDATE invoices
+        SET amount_paid = ROUND(amount_paid + ?, 2),
+            is_paid = CASE WHEN amount_paid + ? >= total_amount - ? THEN 1 ELSE is_paid END,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+        RETURNING balance_due, is_paid
+    """, (amount, amount, SETTLED_TOLERANCE, invoice_id))
+    return cursor.fetchone()
+
+
+def record_payment(invoice_id, amount, method='manual', notes=None, tenant_id=None):
+    """
+    Records a payment taken by an admin (counted as verified) for a given invoice.
+    If the invoice is fully paid after this payment, marks the invoice as paid.
+    With tenant_id, an invoice of another tenant is not found.
     """
-    Records a payment for a given invoice. If the invoice is fully paid after this payment,
-    marks the invoice as paid.
+    query = """
+        INSERT INTO payments (user_id, invoice_id, amount, payment_date, payment_method, notes, is_verified)
+        SELECT user_id, id, ?, DATE('now'), ?, ?, 1 FROM invoices WHERE id = ?
     """
-    conn = get_db_connection()
+    params = [amount, method, notes, invoice_id]
+    if tenant_id is not None:
+        query += " AND tenant_id = ?"
+        params.append(tenant_id)
+    conn = get_db_connection(tenant_id)
     cursor = conn.cursor()
+    try:
+        cursor.execute(query, params)
+        if cursor.rowcount and apply_payment(cursor, invoice_id, amount) is not None:
+            conn.commit()
+            return True
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
 
-    # Insert payment record into the payments table
-    cursor.execute("""
-        INSERT INTO payments (invoice_id, amount, payment_method, notes)
-        VALUES (?, ?, ?, ?)
-    """, (invoice_id, amount, method, notes))
-
-    # Retrieve the total amount due for the invoice
-    cursor.execute("SELECT total_amount FROM invoices WHERE id = ?", (invoice_id,))
-    total = cursor.fetchone()
-    if total:
-        total_amount = total[0]
-
-        # Calculate the total amount paid so far for this invoice
-        cursor.execute("""
-            SELECT SUM(amount) FROM payments WHERE invoice_id = ?
-        """, (invoice_id,))
-        total_paid = cursor.fetchone()[0] or 0.0
-
-        # If the invoice is fully paid or overpaid, mark it as paid
-        if total_paid >= total_amount:
-            cursor.execute("""
-                UPDATE invoices SET is_paid = 1 WHERE id = ?
-            """, (invoice_id,))
-
-    # Commit changes and close the connection
-    conn.commit()
+
+def verify_payments(payment_ids, tenant_id=None):
+    """
+    Verify submitted payments and count each towards its invoice, all in one transaction.
+    With tenant_id, payments on other tenants' invoices are ignored. Returns [(payment_id, invoice_id, user_id, amount, balance_due, is_paid)] for the payments
+    that were still pending; the rest (already verified or rejected) are left alone, so a
+    double click can't count a payment twice.
+    """
+    conn = get_db_connection(tenant_id)
+    cursor = conn.cursor()
+    verified = []
+    try:
+        for payment_id in payment_ids:
+            cursor.execute(f"""
+                UPDATE payments SET is_verified = 1
+                WHERE id = ? AND is_verified = 0 {_TENANT_FILTER if tenant_id is not None else ""}
+                RETURNING invoice_id, user_id, amount
+            """, (payment_id,) + ((tenant_id,) if tenant_id is not None else ()))
+            row = cursor.fetchone()
+            if row is None:
+                continue
+            invoice_id, user_id, amount = row
+            balance_due, is_paid = apply_payment(cursor, invoice_id, amount or 0) or (None, 0)
+            verified.append((payment_id, invoice_id, user_id, amount or 0, balance_due, is_paid))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return verified
+
+
+def verify_payment(payment_id, tenant_id=None):
+    """
+    Mark a submitted payment as verified and count it towards its invoice.
+    Returns (invoice_id, balance_due, is_paid), or None if it wasn't pending.
+    """
+    verified = verify_payments([payment_id], tenant_id)
+    return verified[0][1:2] + verified[0][4:] if verified else None
+
+
+def reject_payments(payment_ids, reason, tenant_id=None):
+    """
+    Reject pending payments in one transaction (is_verified = -1, with the reason);
+    with tenant_id, only payments on that tenant's invoices.
+    Returns [(payment_id, invoice_id, user_id, amount)] for those that were still pending.
+    """
+    conn = get_db_connection(tenant_id)
+    try:
+        rejected = []
+        for payment_id in payment_ids:
+            row = conn.execute(f"""
+                UPDATE payments SET is_verified = -1, rejection_reason = ?
+                WHERE id = ? AND is_verified = 0 {_TENANT_FILTER if tenant_id is not None else ""}
+                RETURNING invoice_id, user_id, amount
+            """, (reason, payment_id) + ((tenant_id,) if tenant_id is not None else ())).fetchone()
+            if row is not None:
+                rejected.append((payment_id, *row))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return rejected
+
+
+def user_contacts(tenant_id, user_ids):
+    """{user_id: (email, username)} for the given users, in chunked IN queries."""
+    user_ids = sorted(set(user_ids))
+    contacts = {}
+    conn = get_db_connection(tenant_id)
+    for start in range(0, len(user_ids), 500):
+        chunk = user_ids[start:start + 500]
+        contacts.update({
+            user_id: (email, username) for user_id, email, username in conn.execute(
+                f"SELECT id, email, username FROM users WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            )
+        })
     conn.close()
-    return True
\ No newline at end of file
+    return contacts
+
+
+def queue_payment_notices(tenant_id, verified=(), rejected=(), reason=""):
+    """Queue confirmation / rejection emails for the results of verify_payments / reject_payments."""
+    contacts = user_contacts(tenant_id, [row[2] for row in verified] + [row[2] for row in rejected])
+    messages = []
+    for _, invoice_id, user_id, amount, balance_due, is_paid in verified:
+        if user_id not in contacts:
+            continue
+        email, username = contacts[user_id]
+        status = "the invoice is now paid in full" if is_paid else f"R{balance_due:.2f} remains due on this invoice"
+        messages.append((
+            email,
+            f"💰 Payment Verified for Invoice #{invoice_id}",
+            f"Hello {username},\n\n✅ Your payment of R{amount:.2f} for Invoice #{invoice_id} has been verified; "
+            f"{status}.\n\nThank you for your payment!\n\nRegards,\nBilling Team",
+        ))
+    for _, invoice_id, user_id, amount in rejected:
+        if user_id not in contacts:
+            continue
+        email, username = contacts[user_id]
+        messages.append((
+            email,
+            f"⚠️ Payment Not Accepted for Invoice #{invoice_id}",
+            f"Hello {username},\n\nYour payment of R{amount or 0:.2f} for Invoice #{invoice_id} could not be verified"
+            + (f": {reason}" if reason else ".")
+            + "\n\nPlease check the details and submit it again.\n\nRegards,\nBilling Team",
+        ))
+    get_mail_outbox().send_many(messages)
+    return len(messages)
+
+
+def pending_payments(tenant_id, search="", limit=50, offset=0):
+    """
+    One page of the tenant's payments awaiting verification, newest first, and the total count:
+    ([(payment_id, username, invoice_id, invoice_date, amount, balance_due, method, payment_date,
+       receipt_size, receipt_path, receipt_mime)], total).
+    """
+    where = "p.is_verified = 0 AND i.tenant_id = ?"
+    params = [tenant_id]
+    if search:
+        where += " AND (u.username LIKE ? OR CAST(p.invoice_id AS TEXT) = ?)"
+        params += [f"%{search}%", search.lstrip("#")]
+    conn = get_db_connection(tenant_id)
+    try:
+        total = conn.execute(f"""
+            SELECT COUNT(*) FROM payments p
+            JOIN invoices i ON i.id = p.invoice_id
+            JOIN users u ON u.id = p.user_id
+            WHERE {where}
+        """, params).fetchone()[0]
+        rows = conn.execute(f"""
+            SELECT p.id, u.username, p.invoice_id, i.invoice_date, p.amount, i.balance_due,
+                   p.payment_method, p.payment_date, p.receipt_size, p.receipt_path, p.receipt_mime
+            FROM payments p
+            JOIN invoices i ON i.id = p.invoice_id
+            JOIN users u ON u.id = p.user_id
+            WHERE {where}
+            ORDER BY p.payment_date DESC, p.id DESC
+            LIMIT ? OFFSET ?
+        """, params + [limit, offset]).fetchall()
+    finally:
+        conn.close()
+    return rows, total
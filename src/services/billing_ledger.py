@@ -0,0 +1,87 @@
+# src/services/billing_ledger.py
+#
+# One billing_ledger row per (user, billing period) makes invoice generation
+# idempotent. A run opens a write transaction, finds the subscribers that still
+# need an invoice with a single anti-join, and writes invoices, items and ledger
+# rows together. Concurrent runs serialise on the write lock, and the unique
+# (user_id, period) key rejects anything that slips past, so re-runs and retries
+# never bill a period twice.
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def billing_period(date_str):
+    """'YYYY-MM' ledger key for a 'YYYY-MM-DD' (or 'YYYY-MM') date."""
+    return str(date_str)[:7]
+
+
+def begin_billing_run(conn):
+    """Take SQLite's write lock up front so the anti-join and the inserts see the same ledger."""
+    conn.execute("BEGIN IMMEDIATE")
+
+
+def unbilled_user_ids(cursor, tenant_id, period):
+    """
+    Subscribers of the tenant without a ledger row for the period: everyone
+    with an active subscription, plus anyone who cancelled during the period
+    and still owes a prorated fee.
+    """
+    cursor.execute("""
+        SELECT billable.user_id
+        FROM (
+            SELECT s.user_id
+            FROM subscriptions s
+            JOIN plans p ON p.id = s.plan_id
+            WHERE p.tenant_id = ? AND s.is_active = 1
+            UNION
+            SELECT user_id
+            FROM subscription_audit
+            WHERE tenant_id = ? AND action = 'cancelled' AND substr(timestamp, 1, 7) = ?
+        ) billable
+        LEFT JOIN billing_ledger l ON l.user_id = billable.user_id AND l.period = ?
+        WHERE l.id IS NULL
+    """, (tenant_id, tenant_id, period, period))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def ledger_invoice_id(cursor, user_id, period):
+    """Invoice already recorded for the user and period, or None."""
+    cursor.execute(
+        "SELECT invoice_id FROM billing_ledger WHERE user_id = ? AND period = ?",
+        (user_id, period)
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def insert_invoices(cursor, tenant_id, period_start, period_end, priced, invoice_date=None):
+    """
+    Write an invoice, its items and its ledger row for each {user_id: (items, total)}.
+    Returns {user_id: invoice_id}. Raises sqlite3.IntegrityError if a user was
+    already billed for the period; the caller rolls back.
+    """
+    period = billing_period(period_start)
+    invoice_ids = {}
+    for user_id, (items, total_amount) in priced.items():
+        cursor.execute("""
+            INSERT INTO invoices (tenant_id, user_id, period_start, period_end, invoice_date, total_amount, is_paid)
+            VALUES (?, ?, ?, ?, COALESCE(?, DATE('now')), ?, 0)
+        """, (tenant_id, user_id, period_start, period_end, invoice_date, total_amount))
+        invoice_id = cursor.lastrowid
+
+        cursor.executemany("""
+            INSERT INTO invoice_items (invoice_id, description, quantity, unit_price, total_price)
+            VALUES (?, ?, ?, ?, ?)
+        """, [
+            (invoice_id, item["description"], item["quantity"], item["unit_price"], item["total_price"])
+            for item in items
+        ])
+        invoice_ids[user_id] = invoice_id
+
+    cursor.executemany("""
+        INSERT INTO billing_ledger (tenant_id, user_id, period, invoice_id)
+        VALUES (?, ?, ?, ?)
+    """, [(tenant_id, user_id, period, invoice_id) for user_id, invoice_id in invoice_ids.items()])
+    return invoice_ids
@@ -0,0 +1,166 @@
+# src/services/billing_simulation.py
+#
+# Dry-run of a billing period. Tenants are rated with the same set-based path
+# as generate_invoices (load_pricing_inputs -> price_inputs -> insert_invoices),
+# but invoices are written to an in-memory database that mirrors the live
+# invoice tables. Last month's issued totals are copied in per subscriber from
+# each tenant's (read-only) connection, so the report — totals per tenant and
+# per plan with deltas against last month — is two aggregate queries and
+# nothing is ever written to the live databases.
+
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from db.database import get_db_connection, query_all_tenants
+from services.billing_ledger import insert_invoices, unbilled_user_ids
+from services.pricing_kernel import (
+    BASE_FEE_DESCRIPTION, OVERAGE_DESCRIPTION, load_pricing_inputs, price_inputs
+)
+from services.usage_meter import current_period
+
+SIMULATED_TABLES = ("invoices", "invoice_items", "billing_ledger")
+
+
+def open_simulation_db(live_conn):
+    """In-memory database with the live invoice tables' schema plus the simulation's working tables."""
+    sim = sqlite3.connect(":memory:", uri=True)
+    placeholders = ",".join("?" for _ in SIMULATED_TABLES)
+    for (sql,) in live_conn.execute(
+        f"SELECT sql FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders})", SIMULATED_TABLES
+    ).fetchall():
+        sim.execute(sql)
+    sim.execute("""
+        CREATE TABLE sim_subscribers (
+            tenant_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            plan_id INTEGER NOT NULL,
+            plan_name TEXT,
+            already_billed INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    sim.execute("""
+        CREATE TABLE sim_last_month (
+            tenant_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            total REAL NOT NULL
+        )
+    """)
+    sim.execute("CREATE TABLE sim_tenants (id INTEGER PRIMARY KEY, name TEXT)")
+    return sim
+
+
+def simulate_billing_run(billing_period, tenant_ids=None):
+    """
+    Rate `billing_period` ('YYYY-MM') for every tenant with active subscriptions,
+    or only `tenant_ids`, without writing to the live database.
+
+    Returns {"period", "elapsed", "tenants": [...], "plans": [...]}; each row
+    carries invoices, total, last_month and delta. Subscribers already in the
+    billing ledger are rated too and counted in `already_billed`.
+    """
+    started = time.perf_counter()
+    _, start_date, end_date = current_period(datetime.strptime(billing_period + "-01", "%Y-%m-%d"))
+    previous = datetime.strptime(start_date, "%Y-%m-%d") - timedelta(days=1)
+    _, prev_start, prev_end = current_period(previous)
+
+    if tenant_ids is None:
+        tenant_ids = sorted({row[0] for row in query_all_tenants(
+            "SELECT DISTINCT tenant_id FROM subscriptions WHERE is_active = 1"
+        )})
+
+    conn = get_db_connection()
+    sim = open_simulation_db(conn)
+    sim_cursor = sim.cursor()
+    sim_cursor.executemany("INSERT INTO sim_tenants (id, name) VALUES (?, ?)",
+                           conn.execute("SELECT id, name FROM tenants").fetchall())
+    conn.close()
+
+    for tenant_id in tenant_ids:
+        conn = get_db_connection(tenant_id)
+        cursor = conn.cursor()
+        inputs = load_pricing_inputs(cursor, tenant_id, start_date, end_date)
+        if not inputs["subscribers"]:
+            conn.close()
+            continue
+        pending = unbilled_user_ids(cursor, tenant_id, billing_period)
+        cursor.execute("""
+            SELECT tenant_id, user_id, SUM(total_amount)
+            FROM invoices
+            WHERE tenant_id = ? AND period_start BETWEEN ? AND ?
+            GROUP BY user_id
+        """, (tenant_id, prev_start, prev_end))
+        sim_cursor.executemany(
+            "INSERT INTO sim_last_month (tenant_id, user_id, total) VALUES (?, ?, ?)", cursor.fetchall()
+        )
+        conn.close()
+
+        priced = price_inputs(inputs, BASE_FEE_DESCRIPTION, OVERAGE_DESCRIPTION)
+        insert_invoices(sim_cursor, tenant_id, start_date, end_date, priced)
+        sim_cursor.executemany("""
+            INSERT INTO sim_subscribers (tenant_id, user_id, plan_id, plan_name, already_billed)
+            VALUES (?, ?, ?, ?, ?)
+        """, [
+            (tenant_id, user_id, plan_id, plan_name, int(user_id not in pending))
+            for user_id, plan_id, plan_name, _ in inputs["subscribers"]
+        ])
+
+    sim_cursor.execute("""
+        WITH simulated AS (
+            SELECT s.tenant_id, COUNT(i.id) AS invoices, SUM(s.already_billed) AS already_billed,
+                   COALESCE(SUM(i.total_amount), 0) AS total
+            FROM sim_subscribers s
+            LEFT JOIN invoices i ON i.user_id = s.user_id
+            GROUP BY s.tenant_id
+        ), last_month AS (
+            SELECT tenant_id, SUM(total) AS total
+            FROM sim_last_month
+            GROUP BY tenant_id
+        )
+        SELECT sm.tenant_id, t.name, sm.invoices, sm.already_billed, sm.total,
+               COALESCE(lm.total, 0), sm.total - COALESCE(lm.total, 0)
+        FROM simulated sm
+        LEFT JOIN last_month lm ON lm.tenant_id = sm.tenant_id
+        LEFT JOIN sim_tenants t ON t.id = sm.tenant_id
+        ORDER BY sm.tenant_id
+    """)
+    tenants = [
+        {"tenant_id": tenant_id, "tenant_name": name, "invoices": invoices, "already_billed": already_billed,
+         "total": total, "last_month": last_month, "delta": delta}
+        for tenant_id, name, invoices, already_billed, total, last_month, delta in sim_cursor.fetchall()
+    ]
+
+    # Last month is attributed to the plan each subscriber is on now
+    sim_cursor.execute("""
+        WITH simulated AS (
+            SELECT s.tenant_id, s.plan_id, s.plan_name, COUNT(i.id) AS invoices,
+                   COALESCE(SUM(i.total_amount), 0) AS total
+            FROM sim_subscribers s
+            LEFT JOIN invoices i ON i.user_id = s.user_id
+            GROUP BY s.tenant_id, s.plan_id
+        ), last_month AS (
+            SELECT s.tenant_id, s.plan_id, SUM(lm.total) AS total
+            FROM sim_subscribers s
+            JOIN sim_last_month lm ON lm.tenant_id = s.tenant_id AND lm.user_id = s.user_id
+            GROUP BY s.tenant_id, s.plan_id
+        )
+        SELECT sm.tenant_id, sm.plan_id, sm.plan_name, sm.invoices, sm.total,
+               COALESCE(lm.total, 0), sm.total - COALESCE(lm.total, 0)
+        FROM simulated sm
+        -- Plan ids are only unique within a tenant once tenants are sharded
+        LEFT JOIN last_month lm ON lm.tenant_id = sm.tenant_id AND lm.plan_id = sm.plan_id
+        ORDER BY sm.tenant_id, sm.plan_id
+    """)
+    plans = [
+        {"tenant_id": tenant_id, "plan_id": plan_id, "plan_name": plan_name, "invoices": invoices,
+         "total": total, "last_month": last_month, "delta": delta}
+        for tenant_id, plan_id, plan_name, invoices, total, last_month, delta in sim_cursor.fetchall()
+    ]
+    sim.close()
+
+    return {
+        "period": billing_period,
+        "elapsed": time.perf_counter() - started,
+        "tenants": tenants,
+        "plans": plans,
+    }
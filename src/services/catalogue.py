@@ -0,0 +1,153 @@
+# src/services/catalogue.py
+#
+# In-process plan/pricing catalogue. Plans, usage metrics, plan metric limits
+# and tier schedules change rarely, so each tenant's rows are loaded once into
+# a frozen TenantCatalogue (tuples and read-only mappings) and shared by every
+# pricing path, the usage meter and the plan views.
+#
+# catalogue_versions holds a counter per tenant that the plan admin views bump
+# after each change. A lookup reads that one row and reloads the tenant only
+# when the counter has moved, so edits made by any process are picked up on
+# the next lookup.
+
+import logging
+import threading
+from types import MappingProxyType
+
+from services.pricing_kernel import load_tier_schedules
+
+logger = logging.getLogger(__name__)
+
+
+class TenantCatalogue:
+    """
+    Read-only snapshot of one tenant's catalogue at a given version.
+
+    plans:   {plan_id: (name, description, monthly_fee, included_units, overage_rate, is_active)}
+    metrics: {metric_id: (name, unit)}
+    limits:  {plan_id: ((limit_id, metric_id, metric_name, metric_limit, included_units,
+                         overage_rate, pricing_model, max_charge, schedule), ...)}
+    """
+
+    __slots__ = ("tenant_id", "version", "plans", "metrics", "limits", "_pricing_limits")
+
+    def __init__(self, tenant_id, version, plans, metrics, limits):
+        self.tenant_id = tenant_id
+        self.version = version
+        self.plans = MappingProxyType(plans)
+        self.metrics = MappingProxyType(metrics)
+        self.limits = MappingProxyType(limits)
+        # Limit tuples in the kernel's shape, precomputed for both allowance columns
+        self._pricing_limits = {
+            column: MappingProxyType({
+                plan_id: tuple(_pricing_limit(limit, column) for limit in plan_limits)
+                for plan_id, plan_limits in limits.items()
+            })
+            for column in ("metric_limit", "included_units")
+        }
+
+    def pricing_limits(self, allowance_column="metric_limit"):
+        """{plan_id: limit tuples} in the shape build_pricing_inputs expects."""
+        return self._pricing_limits[allowance_column]
+
+    def limits_for(self, plan_id):
+        return self.limits.get(plan_id, ())
+
+
+def _pricing_limit(limit, allowance_column):
+    (_, metric_id, metric_name, metric_limit, included_units,
+     overage_rate, _, max_charge, schedule) = limit
+    allowance = metric_limit if allowance_column == "metric_limit" else included_units
+    return (metric_id, metric_name, allowance, overage_rate, schedule, max_charge)
+
+
+def load_catalogue(cursor, tenant_id, version=0):
+    """Read one tenant's plans, metrics, limits and tier schedules."""
+    cursor.execute("""
+        SELECT id, name, description, monthly_fee, included_units, overage_rate, is_active
+        FROM plans WHERE tenant_id = ?
+        ORDER BY id
+    """, (tenant_id,))
+    plans = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+    cursor.execute("SELECT id, name, unit FROM usage_metrics WHERE tenant_id = ? ORDER BY id", (tenant_id,))
+    metrics = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+    cursor.execute("""
+        SELECT pml.id, pml.plan_id, pml.metric_id, m.name, pml.metric_limit, pml.included_units,
+               pml.overage_rate, pml.pricing_model, pml.max_charge
+        FROM plan_metric_limits pml
+        JOIN plans p ON p.id = pml.plan_id
+        JOIN usage_metrics m ON m.id = pml.metric_id
+        WHERE p.tenant_id = ?
+        ORDER BY pml.plan_id, pml.metric_id
+    """, (tenant_id,))
+    limit_rows = cursor.fetchall()
+    schedules = load_tier_schedules(cursor, [
+        row[0] for row in limit_rows if row[7] in ("graduated", "volume")
+    ])
+
+    limits = {plan_id: [] for plan_id in plans}
+    for row in limit_rows:
+        limits.setdefault(row[1], []).append(row[:1] + row[2:] + (schedules.get(row[0]),))
+
+    return TenantCatalogue(
+        tenant_id, version, plans, metrics,
+        {plan_id: tuple(plan_limits) for plan_id, plan_limits in limits.items()}
+    )
+
+
+def catalogue_version(cursor, tenant_id):
+    """(database file, version) for the tenant; the file keys the in-process cache."""
+    cursor.execute("""
+        SELECT (SELECT file FROM pragma_database_list WHERE name = 'main'),
+               (SELECT version FROM catalogue_versions WHERE tenant_id = ?)
+    """, (tenant_id,))
+    database, version = cursor.fetchone()
+    return database, version or 0
+
+
+def pricing_version(cursor, tenant_id):
+    """
+    (catalogue version, subscription version) for the tenant. Caches of priced
+    or limited usage (invoice previews, usage meter limits) are valid only while
+    it is unchanged, whichever process made the change.
+    """
+    cursor.execute("""
+        SELECT (SELECT version FROM catalogue_versions WHERE tenant_id = ?),
+               (SELECT version FROM subscription_versions WHERE tenant_id = ?)
+    """, (tenant_id, tenant_id))
+    catalogue, subscriptions = cursor.fetchone()
+    return catalogue or 0, subscriptions or 0
+
+
+def bump_catalogue_version(cursor, tenant_id):
+    """Mark a tenant's catalogue as changed; call inside the transaction that changed it."""
+    cursor.execute("""
+        INSERT INTO catalogue_versions (tenant_id, version, updated_at)
+        VALUES (?, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT (tenant_id)
+        DO UPDATE SET version = version + 1, updated_at = excluded.updated_at
+    """, (tenant_id,))
+
+
+_catalogues = {}  # (database file, tenant_id) -> TenantCatalogue
+_catalogues_lock = threading.Lock()
+
+
+def get_catalogue(cursor, tenant_id):
+    """Current TenantCatalogue for the tenant, reloaded only when its version has moved."""
+    database, version = catalogue_version(cursor, tenant_id)
+    key = (database, tenant_id)
+    catalogue = _catalogues.get(key)
+    if catalogue is not None and catalogue.version == version:
+        return catalogue
+
+    catalogue = load_catalogue(cursor, tenant_id, version)
+    with _catalogues_lock:
+        current = _catalogues.get(key)
+        if current is None or current.version <= version:
+            _catalogues[key] = catalogue
+    logger.info(f"📚 Catalogue loaded for tenant {tenant_id} (version {version})")
+    return catalogue
+
@@ -0,0 +1,133 @@
+# src/services/invoice_preview_cache.py
+#
+# Month-to-date invoice previews cached per (tenant, user). The plan, limits and
+# tier schedules are loaded once per entry; usage comes from the usage meter and
+# is patched into the cached pricing inputs when the meter reports new usage for
+# that user, so a preview is a one-row version read and a dictionary lookup
+# plus, at most, re-pricing one subscriber. Each entry remembers the tenant's catalogue and subscription
+# versions it was priced at and is reloaded once either moves, so plan, limit or
+# subscription changes from any process show up on the next preview;
+# invalidate() drops entries immediately.
+
+import logging
+import threading
+from datetime import datetime
+
+from db.database import get_db_connection
+from services.catalogue import pricing_version
+from services.pricing_kernel import (
+    BASE_FEE_DESCRIPTION, OVERAGE_DESCRIPTION, load_pricing_inputs, price_inputs
+)
+from services.usage_meter import current_period, get_usage_meter
+
+logger = logging.getLogger(__name__)
+
+
+class _Preview:
+    __slots__ = ("period", "version", "inputs", "pairs", "items", "total")
+
+    def __init__(self, period, version, inputs):
+        self.period = period
+        self.version = version
+        self.inputs = inputs
+        # metric_id -> index into the pricing arrays
+        self.pairs = {metric_id: pair for pair, (metric_id, _) in enumerate(inputs["pair_metric"])}
+        self.items = None      # None until (re-)priced
+        self.total = 0.0
+
+
+class InvoicePreviewCache:
+    """Cached invoice previews, refreshed incrementally from the usage meter."""
+
+    def __init__(self, meter=None):
+        self.meter = meter or get_usage_meter()
+        self._entries = {}  # (tenant_id, user_id) -> _Preview
+        self._lock = threading.RLock()
+
+    def get(self, tenant_id, user_id):
+        """Return (items, total) for the user's month-to-date preview."""
+        # Folds in rows from other writers at most once per meter sync interval
+        self.meter.refresh(tenant_id)
+
+        period = current_period()[0]
+        conn = get_db_connection(tenant_id)
+        version = pricing_version(conn.cursor(), tenant_id)
+        conn.close()
+        with self._lock:
+            entry = self._entries.get((tenant_id, user_id))
+            if entry is None or entry.period != period or entry.version != version:
+                entry = self._load(tenant_id, user_id, period, version)
+                self._entries[(tenant_id, user_id)] = entry
+            if entry.items is None:
+                self._price(entry)
+            items, total = entry.items, entry.total
+
+        today = datetime.now().strftime("%Y-%m-%d")
+        return [dict(item, date=today) for item in items], total
+
+    def on_usage_changed(self, tenant_id, changed):
+        """Usage meter listener: patch new totals into the affected cached previews."""
+        with self._lock:
+            for (user_id, metric_id), used in changed.items():
+                entry = self._entries.get((tenant_id, user_id))
+                if entry is None:
+                    continue
+                pair = entry.pairs.get(metric_id)
+                if pair is None or entry.inputs["usage"][pair] == used:
+                    continue
+                entry.inputs["usage"][pair] = used
+                entry.items = None
+
+    def invalidate(self, tenant_id=None, user_id=None):
+        """Drop cached previews for a user, a tenant, or everything."""
+        with self._lock:
+            if tenant_id is None:
+                self._entries.clear()
+                return
+            for key in list(self._entries):
+                if key[0] == tenant_id and (user_id is None or key[1] == user_id):
+                    del self._entries[key]
+
+    def _load(self, tenant_id, user_id, period, version):
+        usage_totals = {
+            (user_id, metric["metric_id"]): metric["used"]
+            for metric in self.meter.user_usage(tenant_id, user_id)
+        }
+        _, start_date, end_date = current_period()
+
+        conn = get_db_connection(tenant_id)
+        cursor = conn.cursor()
+        inputs = load_pricing_inputs(
+            cursor, tenant_id, start_date, end_date, user_id=user_id, usage_totals=usage_totals
+        )
+        conn.close()
+        return _Preview(period, version, inputs)
+
+    def _price(self, entry):
+        if not entry.inputs["subscribers"]:
+            entry.items, entry.total = [], 0.0
+            return
+        priced = price_inputs(entry.inputs, BASE_FEE_DESCRIPTION, OVERAGE_DESCRIPTION)
+        # Only one subscriber is loaded per entry
+        entry.items, entry.total = next(iter(priced.values()))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_preview_cache():
+    """Process-wide InvoicePreviewCache, subscribed to the usage meter."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = InvoicePreviewCache()
+                _cache.meter.add_listener(_cache.on_usage_changed)
+    return _cache
+
+
+def invalidate_pricing(tenant_id):
+    """Call after a plan, limit or subscription change in a tenant."""
+    get_usage_meter().invalidate_limits(tenant_id)
+    get_preview_cache().invalidate(tenant_id)
@@ -0,0 +1,79 @@
+# src/services/mail_outbox.py
+#
+# Background delivery for bulk notification emails (payment confirmations and
+# the like). Callers only enqueue messages; a worker drains the queue and sends
+# whatever has accumulated (up to BATCH_SIZE messages, waiting at most
+# FLUSH_SECONDS for more) over a single SMTP connection, so reconciling or
+# verifying thousands of payments never waits on the mail server.
+
+import logging
+import queue
+import threading
+import time
+
+from utils import email_utils
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+FLUSH_SECONDS = 1.0
+
+
+class MailOutbox:
+    """Queues (to_email, subject, body) messages and sends them in batches on a worker thread."""
+
+    def __init__(self):
+        self._outbox = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def send(self, to_email, subject, body):
+        self.send_many([(to_email, subject, body)])
+
+    def send_many(self, messages):
+        for message in messages:
+            self._outbox.put(message)
+        if messages:
+            self._ensure_worker()
+
+    def flush(self):
+        """Block until every queued message has been handed to the mail server."""
+        self._outbox.join()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._send_loop, name="mail-outbox", daemon=True)
+                    self._worker.start()
+
+    def _send_loop(self):
+        while True:
+            batch = [self._outbox.get()]
+            deadline = time.monotonic() + FLUSH_SECONDS
+            try:
+                while len(batch) < BATCH_SIZE:
+                    batch.append(self._outbox.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+            try:
+                email_utils.send_emails(batch)
+            except Exception as e:
+                logger.error(f"❌ Failed to send {len(batch)} queued emails: {e}")
+            finally:
+                for _ in batch:
+                    self._outbox.task_done()
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_mail_outbox():
+    """Process-wide MailOutbox."""
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = MailOutbox()
+    return _outbox
@@ -0,0 +1,137 @@
+# src/services/password_hasher.py
+#
+# bcrypt off the Streamlit script threads. Hashes and checks run in a bounded
+# thread pool (bcrypt releases the GIL while it works), at most
+# PASSWORD_HASH_QUEUE requests are admitted at once, and callers wait at most
+# PASSWORD_HASH_TIMEOUT seconds, so a burst of logins queues briefly instead
+# of stalling every session. The work factor is BCRYPT_COST (12, bcrypt's own
+# default, unless configured); with BCRYPT_COST=0 it is calibrated once per
+# process to the highest cost that stays under BCRYPT_TARGET_MS on this host,
+# never below MIN_COST. Stored hashes weaker than the current cost are
+# re-hashed in the background after a successful login; stronger ones are
+# left alone, so processes with different costs never undo each other's work.
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+MIN_COST = 12
+MAX_COST = 16
+SAMPLE_COST = 8
+SAMPLES = 3
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+_cost = None
+_cost_lock = threading.Lock()
+
+
+def _pool():
+    global _executor, _slots
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_QUEUE)
+                _executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS,
+                                               thread_name_prefix="bcrypt")
+    return _executor
+
+
+def _submit(fn, timeout):
+    """Run fn in the pool; raises TimeoutError if no queue slot frees up within timeout."""
+    executor = _pool()
+    if not _slots.acquire(timeout=timeout):
+        raise TimeoutError("Password hashing queue is full")
+    future = executor.submit(fn)
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def _run(fn):
+    deadline = time.monotonic() + settings.PASSWORD_HASH_TIMEOUT
+    future = _submit(fn, settings.PASSWORD_HASH_TIMEOUT)
+    try:
+        return future.result(timeout=max(0, deadline - time.monotonic()))
+    except FutureTimeout:
+        raise TimeoutError("Password hashing timed out") from None
+
+
+def calibrate_cost(target_ms=None, min_cost=MIN_COST, max_cost=MAX_COST):
+    """Highest bcrypt cost whose hash takes at most target_ms here, but at least min_cost."""
+    target_ms = settings.BCRYPT_TARGET_MS if target_ms is None else target_ms
+    # Each cost step doubles the time; the fastest of a few cheap samples is the least noisy
+    elapsed_ms = float("inf")
+    for _ in range(SAMPLES):
+        started = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds=SAMPLE_COST))
+        elapsed_ms = min(elapsed_ms, (time.perf_counter() - started) * 1000)
+    cost = SAMPLE_COST
+    while cost < max_cost and elapsed_ms * 2 <= target_ms:
+        cost += 1
+        elapsed_ms *= 2
+    cost = max(cost, min_cost)
+    logger.info(f"🔐 bcrypt cost {cost} (target {target_ms} ms per hash)")
+    return cost
+
+
+def current_cost():
+    global _cost
+    if _cost is None:
+        with _cost_lock:
+            if _cost is None:
+                _cost = settings.BCRYPT_COST or calibrate_cost()
+    return _cost
+
+
+def _as_bytes(value):
+    return value.encode() if isinstance(value, str) else bytes(value)
+
+
+def hash_password(password):
+    """bcrypt hash (bytes) of password at the current cost."""
+    cost = current_cost()
+    return _run(lambda: bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=cost)))
+
+
+def verify_password(password, stored_hash):
+    """True if password matches stored_hash (bytes or str); False for malformed hashes."""
+    def check():
+        try:
+            return bcrypt.checkpw(password.encode(), _as_bytes(stored_hash))
+        except ValueError:
+            return False
+    return _run(check)
+
+
+def hash_cost(stored_hash):
+    """Work factor of a '$2b$12$...' hash, or None if it isn't one."""
+    parts = _as_bytes(stored_hash).split(b"$")
+    return int(parts[2]) if len(parts) > 3 and parts[2].isdigit() else None
+
+
+def needs_rehash(stored_hash):
+    """True if stored_hash is weaker than the current cost; stronger hashes are never downgraded."""
+    cost = hash_cost(stored_hash)
+    return cost is not None and cost < current_cost()
+
+
+def rehash_in_background(password, save):
+    """Hash password at the current cost in the pool and pass the result to save(new_hash)."""
+    def rehash():
+        try:
+            save(bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=current_cost())))
+        except Exception as e:
+            logger.warning(f"⚠️ Password rehash failed: {e}")
+    try:
+        return _submit(rehash, timeout=0)
+    except TimeoutError:
+        # Busy; the next login will try again
+        return None
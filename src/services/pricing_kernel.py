@@ -0,0 +1,346 @@
+# src/services/pricing_kernel.py
+#
+# Vectorised overage pricing. Instead of issuing one SUM per (subscriber, metric)
+# and pricing each row in Python, the billing paths load every pair for a tenant
+# in three set-based queries and price them in a single NumPy pass.
+#
+# Plan metric limits are priced with one of three models, applied to the units
+# above the included limit:
+#   flat      - every unit at overage_rate
+#   graduated - each unit at the rate of the bracket it falls in
+#   volume    - every unit at the rate of the bracket the total falls in
+# and an optional max_charge caps the line.
+
+import logging
+from bisect import bisect_left
+
+import numpy as np
+
+from services.proration import load_plan_timelines, prorate_subscribers
+from services.subscriptions import active_plans
+
+logger = logging.getLogger(__name__)
+
+PRICING_MODELS = ("flat", "graduated", "volume")
+
+BASE_FEE_DESCRIPTION = "Base Plan: {plan_name}"
+OVERAGE_DESCRIPTION = "Overage - {metric_name} (Limit: {limit})"
+
+
+class TierSchedule:
+    """
+    Bracket table for one plan metric, with cumulative boundaries precomputed so
+    pricing a quantity is a binary search plus one multiply: O(log tiers).
+    """
+
+    __slots__ = ("model", "bounds", "upper", "lower", "prices", "cumulative")
+
+    def __init__(self, model, tiers):
+        """`tiers` is a list of (up_to, unit_price); up_to None means unbounded."""
+        if model not in ("graduated", "volume"):
+            raise ValueError(f"Tiers are only used by graduated or volume pricing, not {model!r}")
+        if not tiers:
+            raise ValueError("A tier schedule needs at least one tier")
+        if sum(1 for up_to, _ in tiers if up_to is None) > 1:
+            raise ValueError("Only one tier can be unbounded (empty 'Up to')")
+
+        ordered = sorted(tiers, key=lambda tier: (tier[0] is None, tier[0] or 0))
+        upper = [float("inf") if up_to is None else float(up_to) for up_to, _ in ordered]
+        # The last bracket always extends to infinity
+        upper[-1] = float("inf")
+
+        self.model = model
+        self.bounds = upper
+        self.upper = np.asarray(upper, dtype=np.float64)
+        self.lower = np.concatenate([[0.0], self.upper[:-1]])
+        self.prices = np.asarray([price for _, price in ordered], dtype=np.float64)
+        widths = self.upper[:-1] - self.lower[:-1]
+        # Cost of filling every bracket below bracket i completely
+        self.cumulative = np.concatenate([[0.0], np.cumsum(widths * self.prices[:-1])])
+
+    def price(self, units):
+        """Charge for a single quantity of billable units."""
+        if units <= 0:
+            return 0.0
+        bracket = bisect_left(self.bounds, units)
+        if self.model == "volume":
+            return units * float(self.prices[bracket])
+        return float(self.cumulative[bracket] + (units - self.lower[bracket]) * self.prices[bracket])
+
+    def price_many(self, units):
+        """Vectorised charge for an array of billable units."""
+        units = np.asarray(units, dtype=np.float64)
+        bracket = np.searchsorted(self.upper, units, side="left")
+        if self.model == "volume":
+            cost = units * self.prices[bracket]
+        else:
+            cost = self.cumulative[bracket] + (units - self.lower[bracket]) * self.prices[bracket]
+        return np.where(units > 0, cost, 0.0)
+
+
+def rate_overages(usage, limits, rates):
+    """
+    Price overage for every (subscriber, metric) pair at once.
+    Returns the overage units (int64) and the overage cost (float64) per pair,
+    i.e. max(0, usage - limit) * overage_rate.
+    """
+    usage = np.asarray(usage, dtype=np.int64)
+    limits = np.asarray(limits, dtype=np.int64)
+    rates = np.asarray(rates, dtype=np.float64)
+
+    overage = np.maximum(usage - limits, 0)
+    cost = np.where(overage > 0, overage * rates, 0.0)
+    return overage, cost
+
+
+def rate_tiered(overage, cost, pair_schedule, schedules):
+    """
+    Replace the flat cost of pairs that use a tier schedule.
+
+    `pair_schedule` holds an index into `schedules` per pair, or -1 for flat
+    pricing. Pairs are grouped by schedule so each group is one searchsorted.
+    """
+    pair_schedule = np.asarray(pair_schedule, dtype=np.int64)
+    tiered = pair_schedule >= 0
+    if not tiered.any():
+        return cost
+
+    cost = cost.copy()
+    tiered_pairs = np.flatnonzero(tiered)
+    order = np.argsort(pair_schedule[tiered_pairs], kind="stable")
+    tiered_pairs = tiered_pairs[order]
+    schedule_ids, starts = np.unique(pair_schedule[tiered_pairs], return_index=True)
+    ends = np.append(starts[1:], len(tiered_pairs))
+
+    for schedule_id, start, end in zip(schedule_ids, starts, ends):
+        pairs = tiered_pairs[start:end]
+        cost[pairs] = schedules[schedule_id].price_many(overage[pairs])
+    return cost
+
+
+def price_pairs(pair_subscriber, usage, limits, rates, base_fees,
+                pair_schedule=None, schedules=(), max_charges=None):
+    """
+    Price all pairs and roll them up per subscriber.
+
+    `pair_subscriber` maps each pair to its row in `base_fees`. Totals are
+    accumulated in the same order as the per-row loop (base fee first, then each
+    metric in order), so they match the old per-user results bit for bit.
+    Tiered pairs are priced through their schedule and `max_charges` (NaN for
+    uncapped) caps the line charge.
+    """
+    base_fees = np.asarray(base_fees, dtype=np.float64)
+    pair_subscriber = np.asarray(pair_subscriber, dtype=np.int64)
+    n_subscribers = len(base_fees)
+
+    overage, cost = rate_overages(usage, limits, rates)
+    if pair_schedule is not None:
+        cost = rate_tiered(overage, cost, pair_schedule, schedules)
+    if max_charges is not None:
+        max_charges = np.asarray(max_charges, dtype=np.float64)
+        capped = ~np.isnan(max_charges)
+        cost = np.where(capped, np.minimum(cost, max_charges), cost)
+
+    # bincount adds weights strictly in array order, so putting the base fees
+    # ahead of the metric costs reproduces fee + c1 + c2 + ... exactly.
+    index = np.concatenate([np.arange(n_subscribers, dtype=np.int64), pair_subscriber])
+    weights = np.concatenate([base_fees, cost])
+    totals = np.bincount(index, weights=weights, minlength=n_subscribers)
+    return overage, cost, totals
+
+
+def load_pricing_inputs(cursor, tenant_id, start_date, end_date, user_id=None,
+                        allowance_column="metric_limit", usage_totals=None, prorate=True):
+    """
+    Load everything needed to price a tenant (or one user) for a period.
+
+    Plans, limits and tier schedules come from the tenant's cached catalogue,
+    so this is two queries regardless of subscriber count: active
+    subscriptions and usage grouped by (user, metric). Pass `usage_totals`
+    ({(user_id, metric_id): total}) to skip the usage query. With `prorate`,
+    plan changes recorded in subscription_audit split fees and included units
+    by days on each plan (see services.proration).
+    """
+    # Imported here because the catalogue builds on this module's TierSchedule
+    from services.catalogue import get_catalogue
+
+    if allowance_column not in ("metric_limit", "included_units"):
+        raise ValueError(f"Unknown allowance column: {allowance_column}")
+
+    catalogue = get_catalogue(cursor, tenant_id)
+    plans = active_plans(cursor, tenant_id, None if user_id is None else [user_id])
+
+    # One active subscription per user (the first by id)
+    subscribers = []
+    for sub_user_id, plan_id in plans.items():
+        plan = catalogue.plans.get(plan_id)
+        if plan is None:
+            continue
+        subscribers.append((sub_user_id, plan_id, plan[0], plan[2]))
+
+    limits_by_plan = catalogue.pricing_limits(allowance_column)
+    limits_by_user, base_lines = {}, {}
+    if prorate:
+        timelines = load_plan_timelines(cursor, tenant_id, start_date, user_id=user_id)
+        if timelines:
+            subscribers, limits_by_user, base_lines = prorate_subscribers(
+                subscribers, timelines, catalogue, start_date, allowance_column
+            )
+
+    if usage_totals is None:
+        query = """
+            SELECT user_id, metric_id, SUM(usage_amount)
+            FROM usage_records
+            WHERE tenant_id = ? AND usage_date BETWEEN ? AND ?
+        """
+        params = [tenant_id, start_date, end_date]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        cursor.execute(query + " GROUP BY user_id, metric_id", params)
+        usage_totals = {(u, m): total or 0 for u, m, total in cursor.fetchall()}
+
+    inputs = build_pricing_inputs(subscribers, limits_by_plan, usage_totals, limits_by_user)
+    inputs["base_lines"] = base_lines
+    return inputs
+
+
+def load_tier_schedules(cursor, limit_ids):
+    """Build a TierSchedule per plan_metric_limits id that has tiers defined."""
+    if not limit_ids:
+        return {}
+
+    placeholders = ",".join("?" for _ in limit_ids)
+    cursor.execute(f"""
+        SELECT pmt.plan_metric_limit_id, pml.pricing_model, pmt.up_to, pmt.unit_price
+        FROM plan_metric_tiers pmt
+        JOIN plan_metric_limits pml ON pml.id = pmt.plan_metric_limit_id
+        WHERE pmt.plan_metric_limit_id IN ({placeholders})
+    """, list(limit_ids))
+
+    tiers_by_limit = {}
+    for limit_id, model, up_to, unit_price in cursor.fetchall():
+        tiers_by_limit.setdefault(limit_id, (model, []))[1].append((up_to, unit_price))
+
+    # A graduated/volume limit without tiers falls back to flat overage_rate pricing;
+    # so does one whose saved tiers can't be priced, until an admin fixes them
+    schedules = {}
+    for limit_id, (model, tiers) in tiers_by_limit.items():
+        try:
+            schedules[limit_id] = TierSchedule(model, tiers)
+        except ValueError as e:
+            logger.error(f"❌ Tiers for plan metric limit {limit_id} ignored: {e}")
+    return schedules
+
+
+def build_pricing_inputs(subscribers, limits_by_plan, usage_totals, limits_by_user=None):
+    """
+    Flatten subscribers × plan metric limits into the parallel arrays the kernel
+    expects. `subscribers` is a list of (user_id, plan_id, plan_name, monthly_fee);
+    `limits_by_plan` maps plan_id to (metric_id, metric_name, allowance,
+    overage_rate[, schedule, max_charge]) tuples, and `limits_by_user`
+    overrides them for individual users (e.g. prorated allowances).
+    """
+    limits_by_user = limits_by_user or {}
+    pair_subscriber = []
+    pair_metric = []
+    usage = []
+    limits = []
+    rates = []
+    pair_schedule = []
+    max_charges = []
+    schedules = []
+    schedule_index = {}
+
+    for row, (user_id, plan_id, _, _) in enumerate(subscribers):
+        user_limits = limits_by_user[user_id] if user_id in limits_by_user else limits_by_plan.get(plan_id, ())
+        for limit in user_limits:
+            metric_id, metric_name, allowance, overage_rate = limit[:4]
+            schedule, max_charge = (limit[4], limit[5]) if len(limit) > 4 else (None, None)
+
+            if schedule is None:
+                pair_schedule.append(-1)
+            else:
+                if id(schedule) not in schedule_index:
+                    schedule_index[id(schedule)] = len(schedules)
+                    schedules.append(schedule)
+                pair_schedule.append(schedule_index[id(schedule)])
+
+            pair_subscriber.append(row)
+            pair_metric.append((metric_id, metric_name))
+            usage.append(usage_totals.get((user_id, metric_id), 0))
+            limits.append(allowance)
+            rates.append(overage_rate)
+            max_charges.append(float("nan") if max_charge is None else max_charge)
+
+    return {
+        "subscribers": subscribers,
+        "pair_subscriber": np.asarray(pair_subscriber, dtype=np.int64),
+        "pair_metric": pair_metric,
+        "usage": np.asarray(usage, dtype=np.int64),
+        "limits": np.asarray(limits, dtype=np.int64),
+        "rates": np.asarray(rates, dtype=np.float64),
+        "base_fees": np.asarray([fee for _, _, _, fee in subscribers], dtype=np.float64),
+        "pair_schedule": np.asarray(pair_schedule, dtype=np.int64),
+        "schedules": schedules,
+        "max_charges": np.asarray(max_charges, dtype=np.float64),
+    }
+
+
+def price_inputs(inputs, base_description, overage_description, date=None):
+    """
+    Price loaded inputs and build invoice line items per user.
+
+    `base_description` and `overage_description` are format strings; the latter
+    receives `metric_name` and `limit`. Returns {user_id: (items, total)}.
+    """
+    overage, cost, totals = price_pairs(
+        inputs["pair_subscriber"], inputs["usage"], inputs["limits"],
+        inputs["rates"], inputs["base_fees"],
+        pair_schedule=inputs["pair_schedule"], schedules=inputs["schedules"],
+        max_charges=inputs["max_charges"]
+    )
+
+    results = {}
+    items_by_row = []
+    base_lines = inputs.get("base_lines", {})
+    for user_id, _, plan_name, monthly_fee in inputs["subscribers"]:
+        # Prorated subscribers get one base line per plan they were on
+        lines = base_lines.get(user_id) or [(plan_name, monthly_fee, None, None)]
+        items = []
+        for line_plan, fee, days, month_days in lines:
+            description = base_description.format(plan_name=line_plan)
+            if days is not None:
+                description += f" ({days}/{month_days} days)"
+            item = {"description": description, "quantity": 1, "unit_price": fee, "total_price": fee}
+            if date:
+                item["date"] = date
+            items.append(item)
+        items_by_row.append(items)
+
+    # Only pairs with overage become line items
+    for pair in np.flatnonzero(overage > 0):
+        metric_id, metric_name = inputs["pair_metric"][pair]
+        item = {
+            "description": overage_description.format(
+                metric_name=metric_name, limit=int(inputs["limits"][pair])
+            ),
+            "quantity": int(overage[pair]),
+            "unit_price": line_unit_price(inputs, pair, overage[pair], cost[pair]),
+            "total_price": float(cost[pair]),
+        }
+        if date:
+            item["date"] = date
+        items_by_row[inputs["pair_subscriber"][pair]].append(item)
+
+    for row, (user_id, _, _, _) in enumerate(inputs["subscribers"]):
+        results[user_id] = (items_by_row[row], float(totals[row]))
+    return results
+
+
+def line_unit_price(inputs, pair, overage, cost):
+    """Flat lines keep the overage rate; tiered or capped lines show the effective rate."""
+    rate = float(inputs["rates"][pair])
+    if inputs["pair_schedule"][pair] < 0 and overage * rate == cost:
+        return rate
+    return float(cost) / int(overage)
@@ -0,0 +1,116 @@
+# src/services/proration.py
+#
+# Mid-period plan changes. subscription_audit records 'subscribed', 'switched'
+# and 'cancelled' events; one sorted pass over a tenant's events rebuilds each
+# subscriber's plan timeline for the billing month. Every segment is charged
+# its plan's monthly fee in proportion to the days it covers, and included
+# units are pooled the same way: the allowance for a metric is the day-weighted
+# sum of each segment plan's allowance. Overage is rated on the last plan that
+# carried the metric, so a metric dropped by a downgrade is still billed.
+# Subscribers without audit events keep their current plan for the whole
+# month, exactly as before.
+
+from datetime import date, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+ACTIVATING_ACTIONS = ("subscribed", "switched")
+
+
+def month_bounds(start_date):
+    """(first day, day after the last day) of the month containing start_date, as dates."""
+    first = date.fromisoformat(str(start_date)[:10]).replace(day=1)
+    return first, (first + timedelta(days=32)).replace(day=1)
+
+
+def load_plan_timelines(cursor, tenant_id, start_date, user_id=None):
+    """
+    {user_id: [(plan_id, days), ...]} for the month containing start_date, built
+    from subscription_audit in a single ordered scan. Only users with audit
+    events up to the end of the month appear; a user whose first event is a
+    switch or cancellation was on its old_plan_id before it.
+    """
+    month_start, month_end = month_bounds(start_date)
+    query = """
+        SELECT user_id, action, old_plan_id, new_plan_id, substr(timestamp, 1, 10) AS day
+        FROM subscription_audit
+        WHERE tenant_id = ? AND substr(timestamp, 1, 10) < ?
+    """
+    params = [tenant_id, month_end.isoformat()]
+    if user_id is not None:
+        query += " AND user_id = ?"
+        params.append(user_id)
+    cursor.execute(query + " ORDER BY user_id, timestamp, id", params)
+
+    timelines = {}
+    for uid, events in groupby(cursor.fetchall(), key=itemgetter(0)):
+        plan_id, since = None, month_start
+        segments = []
+        for index, (_, action, old_plan_id, new_plan_id, day) in enumerate(events):
+            # Subscriptions older than the audit trail open on the plan the first event leaves
+            if index == 0:
+                plan_id = old_plan_id
+            # Events before the month only decide which plan it opens on
+            day = max(date.fromisoformat(day), month_start)
+            if plan_id is not None and day > since:
+                segments.append((plan_id, (day - since).days))
+            plan_id = new_plan_id if action in ACTIVATING_ACTIONS else None
+            since = day
+        if plan_id is not None and month_end > since:
+            segments.append((plan_id, (month_end - since).days))
+        timelines[uid] = segments
+    return timelines
+
+
+def prorate_subscribers(subscribers, timelines, catalogue, start_date, allowance_column="metric_limit"):
+    """
+    Apply plan timelines to (user_id, plan_id, plan_name, monthly_fee) subscriber
+    rows. Returns (subscribers, limits_by_user, base_lines):
+
+    - subscribers: rows with the prorated fee, plus users who cancelled during
+      the month, keyed to the plan the month ends on;
+    - limits_by_user: {user_id: limit tuples} with pooled allowances, for every
+      metric on any of the month's plans;
+    - base_lines: {user_id: [(plan_name, fee, days, month_days)]} per segment.
+    """
+    month_start, month_end = month_bounds(start_date)
+    month_days = (month_end - month_start).days
+    pricing_limits = catalogue.pricing_limits(allowance_column)
+
+    rows = {row[0]: row for row in subscribers}
+    for user_id, segments in timelines.items():
+        # Cancelled during the month: still owes the days it was subscribed
+        if user_id not in rows and segments and segments[-1][0] in catalogue.plans:
+            plan_id = segments[-1][0]
+            rows[user_id] = (user_id, plan_id, catalogue.plans[plan_id][0], catalogue.plans[plan_id][2])
+
+    prorated = []
+    limits_by_user = {}
+    base_lines = {}
+    for user_id, row in rows.items():
+        segments = [(plan_id, days) for plan_id, days in timelines.get(user_id, ()) if plan_id in catalogue.plans]
+        if not segments or segments == [(row[1], month_days)]:
+            prorated.append(row)
+            continue
+
+        lines = []
+        allowances = {}
+        # Every metric any segment carried, priced at the last segment that carried it
+        metric_limits = {}
+        for plan_id, days in segments:
+            plan_name, _, monthly_fee = catalogue.plans[plan_id][:3]
+            lines.append((plan_name, round(monthly_fee * days / month_days, 2), days, month_days))
+            for limit in pricing_limits.get(plan_id, ()):
+                metric_id, allowance = limit[0], limit[2]
+                allowances[metric_id] = allowances.get(metric_id, 0) + allowance * days / month_days
+                metric_limits[metric_id] = limit
+
+        closing_plan = segments[-1][0]
+        limits_by_user[user_id] = tuple(
+            (metric_id, metric_name, int(round(allowances[metric_id])), rate, schedule, max_charge)
+            for metric_id, metric_name, _, rate, schedule, max_charge in metric_limits.values()
+        )
+        base_lines[user_id] = lines
+        prorated.append((user_id, closing_plan, catalogue.plans[closing_plan][0], round(sum(line[1] for line in lines), 2)))
+
+    return prorated, limits_by_user, base_lines
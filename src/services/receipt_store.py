@@ -0,0 +1,100 @@
+# src/services/receipt_store.py
+#
+# Content-addressed storage for payment receipts. Uploads are copied to a
+# temporary file in CHUNK_SIZE pieces while being hashed, then moved to
+# <RECEIPTS_DIR>/<ab>/<cd>/<sha256><ext> (two levels of sharding keep every
+# directory small). A receipt whose content is already stored is not written
+# again, so re-submitted proofs cost no disk. The payments row records the
+# path together with the hash, size and sniffed MIME type, so pages never
+# have to stat or open a file to describe a receipt. Downloads map the file
+# into memory rather than reading it through Python buffers.
+
+import hashlib
+import mimetypes
+import mmap
+import os
+import tempfile
+
+from config import settings
+
+CHUNK_SIZE = 1024 * 1024
+
+# Leading bytes of the formats clients upload; the browser's content type is only a fallback
+SIGNATURES = (
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+)
+EXTENSIONS = {"application/pdf": ".pdf", "image/png": ".png", "image/jpeg": ".jpg"}
+
+
+def receipts_root():
+    return settings.RECEIPTS_DIR
+
+
+def receipt_path(sha256, mime=None):
+    """Where content with this hash is stored."""
+    return os.path.join(receipts_root(), sha256[:2], sha256[2:4], sha256 + EXTENSIONS.get(mime, ""))
+
+
+def sniff_mime(head, filename=None, content_type=None):
+    for signature, mime in SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    return content_type or (mimetypes.guess_type(filename)[0] if filename else None) or "application/octet-stream"
+
+
+def store_receipt(fileobj, filename=None, content_type=None):
+    """
+    Stream a file-like object into the store. Returns
+    {"path", "sha256", "size", "mime", "deduplicated"}.
+    """
+    root = receipts_root()
+    os.makedirs(root, exist_ok=True)
+    if hasattr(fileobj, "seek"):
+        fileobj.seek(0)
+
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    # The temp file sits in the store so the final rename never crosses filesystems
+    tmp = tempfile.NamedTemporaryFile(dir=root, prefix=".upload-", delete=False)
+    try:
+        with tmp:
+            while True:
+                chunk = fileobj.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if not head:
+                    head = chunk[:16]
+                digest.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+
+        sha256 = digest.hexdigest()
+        mime = sniff_mime(head, filename, content_type)
+        path = receipt_path(sha256, mime)
+        deduplicated = os.path.exists(path)
+        if deduplicated:
+            os.unlink(tmp.name)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp.name, path)
+    except BaseException:
+        if os.path.exists(tmp.name):
+            os.unlink(tmp.name)
+        raise
+    return {"path": path, "sha256": sha256, "size": size, "mime": mime, "deduplicated": deduplicated}
+
+
+def read_receipt(path):
+    """Receipt content through a read-only memory map; None if the file is missing."""
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                # Streamlit keeps download payloads as bytes, so this is the single copy
+                return mapped[:]
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,292 @@
+# src/services/reconciliation.py
+#
+# Bank statement reconciliation. A statement (CSV or OFX) is parsed into
+# credit lines, and each line is matched against the tenant's open items
+# through in-memory hash indexes:
+#   1. an invoice number in the reference, keyed (amount, invoice) for payments
+#      clients have submitted and are awaiting verification, else the open
+#      invoice itself;
+#   2. otherwise (amount) alone, accepted only when exactly one pending payment
+#      or open invoice with that amount falls inside the date window.
+# Matching is read-only so it can be previewed; apply_matches() then records
+# every match in one transaction and queues the confirmation emails in bulk.
+# Each line carries a bank reference that is stored on the payment under a
+# unique (tenant, reference) index, so importing the same statement twice
+# reconciles nothing new; transaction ids only identify a line within one
+# tenant's bank account.
+
+import csv
+import hashlib
+import io
+import logging
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from db.database import get_db_connection
+from payment_logic import apply_payment, user_contacts
+from services.mail_outbox import get_mail_outbox
+
+logger = logging.getLogger(__name__)
+
+DATE_WINDOW_DAYS = 7
+DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%Y%m%d")
+COLUMN_ALIASES = {
+    "date": ("date", "transaction_date", "posted", "value_date"),
+    "amount": ("amount", "credit", "value"),
+    "reference": ("reference", "description", "narrative", "memo", "details"),
+    "bank_ref": ("transaction_id", "fitid", "id", "bank_ref"),
+}
+INVOICE_REF = re.compile(r"(?:\binv(?:oice)?|#)\s*[-#:.]?\s*0*(\d+)", re.IGNORECASE)
+OFX_TRANSACTION = re.compile(r"<STMTTRN>(.*?)(?:</STMTTRN>|(?=<STMTTRN>)|(?=</BANKTRANLIST>))", re.DOTALL)
+OFX_FIELD = re.compile(r"<(\w+)>([^<\r\n]*)")
+
+
+def _parse_date(value):
+    value = str(value).strip().split("T")[0].split(" ")[0]  # drop any time part
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date '{value}'")
+
+
+def _cents(amount):
+    return int(round(float(str(amount).replace(",", "").strip()) * 100))
+
+
+def _line(number, date, amount, reference, bank_ref, seen):
+    """Statement line dict; lines without a bank id get a stable one from their content."""
+    if not bank_ref:
+        key = f"{date.isoformat()}|{amount}|{reference}"
+        seen[key] += 1  # identical lines in one statement are separate payments
+        bank_ref = "sha1:" + hashlib.sha1(f"{key}|{seen[key]}".encode()).hexdigest()
+    return {"line": number, "date": date, "amount": amount, "reference": reference, "bank_ref": bank_ref}
+
+
+def _parse_csv(text):
+    reader = csv.DictReader(io.StringIO(text))
+    headers = {h.strip().lower(): h for h in reader.fieldnames or []}
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        columns[field] = next((headers[a] for a in aliases if a in headers), None)
+    if not columns["date"] or not columns["amount"]:
+        raise ValueError("Statement CSV needs a date and an amount column")
+
+    lines, errors, seen = [], [], defaultdict(int)
+    for number, row in enumerate(reader, start=2):
+        try:
+            amount = _cents(row[columns["amount"]])
+            if amount <= 0:
+                continue  # debits are not receipts
+            reference = (row.get(columns["reference"]) or "").strip() if columns["reference"] else ""
+            bank_ref = (row.get(columns["bank_ref"]) or "").strip() if columns["bank_ref"] else ""
+            lines.append(_line(number, _parse_date(row[columns["date"]]), amount, reference, bank_ref, seen))
+        except (ValueError, TypeError) as e:
+            errors.append((number, str(e)))
+    return lines, errors
+
+
+def _parse_ofx(text):
+    lines, errors, seen = [], [], defaultdict(int)
+    for number, block in enumerate(OFX_TRANSACTION.findall(text), start=1):
+        fields = {tag.upper(): value.strip() for tag, value in OFX_FIELD.findall(block)}
+        try:
+            amount = _cents(fields["TRNAMT"])
+            if amount <= 0:
+                continue
+            reference = " ".join(v for v in (fields.get("NAME"), fields.get("MEMO")) if v)
+            lines.append(_line(number, _parse_date(fields["DTPOSTED"][:8]), amount, reference,
+                               fields.get("FITID", ""), seen))
+        except (KeyError, ValueError) as e:
+            errors.append((number, f"Bad transaction: {e}"))
+    return lines, errors
+
+
+def parse_statement(data, filename=""):
+    """
+    Credit lines of a CSV or OFX bank statement (bytes or str). Returns
+    (lines, errors) with amounts in cents and errors as [(line, reason)].
+    """
+    text = data.decode("utf-8-sig", errors="replace") if isinstance(data, bytes) else data
+    if filename.lower().endswith((".ofx", ".qfx")) or "<OFX>" in text[:2000].upper():
+        return _parse_ofx(text)
+    return _parse_csv(text)
+
+
+def invoice_refs(reference):
+    return [int(n) for n in INVOICE_REF.findall(reference or "")]
+
+
+def match_statement(tenant_id, lines, window_days=DATE_WINDOW_DAYS):
+    """
+    Match statement lines to the tenant's pending payments and open invoices.
+    Returns {"matched": [...], "unmatched": [line, ...], "duplicates": [line, ...]};
+    each match is {"line", "kind" ('pending' | 'invoice'), "invoice_id", "payment_id", "user_id", "amount"}.
+    """
+    window = timedelta(days=window_days)
+    conn = get_db_connection(tenant_id)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, user_id, ROUND(balance_due * 100), invoice_date, due_date
+        FROM invoices WHERE tenant_id = ? AND is_paid = 0
+    """, (tenant_id,))
+    invoices = {}
+    invoices_by_amount = defaultdict(list)
+    for invoice_id, user_id, balance, invoice_date, due_date in cursor.fetchall():
+        start = _parse_date(invoice_date) - window
+        end = _parse_date(due_date or invoice_date) + window
+        invoice = {"id": invoice_id, "user_id": user_id, "balance": int(balance), "start": start, "end": end}
+        invoices[invoice_id] = invoice
+        invoices_by_amount[invoice["balance"]].append(invoice)
+
+    cursor.execute("""
+        SELECT p.id, p.invoice_id, p.user_id, ROUND(p.amount * 100), p.payment_date
+        FROM payments p JOIN invoices i ON i.id = p.invoice_id
+        WHERE i.tenant_id = ? AND p.is_verified = 0
+    """, (tenant_id,))
+    pending_by_key = defaultdict(list)
+    pending_by_amount = defaultdict(list)
+    for payment_id, invoice_id, user_id, amount, payment_date in cursor.fetchall():
+        payment = {"id": payment_id, "invoice_id": invoice_id, "user_id": user_id, "amount": int(amount or 0),
+                   "date": _parse_date(payment_date) if payment_date else None}
+        pending_by_key[(payment["amount"], invoice_id)].append(payment)
+        pending_by_amount[payment["amount"]].append(payment)
+
+    cursor.execute("""
+        SELECT bank_ref FROM payments WHERE bank_tenant_id = ? AND bank_ref IS NOT NULL
+    """, (tenant_id,))
+    reconciled = {row[0] for row in cursor.fetchall()}
+    conn.close()
+
+    used_payments = set()
+    matched, unmatched, duplicates = [], [], []
+
+    def in_window(payment, date):
+        return payment["id"] not in used_payments and (payment["date"] is None or abs(payment["date"] - date) <= window)
+
+    def take_pending(line, payment):
+        used_payments.add(payment["id"])
+        invoice = invoices.get(payment["invoice_id"])
+        if invoice:
+            invoice["balance"] -= line["amount"]
+        matched.append({"line": line, "kind": "pending", "invoice_id": payment["invoice_id"],
+                        "payment_id": payment["id"], "user_id": payment["user_id"], "amount": line["amount"]})
+
+    def take_invoice(line, invoice):
+        invoice["balance"] -= line["amount"]
+        matched.append({"line": line, "kind": "invoice", "invoice_id": invoice["id"],
+                        "payment_id": None, "user_id": invoice["user_id"], "amount": line["amount"]})
+
+    for line in lines:
+        if line["bank_ref"] in reconciled:
+            duplicates.append(line)
+            continue
+        reconciled.add(line["bank_ref"])
+        amount, date = line["amount"], line["date"]
+
+        # 1. The reference names an invoice
+        done = False
+        for invoice_id in invoice_refs(line["reference"]):
+            pending = [p for p in pending_by_key.get((amount, invoice_id), ()) if in_window(p, date)]
+            if pending:
+                take_pending(line, pending[0])
+                done = True
+                break
+            invoice = invoices.get(invoice_id)
+            if invoice and 0 < amount <= invoice["balance"]:
+                take_invoice(line, invoice)
+                done = True
+                break
+        if done:
+            continue
+
+        # 2. Amount alone, only if it is unambiguous within the window
+        pending = [p for p in pending_by_amount.get(amount, ()) if in_window(p, date)]
+        if len(pending) == 1:
+            take_pending(line, pending[0])
+            continue
+        candidates = [i for i in invoices_by_amount.get(amount, ())
+                      if i["balance"] == amount and i["start"] <= date <= i["end"]]
+        if not pending and len(candidates) == 1:
+            take_invoice(line, candidates[0])
+            continue
+        unmatched.append(line)
+
+    return {"matched": matched, "unmatched": unmatched, "duplicates": duplicates}
+
+
+def apply_matches(tenant_id, matches, notify=True):
+    """
+    Record every match in one transaction: pending payments are verified, other
+    lines become verified bank-transfer payments, and each amount is added to its
+    invoice's balance. Confirmation emails are queued afterwards.
+    Returns {"applied": n, "skipped": n, "conflicts": n, "emails_queued": n}: skipped
+    pending payments were verified in the meantime, conflicts are lines whose bank
+    reference this tenant has already reconciled.
+    """
+    conn = get_db_connection(tenant_id)
+    cursor = conn.cursor()
+    applied = []
+    skipped = conflicts = 0
+    try:
+        # Write lock up front, so the reference check below can't race another import
+        cursor.execute("BEGIN IMMEDIATE")
+        for match in matches:
+            line = match["line"]
+            amount = line["amount"] / 100
+            cursor.execute("SELECT 1 FROM payments WHERE bank_tenant_id = ? AND bank_ref = ?",
+                           (tenant_id, line["bank_ref"]))
+            if cursor.fetchone():
+                conflicts += 1
+                continue
+            if match["kind"] == "pending":
+                # Skipped if it was verified in the meantime
+                cursor.execute("""
+                    UPDATE payments SET is_verified = 1, bank_ref = ?, bank_tenant_id = ?
+                    WHERE id = ? AND is_verified = 0
+                """, (line["bank_ref"], tenant_id, match["payment_id"]))
+            else:
+                cursor.execute("""
+                    INSERT INTO payments
+                        (user_id, invoice_id, amount, payment_date, payment_method, notes, is_verified,
+                         bank_ref, bank_tenant_id)
+                    VALUES (?, ?, ?, ?, 'Bank Transfer', ?, 1, ?, ?)
+                """, (match["user_id"], match["invoice_id"], amount, line["date"].isoformat(),
+                      line["reference"], line["bank_ref"], tenant_id))
+            if not cursor.rowcount:
+                skipped += 1
+                continue
+            balance_due, is_paid = apply_payment(cursor, match["invoice_id"], amount)
+            applied.append((match, balance_due, is_paid))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    queued = _queue_confirmations(tenant_id, applied) if notify and applied else 0
+    logger.info(f"🏦 Reconciled {len(applied)} of {len(matches)} statement lines for tenant {tenant_id}")
+    return {"applied": len(applied), "skipped": skipped, "conflicts": conflicts, "emails_queued": queued}
+
+
+def _queue_confirmations(tenant_id, applied):
+    recipients = user_contacts(tenant_id, [match["user_id"] for match, _, _ in applied if match["user_id"]])
+    messages = []
+    for match, balance_due, is_paid in applied:
+        if match["user_id"] not in recipients:
+            continue
+        email, username = recipients[match["user_id"]]
+        status = "The invoice is now paid in full." if is_paid else f"R{balance_due:.2f} remains due on this invoice."
+        messages.append((
+            email,
+            f"💰 Payment Received for Invoice #{match['invoice_id']}",
+            f"Hello {username},\n\n"
+            f"✅ We have received your payment of R{match['amount'] / 100:.2f} for Invoice #{match['invoice_id']} "
+            f"on {match['line']['date'].isoformat()}. {status}\n\n"
+            "Thank you for your payment!\n\nRegards,\nBilling Team",
+        ))
+    get_mail_outbox().send_many(messages)
+    return len(messages)
@@ -0,0 +1,87 @@
+# src/services/resend_log.py
+#
+# Asynchronous writer for verification_resend_log. Requests only enqueue a
+# row; a background worker drains the queue and inserts whatever has
+# accumulated (up to BATCH_SIZE rows, waiting at most FLUSH_SECONDS for more)
+# in one transaction, so a resend request never waits on the database lock.
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from db.database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+FLUSH_SECONDS = 0.5
+
+
+class ResendLogWriter:
+    """Queues resend-log rows and writes them in batches on a worker thread."""
+
+    def __init__(self):
+        self._outbox = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def log(self, user_id, status, reason="", ip_address="unknown"):
+        self._outbox.put((user_id, datetime.utcnow().isoformat(), ip_address, status, reason))
+        self._ensure_worker()
+
+    def flush(self):
+        """Block until every queued row has been written."""
+        self._outbox.join()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._write_loop, name="resend-log-writer", daemon=True)
+                    self._worker.start()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._outbox.get()]
+            deadline = time.monotonic() + FLUSH_SECONDS
+            try:
+                while len(batch) < BATCH_SIZE:
+                    batch.append(self._outbox.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error(f"❌ Failed to write {len(batch)} resend log rows: {e}")
+            finally:
+                for _ in batch:
+                    self._outbox.task_done()
+
+    def _write(self, rows):
+        conn = get_db_connection()
+        try:
+            conn.executemany("""
+                INSERT INTO verification_resend_log (user_id, timestamp, ip_address, status, reason)
+                VALUES (?, ?, ?, ?, ?)
+            """, rows)
+            conn.commit()
+        finally:
+            conn.close()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_resend_log_writer():
+    """Process-wide ResendLogWriter; queued rows are flushed at exit."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ResendLogWriter()
+                atexit.register(_writer.flush)
+    return _writer
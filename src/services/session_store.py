@@ -0,0 +1,154 @@
+# src/services/session_store.py
+#
+# Server-side sessions. At login the principal (user id, username, role,
+# tenant) is resolved once and stored with its permission set in the sessions
+# table; every process keeps the hottest sessions in an in-memory LRU, so a
+# render resolves identity and permissions with a dict lookup instead of
+# users queries. Sessions expire SESSION_TTL seconds after their last use and
+# can be ended from any process (the LRU entry elsewhere lives at most
+# SESSION_REVALIDATE_SECONDS longer).
+
+import itertools
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from config import settings
+from db.database import get_db_connection
+from utils.permissions import permissions_for
+
+logger = logging.getLogger(__name__)
+
+SESSION_REVALIDATE_SECONDS = 60
+TOUCH_EVERY_SECONDS = 300
+SWEEP_EVERY = 100  # logins between sweeps of expired sessions
+
+
+class SessionStore:
+    """sessions table with a per-process LRU of principals in front of it."""
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity or settings.SESSION_CACHE_SIZE
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # session_id -> (principal, checked_at)
+        self._logins = itertools.count(1)
+
+    def create(self, username, now=None):
+        """Open a session for username; returns the principal (with 'session_id'), or None if unknown."""
+        now = int(time.time() if now is None else now)
+        conn = get_db_connection()
+        try:
+            row = conn.execute(
+                "SELECT id, username, role, tenant_id FROM users WHERE username = ?", (username,)
+            ).fetchone()
+            if row is None:
+                return None
+            session_id = secrets.token_urlsafe(32)
+            conn.execute("""
+                INSERT INTO sessions (session_id, user_id, username, role, tenant_id, permissions, created_at, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (session_id, *row, ",".join(sorted(permissions_for(row[2]))), now, now))
+            conn.commit()
+        finally:
+            conn.close()
+        principal = self._principal(session_id, *row, permissions_for(row[2]), now)
+        self._remember(session_id, principal, now)
+        if next(self._logins) % SWEEP_EVERY == 0:
+            self.sweep_expired(now)
+        return principal
+
+    def get(self, session_id, now=None):
+        """The session's principal, or None if it doesn't exist or has expired."""
+        if not session_id:
+            return None
+        now = int(time.time() if now is None else now)
+        with self._lock:
+            cached = self._cache.get(session_id)
+            if cached is not None:
+                principal, checked_at = cached
+                if now - checked_at < SESSION_REVALIDATE_SECONDS and now - principal["last_seen"] < settings.SESSION_TTL:
+                    self._cache.move_to_end(session_id)
+                    return principal
+                del self._cache[session_id]
+
+        conn = get_db_connection()
+        try:
+            row = conn.execute("""
+                SELECT user_id, username, role, tenant_id, permissions, last_seen FROM sessions
+                WHERE session_id = ? AND last_seen > ?
+            """, (session_id, now - settings.SESSION_TTL)).fetchone()
+            if row is None:
+                return None
+            last_seen = row[5]
+            if now - last_seen >= TOUCH_EVERY_SECONDS:
+                # Sliding expiry, written at most every few minutes per session
+                conn.execute("UPDATE sessions SET last_seen = ? WHERE session_id = ?", (now, session_id))
+                conn.commit()
+                last_seen = now
+        finally:
+            conn.close()
+        permissions = frozenset(p for p in row[4].split(",") if p)
+        principal = self._principal(session_id, *row[:4], permissions, last_seen)
+        self._remember(session_id, principal, now)
+        return principal
+
+    def end(self, session_id):
+        with self._lock:
+            self._cache.pop(session_id, None)
+        conn = get_db_connection()
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        conn.commit()
+        conn.close()
+
+    def end_user_sessions(self, user_id):
+        """Log a user out everywhere (e.g. after a role or password change)."""
+        with self._lock:
+            for session_id in [sid for sid, (p, _) in self._cache.items() if p["user_id"] == user_id]:
+                del self._cache[session_id]
+        conn = get_db_connection()
+        conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        conn.commit()
+        conn.close()
+
+    def sweep_expired(self, now=None):
+        now = int(time.time() if now is None else now)
+        conn = get_db_connection()
+        deleted = conn.execute("DELETE FROM sessions WHERE last_seen <= ?", (now - settings.SESSION_TTL,)).rowcount
+        conn.commit()
+        conn.close()
+        return deleted
+
+    def _remember(self, session_id, principal, now):
+        with self._lock:
+            self._cache[session_id] = (principal, now)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+
+    @staticmethod
+    def _principal(session_id, user_id, username, role, tenant_id, permissions, last_seen):
+        return {
+            "session_id": session_id,
+            "user_id": user_id,
+            "username": username,
+            "role": role,
+            "tenant_id": tenant_id,
+            "permissions": permissions,
+            "last_seen": last_seen,
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Process-wide SessionStore shared by every Streamlit session."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SessionStore()
+    return _store
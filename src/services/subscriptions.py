@@ -0,0 +1,163 @@
+# src/services/subscriptions.py
+#
+# Active subscriptions per tenant. Each tenant's active rows are loaded once
+# into a read-only {user_id: (subscription_id, plan_id, start_date)} map (the
+# first active subscription by id wins, as in the billing engine) and shared
+# by the views, the usage meter and the billing runs, which ask for one user
+# or for a whole tenant in bulk.
+#
+# As with the catalogue, subscription_versions holds a counter per tenant.
+# assign_plan() and cancel_subscription() change the subscription, write the
+# subscription_audit event and bump the counter in one transaction; a lookup
+# reads that one row and reloads the tenant only when the counter has moved,
+# so changes made by any process are picked up on the next lookup.
+
+import logging
+import threading
+from datetime import datetime
+from types import MappingProxyType
+
+from db.database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+
+class TenantSubscriptions:
+    """Read-only snapshot of one tenant's active subscriptions at a given version."""
+
+    __slots__ = ("tenant_id", "version", "by_user")
+
+    def __init__(self, tenant_id, version, by_user):
+        self.tenant_id = tenant_id
+        self.version = version
+        self.by_user = MappingProxyType(by_user)
+
+
+def load_subscriptions(cursor, tenant_id, version=0):
+    cursor.execute("""
+        SELECT id, user_id, plan_id, start_date FROM subscriptions
+        WHERE tenant_id = ? AND is_active = 1
+        ORDER BY id
+    """, (tenant_id,))
+    by_user = {}
+    for subscription_id, user_id, plan_id, start_date in cursor.fetchall():
+        by_user.setdefault(user_id, (subscription_id, plan_id, start_date))
+    return TenantSubscriptions(tenant_id, version, by_user)
+
+
+def subscription_version(cursor, tenant_id):
+    """(database file, version) for the tenant; the file keys the in-process cache."""
+    cursor.execute("""
+        SELECT (SELECT file FROM pragma_database_list WHERE name = 'main'),
+               (SELECT version FROM subscription_versions WHERE tenant_id = ?)
+    """, (tenant_id,))
+    database, version = cursor.fetchone()
+    return database, version or 0
+
+
+def bump_subscription_version(cursor, tenant_id):
+    """Mark a tenant's subscriptions as changed; call inside the transaction that changed them."""
+    cursor.execute("""
+        INSERT INTO subscription_versions (tenant_id, version, updated_at)
+        VALUES (?, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT (tenant_id)
+        DO UPDATE SET version = version + 1, updated_at = excluded.updated_at
+    """, (tenant_id,))
+
+
+_subscriptions = {}  # (database file, tenant_id) -> TenantSubscriptions
+_subscriptions_lock = threading.Lock()
+
+
+def get_subscriptions(cursor, tenant_id):
+    """Current TenantSubscriptions for the tenant, reloaded only when its version has moved."""
+    database, version = subscription_version(cursor, tenant_id)
+    key = (database, tenant_id)
+    snapshot = _subscriptions.get(key)
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    snapshot = load_subscriptions(cursor, tenant_id, version)
+    with _subscriptions_lock:
+        current = _subscriptions.get(key)
+        if current is None or current.version <= version:
+            _subscriptions[key] = snapshot
+    logger.info(f"📇 Subscriptions loaded for tenant {tenant_id} (version {version}, {len(snapshot.by_user)} active)")
+    return snapshot
+
+
+def active_subscription(cursor, tenant_id, user_id):
+    """(subscription_id, plan_id, start_date) of the user's active subscription, or None."""
+    return get_subscriptions(cursor, tenant_id).by_user.get(user_id)
+
+
+def active_plan(cursor, tenant_id, user_id):
+    subscription = active_subscription(cursor, tenant_id, user_id)
+    return subscription[1] if subscription else None
+
+
+def active_plans(cursor, tenant_id, user_ids=None):
+    """{user_id: plan_id} for every active subscriber of the tenant, or just the given users."""
+    by_user = get_subscriptions(cursor, tenant_id).by_user
+    if user_ids is None:
+        return {user_id: sub[1] for user_id, sub in by_user.items()}
+    return {user_id: by_user[user_id][1] for user_id in user_ids if user_id in by_user}
+
+
+def _change(tenant_id, user_id, new_plan_id):
+    """End the user's active subscription and optionally start new_plan_id, with its audit event."""
+    now = datetime.utcnow()
+    conn = get_db_connection(tenant_id)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("""
+            SELECT plan_id FROM subscriptions
+            WHERE user_id = ? AND tenant_id = ? AND is_active = 1
+            ORDER BY id LIMIT 1
+        """, (user_id, tenant_id))
+        row = cursor.fetchone()
+        old_plan_id = row[0] if row else None
+        if old_plan_id == new_plan_id:
+            conn.rollback()
+            return None
+
+        cursor.execute("""
+            UPDATE subscriptions SET is_active = 0, end_date = ?
+            WHERE user_id = ? AND tenant_id = ? AND is_active = 1
+        """, (now.strftime("%Y-%m-%d"), user_id, tenant_id))
+        if new_plan_id is not None:
+            cursor.execute("""
+                INSERT INTO subscriptions (user_id, tenant_id, plan_id, start_date, is_active)
+                VALUES (?, ?, ?, ?, 1)
+            """, (user_id, tenant_id, new_plan_id, now.strftime("%Y-%m-%d")))
+            # A plan change while subscribed is a switch, so proration can split the month
+            action = "switched" if old_plan_id else "subscribed"
+        else:
+            action = "cancelled"
+        cursor.execute("""
+            INSERT INTO subscription_audit (user_id, tenant_id, action, old_plan_id, new_plan_id, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (user_id, tenant_id, action, old_plan_id, new_plan_id, now.isoformat()))
+        bump_subscription_version(cursor, tenant_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    # Imported here: the preview cache builds on the pricing paths that use this module
+    from services.invoice_preview_cache import invalidate_pricing
+    invalidate_pricing(tenant_id)
+    return action
+
+
+def assign_plan(tenant_id, user_id, plan_id):
+    """Put the user on plan_id; returns 'subscribed', 'switched', or None if already on it."""
+    return _change(tenant_id, user_id, plan_id)
+
+
+def cancel_subscription(tenant_id, user_id):
+    """End the user's active subscription; returns 'cancelled', or None if there was none."""
+    return _change(tenant_id, user_id, None)
@@ -0,0 +1,115 @@
+# src/services/token_store.py
+#
+# Single-use tokens for email verification and password resets. Only the
+# SHA-256 of a token is stored (auth_tokens, keyed by the hash), with its
+# purpose, user and an integer expiry, so a lookup is one primary-key probe
+# and a leaked table cannot be replayed. Redeeming deletes the row in the same
+# statement that reads it. Expired rows are removed by a background sweeper
+# started with the first token issued in the process.
+
+import hashlib
+import logging
+import secrets
+import threading
+import time
+
+from db.database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+VERIFY = "verify"
+RESET = "reset"
+TOKEN_TTL_SECONDS = {
+    VERIFY: 7 * 24 * 3600,
+    RESET: 30 * 60,
+}
+SWEEP_INTERVAL_SECONDS = 3600
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_token(user_id, purpose, ttl=None, now=None):
+    """
+    New token for user_id; returns the raw token, which is never stored.
+    Earlier tokens of the same purpose for the user stop working.
+    """
+    now = int(time.time() if now is None else now)
+    token = secrets.token_urlsafe(32)
+    conn = get_db_connection()
+    try:
+        conn.execute("DELETE FROM auth_tokens WHERE user_id = ? AND purpose = ?", (user_id, purpose))
+        conn.execute("""
+            INSERT INTO auth_tokens (token_hash, purpose, user_id, created_at, expires_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (hash_token(token), purpose, user_id, now, now + (ttl or TOKEN_TTL_SECONDS[purpose])))
+        conn.commit()
+    finally:
+        conn.close()
+    start_sweeper()
+    return token
+
+
+def peek_token(token, purpose, now=None):
+    """user_id the token belongs to if it is valid, without using it up; else None."""
+    now = int(time.time() if now is None else now)
+    conn = get_db_connection()
+    row = conn.execute("""
+        SELECT user_id FROM auth_tokens
+        WHERE token_hash = ? AND purpose = ? AND expires_at > ?
+    """, (hash_token(token), purpose, now)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def consume_token(token, purpose, now=None):
+    """Redeem a token: returns its user_id and deletes it, or None if invalid or expired."""
+    now = int(time.time() if now is None else now)
+    conn = get_db_connection()
+    try:
+        # DELETE ... RETURNING is atomic, so two concurrent redemptions can't both succeed
+        row = conn.execute("""
+            DELETE FROM auth_tokens
+            WHERE token_hash = ? AND purpose = ? AND expires_at > ?
+            RETURNING user_id
+        """, (hash_token(token), purpose, now)).fetchone()
+        conn.commit()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def sweep_expired(now=None):
+    """Delete expired tokens; returns how many were removed."""
+    now = int(time.time() if now is None else now)
+    conn = get_db_connection()
+    try:
+        deleted = conn.execute("DELETE FROM auth_tokens WHERE expires_at <= ?", (now,)).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    if deleted:
+        logger.info(f"🧹 Swept {deleted} expired auth tokens")
+    return deleted
+
+
+def _sweep_loop():
+    while True:
+        time.sleep(SWEEP_INTERVAL_SECONDS)
+        try:
+            sweep_expired()
+        except Exception as e:
+            logger.warning(f"⚠️ Token sweep failed: {e}")
+
+
+def start_sweeper():
+    global _sweeper
+    if _sweeper is None or not _sweeper.is_alive():
+        with _sweeper_lock:
+            if _sweeper is None or not _sweeper.is_alive():
+                _sweeper = threading.Thread(target=_sweep_loop, name="auth-token-sweeper", daemon=True)
+                _sweeper.start()
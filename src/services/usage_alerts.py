@@ -0,0 +1,215 @@
+# src/services/usage_alerts.py
+#
+# Threshold alerting on ingest. When the usage meter reports changed counters,
+# each (user, metric) is checked against 80/90/100% of its plan metric limit.
+# A crossing is written to usage_notifications once per period (enforced by a
+# unique key) and queued for email delivery on a background worker, so neither
+# ingestion nor page renders wait on SMTP. A notification is marked delivered
+# only once the email went out; failed sends are queued again after
+# RETRY_SECONDS and, after a restart, by deliver_pending(). A sender first
+# claims the row (claimed_at), so the same notification queued twice, or by
+# two processes, is emailed once; a claim older than CLAIM_SECONDS is treated
+# as abandoned by a crashed sender.
+
+import logging
+import queue
+import threading
+from datetime import datetime, timedelta
+
+from db.database import get_db_connection, query_all_tenants
+from services.usage_meter import current_period, get_usage_meter
+from utils.email_utils import send_usage_alert_email
+
+logger = logging.getLogger(__name__)
+
+THRESHOLDS = (80, 90, 100)  # percent of plan_metric_limits.metric_limit
+RETRY_SECONDS = 300
+CLAIM_SECONDS = 600
+
+
+def crossed_thresholds(used, limit):
+    """Thresholds (in percent) reached by `used` against `limit`."""
+    if not limit:
+        return []
+    return [pct for pct in THRESHOLDS if used * 100 >= pct * limit]
+
+
+class UsageAlertEngine:
+    """Evaluates thresholds incrementally and delivers notifications asynchronously."""
+
+    def __init__(self, meter=None):
+        self.meter = meter or get_usage_meter()
+        # (tenant_id, period, user_id, metric_id) -> highest threshold already stored
+        self._fired = {}
+        self._lock = threading.Lock()
+        self._outbox = queue.Queue()
+        self._worker = None
+
+    def on_usage_changed(self, tenant_id, changed):
+        """Usage meter listener: record and queue any newly crossed thresholds."""
+        period, _, _ = current_period()
+        rows = []
+        with self._lock:
+            for (user_id, metric_id), used in changed.items():
+                _, limit = self.meter.usage_vs_limit(tenant_id, user_id, metric_id)
+                key = (tenant_id, period, user_id, metric_id)
+                already = self._fired.get(key, 0)
+                new = [pct for pct in crossed_thresholds(used, limit) if pct > already]
+                rows.extend((tenant_id, user_id, metric_id, period, pct, used, limit) for pct in new)
+
+        if not rows:
+            return
+        inserted = self._store(tenant_id, rows)
+        if inserted is None:
+            # Nothing was stored, so the next change for these counters tries again
+            return
+        with self._lock:
+            # Every row is now in the table, written here or by another process
+            for _, user_id, metric_id, _, pct, _, _ in rows:
+                key = (tenant_id, period, user_id, metric_id)
+                self._fired[key] = max(self._fired.get(key, 0), pct)
+        for notification_id in inserted:
+            self._outbox.put((tenant_id, notification_id))
+        if inserted:
+            self._ensure_worker()
+
+    def deliver_pending(self):
+        """Re-queue notifications that were stored but never delivered (e.g. after a restart)."""
+        pending = query_all_tenants(
+            "SELECT tenant_id, id FROM usage_notifications WHERE delivered_at IS NULL ORDER BY id"
+        )
+        for tenant_id, notification_id in pending:
+            self._outbox.put((tenant_id, notification_id))
+        if pending:
+            self._ensure_worker()
+        return len(pending)
+
+    def _store(self, tenant_id, rows):
+        """Insert notification rows; returns the ids written here, or None if the insert failed."""
+        conn = get_db_connection(tenant_id)
+        cursor = conn.cursor()
+        inserted = []
+        try:
+            for row in rows:
+                # The unique key makes each crossing fire once per period,
+                # even across processes or after a restart
+                cursor.execute("""
+                    INSERT OR IGNORE INTO usage_notifications
+                        (tenant_id, user_id, metric_id, period, threshold, used, metric_limit)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, row)
+                if cursor.rowcount:
+                    inserted.append(cursor.lastrowid)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"❌ Failed to store usage notifications: {e}")
+            inserted = None
+        finally:
+            conn.close()
+        return inserted
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._deliver_loop, name="usage-alert-delivery", daemon=True)
+            self._worker.start()
+
+    def _deliver_loop(self):
+        while True:
+            tenant_id, notification_id = self._outbox.get()
+            try:
+                self._deliver(tenant_id, notification_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Usage alert {notification_id} not delivered: {e}")
+            finally:
+                self._outbox.task_done()
+
+    def _deliver(self, tenant_id, notification_id):
+        now = datetime.utcnow()
+        stale = (now - timedelta(seconds=CLAIM_SECONDS)).isoformat()
+        conn = get_db_connection(tenant_id)
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE usage_notifications SET claimed_at = ?
+            WHERE id = ? AND delivered_at IS NULL AND (claimed_at IS NULL OR claimed_at < ?)
+            RETURNING id
+        """, (now.isoformat(), notification_id, stale))
+        claimed = cursor.fetchone()
+        conn.commit()
+        if not claimed:
+            # Delivered already, or another sender holds it
+            conn.close()
+            return
+
+        cursor.execute("""
+            SELECT u.email, u.first_name, m.name, n.used, n.metric_limit, n.threshold
+            FROM usage_notifications n
+            JOIN users u ON u.id = n.user_id
+            JOIN usage_metrics m ON m.id = n.metric_id
+            WHERE n.id = ?
+        """, (notification_id,))
+        row = cursor.fetchone()
+        if not row:
+            conn.close()
+            return
+
+        email, first_name, metric_name, used, limit, threshold = row
+        if not send_usage_alert_email(email, first_name, metric_name, used, limit, threshold):
+            cursor.execute("UPDATE usage_notifications SET claimed_at = NULL WHERE id = ?", (notification_id,))
+            conn.commit()
+            conn.close()
+            logger.warning(f"⚠️ Usage alert {notification_id} not sent; retrying in {RETRY_SECONDS}s")
+            retry = threading.Timer(RETRY_SECONDS, self._outbox.put, ((tenant_id, notification_id),))
+            retry.daemon = True
+            retry.start()
+            return
+        cursor.execute(
+            "UPDATE usage_notifications SET delivered_at = ? WHERE id = ?",
+            (datetime.utcnow().isoformat(), notification_id)
+        )
+        conn.commit()
+        conn.close()
+        logger.info(f"📧 Usage alert {notification_id} sent to {email}")
+
+
+def get_period_notifications(tenant_id, user_id=None, period=None):
+    """
+    Highest threshold reached per (user, metric) this period, newest first:
+    [(username, metric_name, threshold, used, metric_limit, created_at)].
+    """
+    period = period or current_period()[0]
+    query = """
+        SELECT u.username, m.name, MAX(n.threshold), MAX(n.used), n.metric_limit, MAX(n.created_at)
+        FROM usage_notifications n
+        JOIN users u ON u.id = n.user_id
+        JOIN usage_metrics m ON m.id = n.metric_id
+        WHERE n.tenant_id = ? AND n.period = ?
+    """
+    params = [tenant_id, period]
+    if user_id is not None:
+        query += " AND n.user_id = ?"
+        params.append(user_id)
+    query += " GROUP BY n.user_id, n.metric_id ORDER BY MAX(n.created_at) DESC"
+
+    conn = get_db_connection(tenant_id)
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def install_usage_alerts():
+    """Hook the alert engine into the process-wide usage meter (idempotent)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = UsageAlertEngine()
+                _engine.meter.add_listener(_engine.on_usage_changed)
+                _engine.deliver_pending()
+    return _engine
@@ -0,0 +1,65 @@
+# src/services/usage_import.py
+#
+# Usage CSV import shared by the admin upload page and the benchmarks.
+
+from datetime import datetime
+
+import pandas as pd
+
+from db.database import get_db_connection
+from services.usage_meter import get_usage_meter
+
+REQUIRED_COLUMNS = {"user_id", "metric_name", "usage_amount", "usage_date"}
+
+
+def import_usage_csv(tenant_id, csv_file):
+    """
+    Insert the rows of a `user_id, metric_name, usage_amount, usage_date` CSV
+    into usage_records and fold them into the usage meter. Returns
+    (valid_rows, failed_rows) with failed_rows as [(csv line, reason)].
+    Raises ValueError if required columns are missing.
+    """
+    df = pd.read_csv(csv_file)
+    if not REQUIRED_COLUMNS.issubset(set(df.columns)):
+        raise ValueError(f"CSV must contain columns: {', '.join(REQUIRED_COLUMNS)}")
+
+    conn = get_db_connection(tenant_id)
+    cursor = conn.cursor()
+
+    # Fetch all valid metrics for this tenant
+    cursor.execute("SELECT id, name FROM usage_metrics WHERE tenant_id = ?", (tenant_id,))
+    metric_map = {name: mid for mid, name in cursor.fetchall()}
+
+    valid_rows = 0
+    failed_rows = []
+
+    for index, row in df.iterrows():
+        user_id = row["user_id"]
+        metric_name = row["metric_name"]
+        usage_amount = row["usage_amount"]
+        usage_date = row["usage_date"]
+
+        metric_id = metric_map.get(metric_name)
+        if not metric_id:
+            failed_rows.append((index + 2, f"Unknown metric: {metric_name}"))
+            continue
+
+        try:
+            usage_amount = int(usage_amount)
+            usage_date_parsed = datetime.strptime(str(usage_date), "%Y-%m-%d").date()
+
+            cursor.execute("""
+                INSERT INTO usage_records (user_id, tenant_id, metric_id, metric_name, usage_amount, usage_date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (int(user_id), tenant_id, metric_id, metric_name, usage_amount, usage_date_parsed))
+            valid_rows += 1
+
+        except Exception as e:
+            failed_rows.append((index + 2, str(e)))
+
+    conn.commit()
+    conn.close()
+
+    # Fold the new rows into the live month-to-date counters
+    get_usage_meter().sync(tenant_id)
+    return valid_rows, failed_rows
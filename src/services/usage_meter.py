@@ -0,0 +1,309 @@
+# src/services/usage_meter.py
+#
+# Live month-to-date usage counters per (user, metric), kept in memory so
+# dashboards, threshold alerts and invoice previews can read "current usage vs
+# limit" without re-aggregating usage_records on every page load.
+#
+# Counters track usage_records up to a high-water record id. The ingestion path
+# calls sync() after committing, which folds in only the rows above that id
+# (a rowid range scan), so writers in other processes are picked up as well.
+# Counters are checkpointed to usage_counters so a restart resumes from the
+# checkpoint instead of re-summing the whole month; a checkpoint is a complete
+# snapshot at one high-water id, and an older snapshot from another process
+# never replaces a newer one. Plan limits are indexed by user and reloaded when
+# the tenant's catalogue or subscription version moves; the version is checked
+# alongside each sync, so lookups between syncs touch no database at all.
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from db.database import get_db_connection
+from services.catalogue import get_catalogue, pricing_version
+from services.subscriptions import active_plans
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_INTERVAL_SECONDS = 300
+SYNC_INTERVAL_SECONDS = 5
+
+
+def current_period(today=None):
+    """Return ('YYYY-MM', first day, last day) of the month containing today."""
+    today = today or datetime.utcnow()
+    start = today.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start.strftime("%Y-%m"), start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+
+class _TenantCounters:
+    __slots__ = ("period", "start_date", "end_date", "last_record_id", "usage",
+                 "limits", "limits_version", "dirty", "pending", "synced_at", "checkpointed_at")
+
+    def __init__(self, period, start_date, end_date):
+        self.period = period
+        self.start_date = start_date
+        self.end_date = end_date
+        self.last_record_id = 0
+        self.usage = {}        # (user_id, metric_id) -> month-to-date total
+        self.limits = None     # user_id -> {metric_id: (metric_name, metric_limit)}
+        self.limits_version = None  # pricing_version() the limits were loaded at
+        self.dirty = set()
+        self.pending = {}      # changes folded in by lookups, not yet reported to listeners
+        self.synced_at = 0.0
+        self.checkpointed_at = time.monotonic()
+
+
+class UsageMeter:
+    """In-memory month-to-date usage counters, one set per tenant."""
+
+    def __init__(self, checkpoint_interval=CHECKPOINT_INTERVAL_SECONDS, sync_interval=SYNC_INTERVAL_SECONDS):
+        self.checkpoint_interval = checkpoint_interval
+        self.sync_interval = sync_interval
+        self._tenants = {}
+        self._lock = threading.RLock()
+        self._listeners = []
+
+    # --- Ingestion -------------------------------------------------------
+
+    def sync(self, tenant_id):
+        """
+        Fold usage_records rows written since the last sync into the counters.
+        Returns {(user_id, metric_id): new_total} for the counters that changed.
+        """
+        with self._lock:
+            was_loaded = tenant_id in self._tenants and self._tenants[tenant_id].period == current_period()[0]
+            counters = self._ensure_loaded(tenant_id)
+            self._sync(tenant_id, counters)
+            changed, counters.pending = counters.pending, {}
+            if not was_loaded:
+                # A cold load already folded in the new rows; report every counter
+                changed = dict(counters.usage)
+            self._maybe_checkpoint(tenant_id, counters)
+
+        if changed:
+            for listener in list(self._listeners):
+                try:
+                    listener(tenant_id, changed)
+                except Exception as e:
+                    logger.warning(f"⚠️ Usage meter listener failed: {e}")
+        return changed
+
+    def refresh(self, tenant_id):
+        """sync() at most once per sync interval; cheap enough to call on every read."""
+        with self._lock:
+            counters = self._tenants.get(tenant_id)
+            if (counters and counters.period == current_period()[0] and not counters.pending
+                    and time.monotonic() - counters.synced_at < self.sync_interval):
+                return {}
+        return self.sync(tenant_id)
+
+    def add_listener(self, callback):
+        """Register callback(tenant_id, changed) to run after counters change."""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    # --- Lookups ---------------------------------------------------------
+
+    def usage(self, tenant_id, user_id, metric_id):
+        """Month-to-date usage for one user and metric."""
+        with self._lock:
+            counters = self._fresh(tenant_id)
+            return counters.usage.get((user_id, metric_id), 0)
+
+    def usage_vs_limit(self, tenant_id, user_id, metric_id):
+        """Return (used, limit) for one user and metric; limit is None if the plan has none."""
+        with self._lock:
+            counters = self._fresh(tenant_id)
+            limit = counters.limits.get(user_id, {}).get(metric_id)
+            return counters.usage.get((user_id, metric_id), 0), (limit[1] if limit else None)
+
+    def user_usage(self, tenant_id, user_id):
+        """
+        Usage vs limit for every metric on the user's active plan:
+        [{"metric_id", "metric_name", "used", "limit"}].
+        """
+        with self._lock:
+            counters = self._fresh(tenant_id)
+            return [
+                {"metric_id": metric_id, "metric_name": name, "used": counters.usage.get((user_id, metric_id), 0), "limit": limit}
+                for metric_id, (name, limit) in counters.limits.get(user_id, {}).items()
+            ]
+
+    def tenant_usage(self, tenant_id):
+        """Usage vs limit for every (user, metric) on an active plan in the tenant."""
+        with self._lock:
+            counters = self._fresh(tenant_id)
+            return [
+                {"user_id": uid, "metric_id": metric_id, "metric_name": name,
+                 "used": counters.usage.get((uid, metric_id), 0), "limit": limit}
+                for uid, user_limits in counters.limits.items()
+                for metric_id, (name, limit) in user_limits.items()
+            ]
+
+    def invalidate_limits(self, tenant_id=None):
+        """Drop cached plan limits after a plan, limit or subscription change."""
+        with self._lock:
+            targets = [self._tenants.get(tenant_id)] if tenant_id is not None else self._tenants.values()
+            for counters in targets:
+                if counters:
+                    counters.limits = None
+
+    # --- Checkpointing ---------------------------------------------------
+
+    def checkpoint(self, tenant_id=None):
+        """Persist the counters and the high-water record id."""
+        with self._lock:
+            tenant_ids = [tenant_id] if tenant_id is not None else list(self._tenants)
+            for tid in tenant_ids:
+                counters = self._tenants.get(tid)
+                if counters:
+                    self._checkpoint(tid, counters)
+
+    # --- Internals -------------------------------------------------------
+
+    def _fresh(self, tenant_id):
+        counters = self._ensure_loaded(tenant_id)
+        if time.monotonic() - counters.synced_at >= self.sync_interval:
+            self._sync(tenant_id, counters)
+        if counters.limits is None:
+            conn = get_db_connection(tenant_id)
+            cursor = conn.cursor()
+            counters.limits_version = pricing_version(cursor, tenant_id)
+            counters.limits = self._load_limits(cursor, tenant_id)
+            conn.close()
+        return counters
+
+    def _ensure_loaded(self, tenant_id):
+        period, start_date, end_date = current_period()
+        counters = self._tenants.get(tenant_id)
+        if counters and counters.period == period:
+            return counters
+
+        if counters:
+            # Month rolled over: flush the old period before starting a new one
+            self._checkpoint(tenant_id, counters)
+
+        counters = _TenantCounters(period, start_date, end_date)
+        conn = get_db_connection(tenant_id)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT last_record_id FROM usage_counter_checkpoints
+            WHERE tenant_id = ? AND period = ?
+        """, (tenant_id, period))
+        row = cursor.fetchone()
+        if row:
+            counters.last_record_id = row[0]
+            cursor.execute("""
+                SELECT user_id, metric_id, total_usage FROM usage_counters
+                WHERE tenant_id = ? AND period = ?
+            """, (tenant_id, period))
+            counters.usage = {(user_id, metric_id): total for user_id, metric_id, total in cursor.fetchall()}
+        conn.close()
+
+        self._tenants[tenant_id] = counters
+        self._sync(tenant_id, counters)
+        return counters
+
+    def _sync(self, tenant_id, counters):
+        conn = get_db_connection(tenant_id)
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(id) FROM usage_records")
+        high_water = cursor.fetchone()[0] or 0
+
+        changed = {}
+        if high_water > counters.last_record_id:
+            cursor.execute("""
+                SELECT user_id, metric_id, SUM(usage_amount)
+                FROM usage_records
+                WHERE id > ? AND id <= ? AND tenant_id = ? AND usage_date BETWEEN ? AND ?
+                GROUP BY user_id, metric_id
+            """, (counters.last_record_id, high_water, tenant_id, counters.start_date, counters.end_date))
+            for user_id, metric_id, amount in cursor.fetchall():
+                key = (user_id, metric_id)
+                counters.usage[key] = counters.usage.get(key, 0) + (amount or 0)
+                counters.dirty.add(key)
+                changed[key] = counters.usage[key]
+            counters.pending.update(changed)
+            counters.last_record_id = high_water
+        # Plan, limit or subscription changes from any process drop the limits
+        if counters.limits is not None and pricing_version(cursor, tenant_id) != counters.limits_version:
+            counters.limits = None
+        conn.close()
+
+        counters.synced_at = time.monotonic()
+        return changed
+
+    def _load_limits(self, cursor, tenant_id):
+        catalogue = get_catalogue(cursor, tenant_id)
+        limits = {}
+        # First active subscription wins, as in the billing engine
+        for user_id, plan_id in active_plans(cursor, tenant_id).items():
+            for _, metric_id, metric_name, metric_limit, *_ in catalogue.limits_for(plan_id):
+                limits.setdefault(user_id, {}).setdefault(metric_id, (metric_name, metric_limit))
+        return limits
+
+    def _maybe_checkpoint(self, tenant_id, counters):
+        if time.monotonic() - counters.checkpointed_at >= self.checkpoint_interval:
+            self._checkpoint(tenant_id, counters)
+
+    def _checkpoint(self, tenant_id, counters):
+        """
+        Save the full counter set with its high-water id in one transaction.
+        Every process folds the same usage_records rows, so a checkpoint at a
+        higher id already covers this one and is never overwritten by it.
+        """
+        rows = [
+            (tenant_id, counters.period, user_id, metric_id, total)
+            for (user_id, metric_id), total in counters.usage.items()
+        ]
+        conn = get_db_connection(tenant_id)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("""
+                SELECT last_record_id FROM usage_counter_checkpoints
+                WHERE tenant_id = ? AND period = ?
+            """, (tenant_id, counters.period))
+            row = cursor.fetchone()
+            saved = row[0] if row else -1
+            if saved > counters.last_record_id or (saved == counters.last_record_id and not counters.dirty):
+                conn.rollback()
+            else:
+                cursor.executemany("""
+                    INSERT INTO usage_counters (tenant_id, period, user_id, metric_id, total_usage, updated_at)
+                    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT (tenant_id, period, user_id, metric_id)
+                    DO UPDATE SET total_usage = excluded.total_usage, updated_at = excluded.updated_at
+                """, rows)
+                cursor.execute("""
+                    INSERT INTO usage_counter_checkpoints (tenant_id, period, last_record_id, checkpointed_at)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT (tenant_id, period)
+                    DO UPDATE SET last_record_id = MAX(last_record_id, excluded.last_record_id),
+                                  checkpointed_at = excluded.checkpointed_at
+                """, (tenant_id, counters.period, counters.last_record_id))
+                conn.commit()
+            counters.dirty.clear()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"❌ Usage counter checkpoint failed for tenant {tenant_id}: {e}")
+        finally:
+            conn.close()
+        counters.checkpointed_at = time.monotonic()
+
+
+_meter = None
+_meter_lock = threading.Lock()
+
+
+def get_usage_meter():
+    """Process-wide UsageMeter shared by every Streamlit session."""
+    global _meter
+    if _meter is None:
+        with _meter_lock:
+            if _meter is None:
+                _meter = UsageMeter()
+    return _meter
@@ -55,8 +55,10 @@ def send_email(to_email, subject, body_text, body_html=None):
             server.login(EMAIL_USER, EMAIL_PASSWORD)
             server.sendmail(EMAIL_USER, to_email, msg.as_string())
         print(f"✅ Email sent to {to_email}")
+        return True
     except Exception as e:
         print(f"❌ Error sending email to {to_email}: {e}")
+        return False
 
 
 
@@ -88,6 +90,29 @@ def send_email_with_attachment(to_email, subject, body_text, filename, pdf_bytes
         print(f"❌ Failed to send email: {e}")
 
 
+def send_emails(messages):
+    """Send [(to_email, subject, body_text)] over one SMTP connection; returns how many went out."""
+    sent = 0
+    try:
+        with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as server:
+            server.starttls()
+            server.login(EMAIL_USER, EMAIL_PASSWORD)
+            for to_email, subject, body_text in messages:
+                msg = MIMEText(body_text, "plain")
+                msg["Subject"] = subject
+                msg["From"] = EMAIL_SENDER
+                msg["To"] = to_email
+                try:
+                    server.sendmail(EMAIL_SENDER, to_email, msg.as_string())
+                    sent += 1
+                except smtplib.SMTPRecipientsRefused as e:
+                    print(f"❌ Error sending email to {to_email}: {e}")
+        print(f"✅ Sent {sent} of {len(messages)} emails")
+    except Exception as e:
+        print(f"❌ Error sending {len(messages)} emails: {e}")
+    return sent
+
+
 
 def email_billing_report_to_admin(tenant_id, start_date, end_date):
     print(f"Generating billing report for tenant_id {tenant_id} from {start_date} to {end_date}")
@@ -137,23 +162,30 @@ def send_password_reset_email(to_email, username, token):
 
     send_email(to_email=to_email, subject="Reset Your Password", body_text=text_content, body_html=html_content)
 
-def send_usage_alert_email(to_email, username, metric_name, usage, limit):
+def send_usage_alert_email(to_email, username, metric_name, usage, limit, threshold=100):
+    """Usage alert for a crossed threshold (percent of limit); returns True if it was sent."""
     # HTML and plain versions
     html_template = templates_env.get_template("usage_alert.html")
     html_content = html_template.render(
         username=username,
         metric_name=metric_name,
-        usage=usage,
-        limit=limit
+        percent_used=round(usage * 100 / limit) if limit else threshold,
+        current_usage=usage,
+        plan_limit=limit,
+        app_name="TrackBilling",
     )
 
+    if limit and usage > limit:
+        status = f"which exceeds your limit of {limit}"
+    else:
+        status = f"which is {threshold}% of your limit of {limit}"
     text_content = (
         f"Hi {username},\n\n"
         f"Your usage for {metric_name} has reached {usage}, "
-        f"which exceeds your limit of {limit}.\n\n"
+        f"{status}.\n\n"
         "Please consider upgrading your plan."
     )
 
-    send_email(to_email, f"⚠️ Usage Alert: {metric_name}", text_content, html_content)
+    return send_email(to_email, f"⚠️ Usage Alert: {metric_name}", text_content, html_content)
 
 
@@ -1,19 +1,122 @@
+# src/utils/login_attempts.py
+#
+# Login rate limiting shared by every Streamlit process. Failed attempts are
+# counted per key ("user:<username>" and "addr:<client address>") in a small
+# SQLite file (LOGIN_ATTEMPTS_DB) with a sliding-window counter: the current
+# and previous fixed windows are kept on one row, and the previous count is
+# weighted by how much of it still overlaps the sliding window. A check is one
+# primary-key read and a failed login one atomic upsert, so concurrent
+# processes never lose counts. The file runs in WAL mode with one connection
+# per thread, which keeps the write path well above thousands of attempts per
+# second. Rows idle for two windows are swept every SWEEP_EVERY writes.
+
+import itertools
+import os
+import sqlite3
+import threading
 import time
-from collections import defaultdict
 
-# username → [timestamps]
-attempt_log = defaultdict(list)
-MAX_ATTEMPTS = 5
+from config import settings
+
+MAX_ATTEMPTS = 5               # per username
+MAX_ATTEMPTS_PER_ADDRESS = 20  # per client address, across usernames
 WINDOW_SECONDS = 300  # 5 minutes
+SWEEP_EVERY = 1000
+
+_writes = itertools.count(1)
+_local = threading.local()
+
+
+def limiter_db_path():
+    return settings.LOGIN_ATTEMPTS_DB or os.path.join(os.path.dirname(settings.DB_FILE), "login_attempts.db")
+
+
+def _connection():
+    path = limiter_db_path()
+    conn = getattr(_local, "connections", {}).get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10)
+        conn.execute("PRAGMA journal_mode = WAL")
+        # Losing the last few counts on power failure is fine for a rate limiter
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS login_attempts (
+                key TEXT PRIMARY KEY,            -- 'user:<username>' or 'addr:<client address>'
+                window_start INTEGER NOT NULL,   -- epoch seconds of the current fixed window
+                count INTEGER NOT NULL DEFAULT 0,
+                prev_count INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_login_attempts_window ON login_attempts (window_start);
+        """)
+        _local.connections = {**getattr(_local, "connections", {}), path: conn}
+    return conn
+
 
-def is_rate_limited(username):
-    now = time.time()
-    recent_attempts = [ts for ts in attempt_log[username] if now - ts < WINDOW_SECONDS]
-    attempt_log[username] = recent_attempts
+def _keys(username, client_address):
+    keys = [(f"user:{username.strip().lower()}", MAX_ATTEMPTS)]
+    if client_address:
+        keys.append((f"addr:{client_address}", MAX_ATTEMPTS_PER_ADDRESS))
+    return keys
 
-    if len(recent_attempts) >= MAX_ATTEMPTS:
-        return True
+
+def _window(now):
+    return int(now // WINDOW_SECONDS) * WINDOW_SECONDS
+
+
+def _estimate(row, now):
+    """Attempts in the WINDOW_SECONDS before `now`, from a (window_start, count, prev_count) row."""
+    if row is None:
+        return 0.0
+    window_start, count, prev_count = row
+    window = _window(now)
+    if window_start == window - WINDOW_SECONDS:
+        count, prev_count = 0, count
+    elif window_start != window:
+        return 0.0
+    overlap = 1 - (now - window) / WINDOW_SECONDS
+    return count + prev_count * overlap
+
+
+def is_rate_limited(username, client_address=None, now=None):
+    now = time.time() if now is None else now
+    conn = _connection()
+    for key, limit in _keys(username, client_address):
+        row = conn.execute(
+            "SELECT window_start, count, prev_count FROM login_attempts WHERE key = ?", (key,)
+        ).fetchone()
+        if _estimate(row, now) >= limit:
+            return True
     return False
 
-def log_attempt(username):
-    attempt_log[username].append(time.time())
+
+def log_attempt(username, client_address=None, now=None):
+    """Count a failed login against the username and the client address."""
+    now = time.time() if now is None else now
+    window = _window(now)
+    conn = _connection()
+    try:
+        conn.executemany("""
+            INSERT INTO login_attempts (key, window_start, count, prev_count)
+            VALUES (:key, :window, 1, 0)
+            ON CONFLICT(key) DO UPDATE SET
+                prev_count = CASE
+                    WHEN window_start = :window THEN prev_count
+                    WHEN window_start = :window - :size THEN count
+                    ELSE 0 END,
+                count = CASE WHEN window_start = :window THEN count + 1 ELSE 1 END,
+                window_start = :window
+        """, [{"key": key, "window": window, "size": WINDOW_SECONDS} for key, _ in _keys(username, client_address)])
+        if next(_writes) % SWEEP_EVERY == 0:
+            conn.execute("DELETE FROM login_attempts WHERE window_start < ?", (window - WINDOW_SECONDS,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def clear_attempts(username):
+    """Forget a username's failures after a successful login; the address count is kept."""
+    conn = _connection()
+    conn.execute("DELETE FROM login_attempts WHERE key = ?", (_keys(username, None)[0][0],))
+    conn.commit()
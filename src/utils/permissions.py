@@ -0,0 +1,21 @@
+# src/utils/permissions.py
+#
+# What each role may do. Sessions precompute the set at login
+# (services.session_store), so view checks are a set lookup.
+
+ROLE_PERMISSIONS = {
+    "superadmin": {
+        "platform.view", "tenants.manage", "analytics.view", "diagnostics.view", "reports.run",
+        "plans.assign", "billing.manage",
+    },
+    "admin": {
+        "tenant.dashboard", "plans.manage", "plans.assign", "usage.upload", "billing.manage", "billing.report",
+        "payments.verify", "audit.view", "metrics.manage",
+    },
+    "tenantadmin": {"plans.assign"},
+    "client": {"client.dashboard", "subscription.manage", "invoices.view", "payments.submit", "usage.view"},
+}
+
+
+def permissions_for(role):
+    return frozenset(ROLE_PERMISSIONS.get(role, ()))
@@ -0,0 +1,201 @@
+# src/utils/render_profiler.py
+#
+# Page render profiling for the main.py router. Every view call is wrapped to
+# record wall time, the queries and rows it issued on the rendering thread,
+# and, with RENDER_PROFILE_MEMORY=1, peak Python memory (tracemalloc slows
+# every render it covers, so this is opt-in). Each render is appended as a
+# JSON line to a rotating log and aggregated per page for the superadmin "Page
+# performance" view. A single render can also be captured with pyinstrument
+# (when installed) or cProfile; captures are written to RENDER_PROFILE_DIR.
+#
+# tracemalloc is process-wide. The profiler starts it for the first traced
+# render and stops it after the last one, and only if it started it (if
+# something else is already tracing, no memory figure is recorded). Each
+# traced render keeps its own peak: whenever a render starts or ends, the
+# process-wide peak since the last such event is folded into every render in
+# flight before it is reset. Renders that overlap still see each other's
+# allocations, so treat their peaks as an upper bound.
+
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from config import settings
+from db.query_stats import query_stats
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # optional; cProfile is used instead
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+
+class RenderStats:
+    """Per-page aggregates of profiled renders."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._log = None
+
+    def record(self, render):
+        with self._lock:
+            page = self._pages.get(render["page"])
+            if page is None:
+                page = self._pages[render["page"]] = {
+                    "renders": 0, "total_ms": 0.0, "max_ms": 0.0, "queries": 0, "rows": 0, "peak_kb": 0.0
+                }
+            page["renders"] += 1
+            page["total_ms"] += render["wall_ms"]
+            page["max_ms"] = max(page["max_ms"], render["wall_ms"])
+            page["queries"] += render["queries"]
+            page["rows"] += render["rows"]
+            page["peak_kb"] = max(page["peak_kb"], render["peak_kb"] or 0.0)
+        self._render_log().info(json.dumps(render))
+
+    def slowest(self):
+        """Pages by average render time, slowest first."""
+        with self._lock:
+            rows = [
+                {"page": name, "renders": p["renders"], "avg_ms": round(p["total_ms"] / p["renders"], 1),
+                 "max_ms": round(p["max_ms"], 1), "avg_queries": round(p["queries"] / p["renders"], 1),
+                 "avg_rows": round(p["rows"] / p["renders"], 1), "peak_kb": round(p["peak_kb"], 1)}
+                for name, p in self._pages.items()
+            ]
+        return sorted(rows, key=lambda row: row["avg_ms"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._pages.clear()
+
+    def _render_log(self):
+        if self._log is None:
+            render_log = logging.getLogger("render_profile")
+            render_log.propagate = False
+            if settings.RENDER_PROFILE_LOG and not render_log.handlers:
+                os.makedirs(os.path.dirname(settings.RENDER_PROFILE_LOG) or ".", exist_ok=True)
+                handler = RotatingFileHandler(settings.RENDER_PROFILE_LOG, maxBytes=5_000_000, backupCount=5)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                render_log.addHandler(handler)
+            render_log.setLevel(logging.INFO)
+            self._log = render_log
+        return self._log
+
+
+render_stats = RenderStats()
+
+_tracing_lock = threading.Lock()
+_traced_renders = {}  # token -> [traced memory at start, peak so far]
+_owns_tracing = False
+
+
+def _fold_peak():
+    """Credit the peak since the last start/stop to every traced render, then reset it."""
+    peak = tracemalloc.get_traced_memory()[1]
+    for render in _traced_renders.values():
+        render[1] = max(render[1], peak)
+    tracemalloc.reset_peak()
+
+
+def _start_memory_tracing():
+    """Token for this render's memory peak, or None if tracemalloc belongs to someone else."""
+    global _owns_tracing
+    with _tracing_lock:
+        if not _traced_renders:
+            if tracemalloc.is_tracing():
+                return None
+            tracemalloc.start()
+            _owns_tracing = True
+        elif not _owns_tracing:
+            return None
+        _fold_peak()
+        token = object()
+        current = tracemalloc.get_traced_memory()[0]
+        _traced_renders[token] = [current, current]
+        return token
+
+
+def _stop_memory_tracing(token):
+    """This render's peak KiB above what was traced when it started; stops tracing after the last one."""
+    global _owns_tracing
+    if token is None:
+        return None
+    with _tracing_lock:
+        _fold_peak()
+        baseline, peak = _traced_renders.pop(token)
+        if not _traced_renders:
+            tracemalloc.stop()
+            _owns_tracing = False
+    return (peak - baseline) / 1024
+
+
+def _capture_path(page, extension):
+    os.makedirs(settings.RENDER_PROFILE_DIR, exist_ok=True)
+    slug = "".join(c if c.isalnum() else "_" for c in page).strip("_") or "page"
+    return os.path.join(settings.RENDER_PROFILE_DIR, f"{slug}_{datetime.utcnow():%Y%m%d_%H%M%S}.{extension}")
+
+
+def _run_captured(page, view):
+    """Run one render under pyinstrument (HTML) or cProfile (.prof); returns the capture path."""
+    if Profiler is not None:
+        profiler = Profiler()
+        profiler.start()
+        try:
+            view()
+        finally:
+            profiler.stop()
+            path = _capture_path(page, "html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+            logger.info(f"🔬 Render profile for {page} written to {path}")
+        return path
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(view)
+    finally:
+        path = _capture_path(page, "prof")
+        profiler.dump_stats(path)
+        logger.info(f"🔬 Render profile for {page} written to {path}")
+    return path
+
+
+def profile_render(page, view, capture=False):
+    """
+    Call `view()` and record its render. capture=True also writes a
+    pyinstrument/cProfile capture of this render. Streamlit's st.stop() and
+    st.rerun() exceptions are recorded and re-raised.
+    """
+    if not settings.RENDER_PROFILING:
+        return view()
+
+    memory_token = _start_memory_tracing() if settings.RENDER_PROFILE_MEMORY else None
+    counter = query_stats.start_counting()
+    started = time.perf_counter()
+    capture_path = None
+    try:
+        if capture:
+            capture_path = _run_captured(page, view)
+        else:
+            view()
+    finally:
+        wall_ms = (time.perf_counter() - started) * 1000
+        query_stats.stop_counting()
+        peak_kb = _stop_memory_tracing(memory_token)
+        render_stats.record({
+            "page": page,
+            "at": datetime.utcnow().isoformat(timespec="seconds"),
+            "wall_ms": round(wall_ms, 2),
+            "queries": counter["queries"],
+            "rows": counter["rows"],
+            "query_ms": round(counter["ms"], 2),
+            "peak_kb": round(peak_kb, 1) if peak_kb is not None else None,
+            "capture": capture_path,
+        })
@@ -2,15 +2,12 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
-from db.database import get_db_connection
+from db.database import get_analytics_connection, query_all_tenants
 import io
 import datetime
 import os
 
 def generate_superadmin_pdf_report(start_date, end_date):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     # Date conversion
     start_date_str = start_date.strftime("%Y-%m-%d")
     end_date_str = end_date.strftime("%Y-%m-%d")
@@ -19,19 +16,58 @@ def generate_superadmin_pdf_report(start_date, end_date):
     prev_start = (start_date_obj - (end_date_obj - start_date_obj)).date()
     prev_end = (start_date_obj - datetime.timedelta(days=1)).date()
 
-    # Tenant summary
-    cursor.execute("""
+    # Tenant summary and per-tenant activity, fanned out across tenant databases.
+    # Each query groups by tenant, so rows from different databases never overlap.
+    tenants = sorted(query_all_tenants("""
         SELECT t.id, t.name,
             COUNT(DISTINCT i.id) AS total_invoices,
             COALESCE(SUM(i.total_amount), 0) AS total_billed,
-            COALESCE(SUM(CASE WHEN i.is_paid = 1 THEN i.total_amount ELSE 0 END), 0) AS total_paid
+            COALESCE(SUM(i.amount_paid), 0) AS total_paid
         FROM tenants t
         LEFT JOIN users u ON u.tenant_id = t.id
         LEFT JOIN invoices i ON i.user_id = u.id
         WHERE i.invoice_date BETWEEN ? AND ?
         GROUP BY t.id, t.name
-    """, (start_date_str, end_date_str))
-    tenants = cursor.fetchall()
+    """, (start_date_str, end_date_str), snapshot=True))
+
+    # Active users
+    active_by_tenant = dict(query_all_tenants("""
+        SELECT u.tenant_id, COUNT(DISTINCT ur.user_id)
+        FROM usage_records ur
+        JOIN users u ON ur.user_id = u.id
+        WHERE ur.usage_date BETWEEN ? AND ?
+        GROUP BY u.tenant_id
+    """, (start_date_str, end_date_str), snapshot=True))
+
+    # Churned users: active in the previous period, not in this one
+    churned_by_tenant = dict(query_all_tenants("""
+        SELECT prev.tenant_id, COUNT(DISTINCT prev.user_id)
+        FROM (
+            SELECT u.tenant_id, ur.user_id
+            FROM usage_records ur
+            JOIN users u ON ur.user_id = u.id
+            WHERE ur.usage_date BETWEEN ? AND ?
+        ) AS prev
+        LEFT JOIN (
+            SELECT ur.user_id
+            FROM usage_records ur
+            WHERE ur.usage_date BETWEEN ? AND ?
+        ) AS curr ON prev.user_id = curr.user_id
+        WHERE curr.user_id IS NULL
+        GROUP BY prev.tenant_id
+    """, (prev_start, prev_end, start_date_str, end_date_str), snapshot=True))
+
+    # Usage summary by metric
+    usage_by_tenant = {}
+    for tenant_id, metric, amount in query_all_tenants("""
+        SELECT u.tenant_id, m.metric_name, SUM(ur.usage_amount)
+        FROM usage_records ur
+        JOIN usage_metrics m ON ur.metric_id = m.id
+        JOIN users u ON ur.user_id = u.id
+        WHERE ur.usage_date BETWEEN ? AND ?
+        GROUP BY u.tenant_id, m.metric_name
+    """, (start_date_str, end_date_str), snapshot=True):
+        usage_by_tenant.setdefault(tenant_id, {})[metric] = amount
 
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4)
@@ -59,49 +95,13 @@ def generate_superadmin_pdf_report(start_date, end_date):
             except Exception:
                 pass
 
-        # Active users
-        cursor.execute("""
-            SELECT COUNT(DISTINCT ur.user_id)
-            FROM usage_records ur
-            JOIN users u ON ur.user_id = u.id
-            WHERE u.tenant_id = ? AND ur.usage_date BETWEEN ? AND ?
-        """, (tenant_id, start_date_str, end_date_str))
-        active_users = cursor.fetchone()[0] or 0
-
-        # Churned users
-        cursor.execute("""
-            SELECT COUNT(DISTINCT prev.user_id)
-            FROM (
-                SELECT ur.user_id
-                FROM usage_records ur
-                JOIN users u ON ur.user_id = u.id
-                WHERE u.tenant_id = ? AND ur.usage_date BETWEEN ? AND ?
-            ) AS prev
-            LEFT JOIN (
-                SELECT ur.user_id
-                FROM usage_records ur
-                JOIN users u ON ur.user_id = u.id
-                WHERE u.tenant_id = ? AND ur.usage_date BETWEEN ? AND ?
-            ) AS curr ON prev.user_id = curr.user_id
-            WHERE curr.user_id IS NULL
-        """, (tenant_id, prev_start, prev_end, tenant_id, start_date_str, end_date_str))
-        churned_users = cursor.fetchone()[0] or 0
+        active_users = active_by_tenant.get(tenant_id, 0)
+        churned_users = churned_by_tenant.get(tenant_id, 0)
 
         # ARPU
         arpu = billed / active_users if active_users > 0 else 0.0
 
-        # Usage summary by metric
-        cursor.execute("""
-            SELECT m.metric_name, SUM(ur.usage_amount)
-            FROM usage_records ur
-            JOIN usage_metrics m ON ur.metric_id = m.id
-            JOIN users u ON ur.user_id = u.id
-            WHERE u.tenant_id = ? AND ur.usage_date BETWEEN ? AND ?
-            GROUP BY m.metric_name
-        """, (tenant_id, start_date_str, end_date_str))
-        usage_summary = cursor.fetchall()
-        usage_dict = {metric: amount for metric, amount in usage_summary}
-
+        usage_dict = usage_by_tenant.get(tenant_id, {})
         usage_text = ", ".join(f"{k}: {v}" for k, v in usage_dict.items()) if usage_dict else "N/A"
 
         # Table for this tenant
@@ -165,7 +165,6 @@ def generate_superadmin_pdf_report(start_date, end_date):
     ]))
     elements.append(total_table)
 
-    conn.close()
     doc.build(elements)
     pdf_value = buffer.getvalue()
     buffer.close()
@@ -173,7 +172,7 @@ def generate_superadmin_pdf_report(start_date, end_date):
 
 
 def generate_tenant_billing_report_pdf(tenant_id, start_date, end_date):
-    conn = get_db_connection()
+    conn = get_analytics_connection(tenant_id)
     cursor = conn.cursor()
 
     # Ensure date format
@@ -194,7 +193,7 @@ def generate_tenant_billing_report_pdf(tenant_id, start_date, end_date):
     cursor.execute("""
         SELECT COUNT(DISTINCT i.id),
                COALESCE(SUM(i.total_amount), 0),
-               COALESCE(SUM(CASE WHEN i.is_paid = 1 THEN i.total_amount ELSE 0 END), 0)
+               COALESCE(SUM(i.amount_paid), 0)
         FROM invoices i
         JOIN users u ON u.id = i.user_id
         WHERE u.tenant_id = ? AND i.invoice_date BETWEEN ? AND ?
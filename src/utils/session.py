@@ -9,4 +9,19 @@ def init_session_state():
     }
     for key, value in defaults.items():
         if key not in st.session_state:
-            st.session_state[key] = value
\ No newline at end of file
+            st.session_state[key] = value
+
+def get_client_address():
+    """
+    Client IP of the current browser session from the request context, cached
+    in the session. None outside a request (or behind an unknown proxy).
+    """
+    try:
+        address = st.session_state.get("client_address")
+        if address is None:
+            address = st.context.ip_address
+            if address:
+                st.session_state["client_address"] = address
+        return address
+    except Exception:
+        return None
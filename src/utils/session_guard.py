@@ -1,10 +1,37 @@
 # src/utils/session_guard.py
+import functools
+
 import streamlit as st
 
-def require_login(role=None):
-    if "authenticated" not in st.session_state or not st.session_state.authenticated:
+from services.session_store import get_session_store
+
+
+def current_principal():
+    """The logged-in principal from the session store (dict lookup on a warm cache), or None."""
+    return get_session_store().get(st.session_state.get("session_id"))
+
+
+def require_login(role=None, permission=None):
+    """Stop the render unless logged in (with `role` / `permission` if given); returns the principal."""
+    principal = current_principal()
+    if principal is None:
         st.warning("🚫 Please log in to access this page.")
         st.stop()
-    if role and st.session_state.get("role") != role:
+    if role and principal["role"] != role:
         st.warning(f"🚫 This page is only for '{role}' users.")
         st.stop()
+    if permission and permission not in principal["permissions"]:
+        st.warning("🚫 You don't have permission to access this page.")
+        st.stop()
+    return principal
+
+
+def requires(permission=None, role=None):
+    """View decorator: require_login(role, permission) before the view renders."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            require_login(role=role, permission=permission)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,13 +1,13 @@
 import streamlit as st
 from datetime import date
-from utils.session_guard import require_login
+from utils.session_guard import requires, current_principal
 from utils.report_utils import generate_tenant_billing_report_pdf
 
+@requires("billing.report")
 def admin_tenant_billing_report():
-    require_login("admin")
     st.set_page_config(page_title="🧾 Admin Billing Report", layout="wide")
     st.title("📥 Download Billing Report")
-    user = st.session_state.get("user")
+    user = current_principal()
     tenant_id = user["tenant_id"]
 
     # Form to collect date range
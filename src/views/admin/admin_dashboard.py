@@ -1,13 +1,18 @@
 import streamlit as st
+from utils.session_guard import requires, current_principal
 import pandas as pd
 import altair as alt
 from db.database import get_db_connection
+from services.usage_alerts import get_period_notifications
+from services.password_hasher import hash_password
+from services.session_store import get_session_store
 
+@requires("tenant.dashboard")
 def admin_dashboard():
     st.title("📊 Admin Dashboard – Tenant Overview")
 
-    tenant_id = st.session_state.get("tenant_id")
-    conn = get_db_connection()
+    tenant_id = current_principal()["tenant_id"]
+    conn = get_db_connection(tenant_id)
     cursor = conn.cursor()
 
 
@@ -120,9 +125,17 @@ def admin_dashboard():
         selected_user_id = st.selectbox("Select User", user_df["User ID"].tolist())
         new_password = st.text_input("New Password", type="password")
         if st.button("Reset Password"):
-            cursor.execute("UPDATE users SET password = ? WHERE id = ?", (new_password, selected_user_id))
-            conn.commit()
-            st.success(f"Password reset for user ID {selected_user_id}")
+            try:
+                hashed_pw = hash_password(new_password)
+            except TimeoutError:
+                st.error("⏳ The server is busy. Please try again in a moment.")
+            else:
+                cursor.execute("UPDATE users SET password = ? WHERE id = ? AND tenant_id = ?",
+                               (hashed_pw, selected_user_id, tenant_id))
+                conn.commit()
+                # Sessions opened with the old password end now
+                get_session_store().end_user_sessions(selected_user_id)
+                st.success(f"Password reset for user ID {selected_user_id}")
 
         st.subheader("🔎 Detailed Usage by User")
         user_to_analyze = st.selectbox("Select User to Analyze", user_options)
@@ -160,7 +173,7 @@ def admin_dashboard():
         # 1. Overdue Invoices
         st.markdown("### ❌ Overdue Invoices")
         cursor.execute("""
-            SELECT u.username, i.id, i.due_date, i.total_amount
+            SELECT u.username, i.id, i.due_date, i.balance_due
             FROM invoices i
             JOIN users u ON i.user_id = u.id
             WHERE i.is_paid = 0 AND i.due_date < DATE('now') AND u.tenant_id = ?
@@ -175,21 +188,10 @@ def admin_dashboard():
 
         # 2. High Usage
         st.markdown("### 🚨 High Usage Clients (>90%)")
-        cursor.execute("""
-            SELECT u.username, p.included_units, COALESCE(SUM(um.usage_amount), 0)
-            FROM users u
-            JOIN subscriptions s ON u.id = s.user_id AND s.is_active = 1
-            JOIN plans p ON s.plan_id = p.id
-            LEFT JOIN usage_records um ON u.id = um.user_id AND um.usage_date BETWEEN DATE('now', 'start of month') AND DATE('now')
-            WHERE u.tenant_id = ?
-            GROUP BY u.username, p.included_units
-            HAVING SUM(um.usage_amount) >= 0.9 * p.included_units
-        """, (tenant_id,))
-        alerts = cursor.fetchall()
+        alerts = [row for row in get_period_notifications(tenant_id) if row[2] >= 90]
         if alerts:
-            for row in alerts:
-                pct = (row[2] / row[1]) * 100 if row[1] else 0
-                st.warning(f"Client **{row[0]}** has used {row[2]} of {row[1]} units (**{pct:.0f}%**) this month")
+            for username, metric_name, threshold, used, limit, _ in alerts:
+                st.warning(f"Client **{username}** has used {used} of {limit} {metric_name} (**{threshold}%** threshold) this month")
         else:
             st.success("✅ No high usage clients.")
 
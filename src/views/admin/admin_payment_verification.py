@@ -1,87 +1,92 @@
+import math
+
+import pandas as pd
 import streamlit as st
-from db.database import get_db_connection
-from utils.session_guard import require_login
+from utils.session_guard import requires, current_principal
 from pathlib import Path
-from utils.email_utils import send_email
+from payment_logic import pending_payments, verify_payments, reject_payments, queue_payment_notices
+from services.receipt_store import read_receipt
+
+PAGE_SIZES = [25, 50, 100, 250]
 
+
+@requires("payments.verify")
 def admin_payment_verification():
-    require_login('admin')
-    
+
     st.set_page_config(page_title="🧾 Verify Payments", layout="wide")
     st.title("🧾 Payment Verification")
 
-    user = st.session_state.get("user")
-    tenant_id = user["tenant_id"]
+    tenant_id = current_principal()["tenant_id"]
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    # Result of the last bulk action survives the rerun that refreshes the grid
+    notice = st.session_state.pop("payment_verification_notice", None)
+    if notice:
+        st.success(notice)
 
-    # Fetch pending payments for this tenant
-    cursor.execute("""
-        SELECT p.id, p.user_id, p.invoice_id, p.amount, p.payment_method,
-               p.payment_date, p.receipt_path, u.username, i.invoice_date
-        FROM payments p
-        JOIN users u ON p.user_id = u.id
-        JOIN invoices i ON p.invoice_id = i.id
-        WHERE p.is_verified = 0
-        AND u.tenant_id = ?
-        ORDER BY p.payment_date DESC
-    """, (tenant_id,))
-    rows = cursor.fetchall()
+    col1, col2, col3 = st.columns([3, 1, 1])
+    search = col1.text_input("🔍 Search by username or invoice #").strip()
+    page_size = col2.selectbox("Per page", PAGE_SIZES, index=1)
 
-    print(f"Found {len(rows)} pending payments for tenant {tenant_id}")
-    if not rows:
+    _, total = pending_payments(tenant_id, search, limit=0)
+    if not total:
         st.success("✅ No pending payments.")
         return
+    pages = max(1, math.ceil(total / page_size))
+    page = col3.number_input("Page", min_value=1, max_value=pages, value=1)
+    rows, total = pending_payments(tenant_id, search, limit=page_size, offset=(page - 1) * page_size)
+    st.caption(f"{total} pending payments · page {page} of {pages}")
 
-    for payment in rows:
-        (pid, uid, invoice_id, amount, method, date, receipt_path, username, invoice_date) = payment
+    select_all = st.checkbox("Select all on this page")
+    grid = pd.DataFrame([{
+        "Select": select_all,
+        "Payment": pid,
+        "Client": username,
+        "Invoice": invoice_id,
+        "Invoice Date": invoice_date,
+        "Amount": amount,
+        "Balance Due": balance_due,
+        "Method": method,
+        "Paid On": payment_date,
+        "Receipt": "✅" if receipt_size else "❌",
+    } for pid, username, invoice_id, invoice_date, amount, balance_due, method, payment_date, receipt_size, *_ in rows])
+    edited = st.data_editor(
+        grid,
+        hide_index=True,
+        use_container_width=True,
+        disabled=[c for c in grid.columns if c != "Select"],
+        column_config={"Amount": st.column_config.NumberColumn(format="R%.2f"),
+                       "Balance Due": st.column_config.NumberColumn(format="R%.2f")},
+        key=f"pending_payments_{search}_{page_size}_{page}_{select_all}",
+    )
+    selected = edited.loc[edited["Select"], "Payment"].tolist()
 
-        st.subheader(f"💼 Invoice #{invoice_id} by {username} — R{amount:.2f}")
+    colA, colB, colC = st.columns([1, 1, 2])
+    reason = colC.text_input("Rejection reason", placeholder="e.g. Receipt doesn't show the amount")
+    if colA.button(f"✅ Verify selected ({len(selected)})", disabled=not selected):
+        verified = verify_payments(selected, tenant_id)
+        emails = queue_payment_notices(tenant_id, verified=verified)
+        settled = sum(1 for row in verified if row[5])
+        st.session_state.payment_verification_notice = (
+            f"✅ Verified {len(verified)} payments ({settled} invoices now paid in full); {emails} emails queued."
+        )
+        st.rerun()
+    if colB.button(f"🚫 Reject selected ({len(selected)})", disabled=not selected):
+        rejected = reject_payments(selected, reason, tenant_id)
+        emails = queue_payment_notices(tenant_id, rejected=rejected, reason=reason)
+        st.session_state.payment_verification_notice = f"🚫 Rejected {len(rejected)} payments; {emails} emails queued."
+        st.rerun()
 
-        col1, col2 = st.columns(2)
-        with col1:
-            st.write(f"📅 Payment Date: `{date}`")
-            st.write(f"💳 Method: `{method}`")
-            st.write(f"🧾 Invoice Date: `{invoice_date}`")
-        with col2:
-            if receipt_path and Path(receipt_path).exists():
-                with open(receipt_path, "rb") as f:
-                    st.download_button("📥 Download Receipt", f, file_name=Path(receipt_path).name)
-            else:
+    # Receipts are read only when one is asked for
+    with st.expander("📎 Receipts on this page"):
+        receipts = {f"Payment {row[0]} — {row[1]} — invoice #{row[2]}": row for row in rows if row[8] and row[9]}
+        if not receipts:
+            st.info("No receipts on this page.")
+        else:
+            choice = st.selectbox("Receipt", list(receipts))
+            pid, *_, path, mime = receipts[choice]
+            data = read_receipt(path)
+            if data is None:
                 st.error("❌ Receipt file not found")
-
-        # Action buttons
-        colA, colB = st.columns([1, 3])
-        with colA:
-            if st.button("✅ Verify", key=f"verify_{pid}"):
-                try:
-                    # Mark payment as verified
-                    cursor.execute("UPDATE payments SET is_verified = 1 WHERE id = ?", (pid,))
-                    # Mark invoice as paid
-                    cursor.execute("UPDATE invoices SET is_paid = 1 WHERE id = ?", (invoice_id,))
-                    conn.commit()
-                    st.success(f"✅ Payment {pid} verified and invoice marked paid.")
-                    # Fetch client email
-                    cursor.execute("SELECT email FROM users WHERE id = ?", (uid,))
-                    client_email = cursor.fetchone()[0]
-
-                    # Send confirmation email
-                    email_subject = f"💰 Payment Verified for Invoice #{invoice_id}"
-                    email_body = f"""
-                    Hello {username},
-
-                    ✅ Your payment of R{amount:.2f} for Invoice #{invoice_id} dated {invoice_date} has been verified and marked as paid.
-
-                    Thank you for your payment!
-
-                    Regards,  
-                    Billing Team @ {user["tenant_id"]}
-                    """
-
-                    send_email('siphiwolu@gmail.com', email_subject, email_body)
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"Error: {e}")
-
-    conn.close()
+            else:
+                st.download_button("📥 Download Receipt", data, mime=mime,
+                                   file_name=f"receipt_{pid}{Path(path).suffix}")
@@ -0,0 +1,68 @@
+# views/admin/bank_reconciliation.py
+
+import pandas as pd
+import streamlit as st
+from utils.session_guard import requires, current_principal
+from services.reconciliation import parse_statement, match_statement, apply_matches, DATE_WINDOW_DAYS
+
+
+def _lines_frame(lines):
+    return pd.DataFrame([
+        {"Line": l["line"], "Date": l["date"], "Amount": l["amount"] / 100, "Reference": l["reference"]}
+        for l in lines
+    ])
+
+
+@requires("payments.verify")
+def bank_reconciliation():
+    st.title("🏦 Bank Reconciliation")
+    tenant_id = current_principal()["tenant_id"]
+
+    st.info("Upload a bank statement (CSV with `date, amount, reference` columns, or OFX). "
+            "Credits are matched to pending payments and open invoices by invoice number, or by amount and date.")
+
+    uploaded_file = st.file_uploader("Bank statement", type=["csv", "ofx", "qfx"])
+    window_days = st.number_input("Date window (days)", min_value=0, max_value=90, value=DATE_WINDOW_DAYS)
+    if not uploaded_file:
+        return
+
+    try:
+        lines, errors = parse_statement(uploaded_file.getvalue(), uploaded_file.name)
+    except ValueError as e:
+        st.error(f"Failed to read statement: {e}")
+        return
+    for line_no, err in errors:
+        st.text(f"Line {line_no}: {err}")
+
+    result = match_statement(tenant_id, lines, window_days=window_days)
+    matched, unmatched, duplicates = result["matched"], result["unmatched"], result["duplicates"]
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Matched", len(matched))
+    col2.metric("Unmatched", len(unmatched))
+    col3.metric("Already reconciled", len(duplicates))
+
+    if matched:
+        st.subheader("✅ Matches")
+        st.dataframe(pd.DataFrame([{
+            "Line": m["line"]["line"],
+            "Date": m["line"]["date"],
+            "Amount": m["amount"] / 100,
+            "Reference": m["line"]["reference"],
+            "Invoice": m["invoice_id"],
+            "Match": "Pending payment" if m["kind"] == "pending" else "Open invoice",
+        } for m in matched]), use_container_width=True)
+
+        if st.button(f"💾 Apply {len(matched)} matches"):
+            summary = apply_matches(tenant_id, matched)
+            st.success(f"✅ Reconciled {summary['applied']} payments; "
+                       f"{summary['emails_queued']} confirmation emails queued.")
+            if summary["skipped"]:
+                st.warning(f"⚠️ {summary['skipped']} matches were already verified and were skipped.")
+            if summary["conflicts"]:
+                st.error(f"❌ {summary['conflicts']} statement lines have a bank reference that was already "
+                         "reconciled and were not applied.")
+
+    if unmatched:
+        st.subheader("❓ Unmatched lines")
+        st.dataframe(_lines_frame(unmatched), use_container_width=True)
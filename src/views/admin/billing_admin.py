@@ -1,18 +1,16 @@
 import streamlit as st
+from utils.session_guard import requires, current_principal
 from datetime import datetime
-from billing_engine import generate_invoices  
+from billing_engine import generate_invoices, auto_generate_invoices
 from db.database import get_db_connection
-from auto_generate_invoices import auto_generate_invoices
 from utils.pdf_generator import generate_pdf_invoice
+from services.billing_simulation import simulate_billing_run
 
+@requires("billing.manage")
 def billing_admin():
     st.subheader("🧾 Billing Admin")
 
-    if st.session_state.get("role") != "admin" and st.session_state.get("role") != "superadmin":
-        st.warning("Access denied. Admins only.")
-        st.stop()
-
-    tenant_id = st.session_state.get("tenant_id")
+    tenant_id = current_principal()["tenant_id"]
     now = datetime.now()
     default_period = now.strftime("%Y-%m")
 
@@ -25,7 +23,7 @@ def billing_admin():
             if isinstance(invoice_ids, (list, tuple, set)) and invoice_ids:
                 st.success(f"✅ Generated {len(invoice_ids)} invoice(s).")
             elif isinstance(invoice_ids, list) and not invoice_ids:
-                st.warning("ℹ️ No active subscriptions or usage found.")
+                st.warning("ℹ️ No active subscriptions left to invoice for this period.")
             else:
                 st.success(f"✅ Invoices generated.")
                 generate_pdf_invoice(
@@ -37,20 +35,29 @@ def billing_admin():
         except Exception as e:
             st.error(f"❌ Failed to generate invoices: {str(e)}")
             
+    if st.button("🧪 Simulate Run (no invoices written)"):
+        try:
+            report = simulate_billing_run(billing_period, tenant_ids=[tenant_id])
+            st.caption(f"Rated in {report['elapsed']:.2f}s, compared with last month's issued invoices.")
+            st.dataframe(report["tenants"], use_container_width=True)
+            st.dataframe(report["plans"], use_container_width=True)
+        except Exception as e:
+            st.error(f"❌ Simulation failed: {str(e)}")
+
     st.divider()
     st.markdown("### 📊 Auto-Billing")
     st.info("This will automatically generate invoices for all active subscriptions.")
     if st.button("🌀 Run Auto-Billing Now"):
-        from billing_engine import auto_generate_invoices
         auto_generate_invoices()
         st.success("✅ Auto-billing completed.")
         # st.balloons() 
     st.divider()
     st.markdown("### 💵 Recent Invoices")
-    conn = get_db_connection()
+    conn = get_db_connection(tenant_id)
     cursor = conn.cursor()
     cursor.execute("""
-        SELECT id, invoice_date, total_amount, case when is_paid = 1 then 'Paid' else 'Unpaid' end as status, created_at
+        SELECT id, invoice_date, total_amount, case when is_paid = 1 then 'Paid' else 'Unpaid' end as status, created_at,
+               balance_due
         FROM invoices
         WHERE tenant_id = ?
         ORDER BY created_at DESC
@@ -61,7 +68,7 @@ def billing_admin():
 
     if rows:
         for inv in rows:
-            st.markdown(f"- **Invoice #{inv[0]}** | {inv[1]} | 💰 R{inv[2]:.2f} | Status: `{inv[3]}` | 🕒 {inv[4]}")
+            st.markdown(f"- **Invoice #{inv[0]}** | {inv[1]} | 💰 R{inv[2]:.2f} | Due: R{inv[5]:.2f} | Status: `{inv[3]}` | 🕒 {inv[4]}")
     else:
         st.info("No invoices yet.")
 
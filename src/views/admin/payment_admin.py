@@ -1,34 +1,38 @@
-
 import streamlit as st
+from utils.session_guard import requires, current_principal
 from payment_logic import record_payment
 from db.database import get_db_connection
 
+@requires("payments.verify")
 def payment_admin():
+    tenant_id = current_principal()["tenant_id"]
     st.subheader("💳 Record Manual Payment")
 
-    conn = get_db_connection()
+    conn = get_db_connection(tenant_id)
     cursor = conn.cursor()
     invoices = cursor.execute("""
-        SELECT id, tenant_id, invoice_date, total_amount, case when is_paid = 1 then 'Paid' else 'Unpaid' end as status
+        SELECT id, invoice_date, total_amount, balance_due
         FROM invoices
-        WHERE status != 'paid'
+        WHERE tenant_id = ? AND is_paid = 0
         ORDER BY invoice_date DESC
-    """).fetchall()
+    """, (tenant_id,)).fetchall()
     conn.close()
 
     if not invoices:
         st.info("No unpaid invoices.")
         return
 
-    options = {f"Invoice {i[0]} – {i[2]} (R{i[3]})": i[0] for i in invoices}
+    options = {f"Invoice {i[0]} – {i[1]} (R{i[2]}, R{i[3]:.2f} due)": (i[0], i[3]) for i in invoices}
     selected = st.selectbox("Select Unpaid Invoice", list(options.keys()))
-    selected_invoice_id = options[selected]
+    selected_invoice_id, balance_due = options[selected]
 
-    amount = st.number_input("Amount Paid", min_value=0.0, step=1.0)
+    amount = st.number_input("Amount Paid", min_value=0.0, value=max(float(balance_due), 0.0), step=1.0)
     method = st.selectbox("Payment Method", ["manual", "eft", "credit_card"])
     notes = st.text_area("Notes (optional)")
 
     if st.button("💾 Record Payment"):
-        record_payment(selected_invoice_id, amount, method, notes)
-        st.success("✅ Payment recorded.")
-        st.rerun()
+        if record_payment(selected_invoice_id, amount, method, notes, tenant_id=tenant_id):
+            st.success("✅ Payment recorded.")
+            st.rerun()
+        else:
+            st.error("❌ Invoice not found.")
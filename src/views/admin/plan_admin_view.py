@@ -1,19 +1,21 @@
 import streamlit as st
 import sqlite3
 from db.database import get_db_connection
-from utils.session_guard import require_login
+from utils.session_guard import requires, current_principal
+from services.invoice_preview_cache import invalidate_pricing
+from services.catalogue import bump_catalogue_version
 
+@requires("plans.manage")
 def plan_admin_view():
     st.set_page_config(page_title="Manage Plans", layout="wide")
-    require_login('admin')
 
-    user = st.session_state.get("user")
+    user = current_principal()
     if not user:
         st.stop()
 
     st.title("📊 Plan Management")
 
-    conn = get_db_connection()
+    conn = get_db_connection(user["tenant_id"])
     cursor = conn.cursor()
 
     # --- Add New Plan
@@ -31,6 +33,7 @@ def plan_admin_view():
                     INSERT INTO plans (tenant_id, name, description, monthly_fee, included_units, overage_rate, is_active)
                     VALUES (?, ?, ?, ?, ?, ?, 1)
                 """, (user["tenant_id"], name, description, monthly_fee, included_units, overage_rate))
+                bump_catalogue_version(cursor, user["tenant_id"])
                 conn.commit()
                 st.success("✅ New plan added successfully!")
                 st.rerun()
@@ -75,14 +78,18 @@ def plan_admin_view():
                                 SET name = ?, description = ?, monthly_fee = ?, included_units = ?, overage_rate = ?
                                 WHERE id = ?
                             """, (new_name, new_desc, new_fee, new_units, new_overage, plan_id))
+                            bump_catalogue_version(cursor, user["tenant_id"])
                             conn.commit()
+                            invalidate_pricing(user["tenant_id"])
                             st.success("✅ Plan updated.")
                             st.rerun()
 
             with col2:
                 if active and st.button("❌ Deactivate", key=f"deact_{plan_id}"):
                     cursor.execute("UPDATE plans SET is_active = 0 WHERE id = ?", (plan_id,))
+                    bump_catalogue_version(cursor, user["tenant_id"])
                     conn.commit()
+                    invalidate_pricing(user["tenant_id"])
                     st.warning("Plan deactivated.")
                     st.rerun()
 
@@ -1,24 +1,29 @@
 # views/admin/plan_metric_limits_admin.py
 
 import streamlit as st
+import pandas as pd
 from db.database import get_db_connection
-from utils.session_guard import require_login
+from utils.session_guard import requires, current_principal
+from services.pricing_kernel import PRICING_MODELS, TierSchedule
+from services.invoice_preview_cache import invalidate_pricing
+from services.catalogue import bump_catalogue_version, get_catalogue
 
+@requires("plans.manage")
 def plan_metric_limits_admin():
     st.set_page_config(page_title="📏 Define Plan Metric Limits", layout="centered")
-    require_login('admin')
 
-    user = st.session_state.get("user")
+    user = current_principal()
     tenant_id = user["tenant_id"]
 
     st.title("📏 Plan Metric Limits")
 
-    conn = get_db_connection()
+    conn = get_db_connection(tenant_id)
     cursor = conn.cursor()
 
+    catalogue = get_catalogue(cursor, tenant_id)
+
     # --- Select Plan
-    cursor.execute("SELECT id, name FROM plans WHERE tenant_id = ?", (tenant_id,))
-    plans = cursor.fetchall()
+    plans = [(plan_id, plan[0]) for plan_id, plan in catalogue.plans.items()]
 
     if not plans:
         st.warning("No plans available for your tenant.")
@@ -29,8 +34,7 @@ def plan_metric_limits_admin():
     plan_id = plan[0]
 
     # --- Load all metric types
-    cursor.execute("SELECT id, name FROM usage_metrics WHERE tenant_id = ?", (tenant_id,))
-    all_metrics = cursor.fetchall()
+    all_metrics = [(metric_id, metric[0]) for metric_id, metric in catalogue.metrics.items()]
 
     if not all_metrics:
         st.warning("No usage metrics defined yet.")
@@ -40,28 +44,75 @@ def plan_metric_limits_admin():
     st.subheader("🔧 Configure Metric Limits")
 
     # --- Show existing metric limits
-    cursor.execute("""
-        SELECT pml.id, mt.name, pml.metric_limit, pml.overage_rate
-        FROM plan_metric_limits pml
-        JOIN usage_metrics mt ON pml.metric_id = mt.id
-        WHERE pml.plan_id = ?
-    """, (plan_id,))
-    existing_limits = cursor.fetchall()
+    existing_limits = [
+        (limit_id, metric_name, metric_limit, overage_rate, pricing_model, max_charge)
+        for limit_id, _, metric_name, metric_limit, _, overage_rate, pricing_model, max_charge, _
+        in catalogue.limits_for(plan_id)
+    ]
 
     if existing_limits:
-        for limit_id, metric_name, metric_limit, overage_rate in existing_limits:
+        limit_ids = [row[0] for row in existing_limits]
+        placeholders = ",".join("?" for _ in limit_ids)
+        cursor.execute(f"""
+            SELECT plan_metric_limit_id, up_to, unit_price
+            FROM plan_metric_tiers
+            WHERE plan_metric_limit_id IN ({placeholders})
+            ORDER BY plan_metric_limit_id, up_to IS NULL, up_to
+        """, limit_ids)
+        tiers_by_limit = {}
+        for limit_id, up_to, unit_price in cursor.fetchall():
+            tiers_by_limit.setdefault(limit_id, []).append({"Up to (units)": up_to, "Unit price (R)": unit_price})
+
+        for limit_id, metric_name, metric_limit, overage_rate, pricing_model, max_charge in existing_limits:
             with st.expander(f"🔹 {metric_name}"):
                 new_limit = st.number_input(f"Included {metric_name} units", min_value=0, value=metric_limit, key=f"limit_{limit_id}")
                 new_rate = st.number_input(f"Overage rate (R per unit)", min_value=0.0, value=overage_rate, key=f"rate_{limit_id}")
+                new_model = st.selectbox(
+                    "Pricing model", PRICING_MODELS,
+                    index=PRICING_MODELS.index(pricing_model) if pricing_model in PRICING_MODELS else 0,
+                    key=f"model_{limit_id}",
+                    help="Flat: every overage unit at the overage rate. Graduated: each unit at its bracket's price. "
+                         "Volume: all units at the price of the bracket the total falls in."
+                )
+                new_cap = st.number_input("Max charge (R, 0 = no cap)", min_value=0.0, value=max_charge or 0.0, key=f"cap_{limit_id}")
+
+                edited_tiers = None
+                if new_model != "flat":
+                    st.caption("Brackets apply to units above the included limit. Leave the last 'Up to' empty for unbounded.")
+                    edited_tiers = st.data_editor(
+                        pd.DataFrame(tiers_by_limit.get(limit_id, []), columns=["Up to (units)", "Unit price (R)"]),
+                        num_rows="dynamic", key=f"tiers_{limit_id}", use_container_width=True
+                    )
 
                 if st.button("💾 Update", key=f"update_{limit_id}"):
-                    cursor.execute("""
-                        UPDATE plan_metric_limits
-                        SET metric_limit = ?, overage_rate = ?
-                        WHERE id = ?
-                    """, (new_limit, new_rate, limit_id))
-                    conn.commit()
-                    st.success(f"{metric_name} updated")
+                    tier_rows = []
+                    if edited_tiers is not None:
+                        tier_rows = [
+                            (limit_id, None if pd.isna(row["Up to (units)"]) else int(row["Up to (units)"]), float(row["Unit price (R)"]))
+                            for _, row in edited_tiers.dropna(subset=["Unit price (R)"]).iterrows()
+                        ]
+                    try:
+                        # Rejects schedules the pricing kernel can't price, before anything is saved
+                        if tier_rows:
+                            TierSchedule(new_model, [(up_to, price) for _, up_to, price in tier_rows])
+                    except ValueError as e:
+                        st.error(f"❌ {e}")
+                    else:
+                        cursor.execute("""
+                            UPDATE plan_metric_limits
+                            SET metric_limit = ?, overage_rate = ?, pricing_model = ?, max_charge = ?
+                            WHERE id = ?
+                        """, (new_limit, new_rate, new_model, new_cap or None, limit_id))
+
+                        cursor.execute("DELETE FROM plan_metric_tiers WHERE plan_metric_limit_id = ?", (limit_id,))
+                        cursor.executemany("""
+                            INSERT INTO plan_metric_tiers (plan_metric_limit_id, up_to, unit_price)
+                            VALUES (?, ?, ?)
+                        """, tier_rows)
+                        bump_catalogue_version(cursor, tenant_id)
+                        conn.commit()
+                        invalidate_pricing(tenant_id)
+                        st.success(f"{metric_name} updated")
 
     else:
         st.info("No metric limits defined for this plan yet.")
@@ -72,13 +123,8 @@ def plan_metric_limits_admin():
     st.subheader("➕ Add Metric to Plan")
 
     # Get metrics not yet added to the selected plan
-    cursor.execute("""
-        SELECT id, name FROM usage_metrics 
-        WHERE tenant_id = ? AND id NOT IN (
-            SELECT metric_id FROM plan_metric_limits WHERE plan_id = ?
-        )
-    """, (tenant_id, plan_id))
-    available_metrics = cursor.fetchall()
+    assigned = {limit[1] for limit in catalogue.limits_for(plan_id)}
+    available_metrics = [metric for metric in all_metrics if metric[0] not in assigned]
 
     if not available_metrics:
         st.info(f"All metrics are already assigned to this plan. Plan ID: {plan_id}")
@@ -92,7 +138,9 @@ def plan_metric_limits_admin():
                 INSERT INTO plan_metric_limits (plan_id, metric_id, metric_limit, overage_rate)
                 VALUES (?, ?, ?, ?)
             """, (plan_id, new_metric[0], new_limit, new_rate))
+            bump_catalogue_version(cursor, tenant_id)
             conn.commit()
+            invalidate_pricing(tenant_id)
             st.success(f"{new_metric[1]} added to the plan!")
             st.rerun()
 
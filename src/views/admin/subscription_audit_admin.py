@@ -1,18 +1,18 @@
 import streamlit as st
-from utils.session_guard import require_login
+from utils.session_guard import requires, current_principal
 from db.database import get_db_connection
 
+@requires("audit.view")
 def subscription_audit_admin():
     st.set_page_config(page_title="Subscription Audit Trail")
-    require_login('admin')
 
-    user = st.session_state.get("user")
+    user = current_principal()
     if not user:
         st.stop()
 
     st.title("📊 Subscription Audit Trail")
 
-    conn = get_db_connection()
+    conn = get_db_connection(user["tenant_id"])
     cursor = conn.cursor()
 
     cursor.execute("""
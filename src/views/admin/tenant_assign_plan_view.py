@@ -1,69 +1,53 @@
 import streamlit as st
+from utils.session_guard import requires, current_principal
 from db.database import get_db_connection
-from utils.session import init_session_state
+from services.catalogue import get_catalogue
+from services.subscriptions import get_subscriptions, assign_plan, cancel_subscription
 
+@requires("plans.assign")
 def assign_plans():
-    init_session_state()
-
-    if st.session_state.role not in ["admin", "tenantadmin", "superadmin"]:
-        st.warning("Access denied. Only tenant administrators can assign plans.")
-        st.stop()
-
-    tenant_id = st.session_state.tenant_id
+    tenant_id = current_principal()["tenant_id"]
     st.subheader("🏷️ Assign Plans to Users")
 
-    conn = get_db_connection()
+    conn = get_db_connection(tenant_id)
     cursor = conn.cursor()
 
     # Get users in the same tenant
-    users = cursor.execute("""
-        SELECT username FROM users WHERE tenant_id = ?
-    """, (tenant_id,)).fetchall()
-    usernames = [u[0] for u in users]
+    users = dict(cursor.execute("""
+        SELECT id, username FROM users WHERE tenant_id = ? ORDER BY username
+    """, (tenant_id,)).fetchall())
 
     # Get available plans for this tenant
-    plans = cursor.execute("""
-        SELECT id, name FROM plans WHERE tenant_id = ?
-    """, (tenant_id,)).fetchall()
-    plan_options = {name: pid for pid, name in plans}
+    catalogue = get_catalogue(cursor, tenant_id)
+    plan_options = {plan[0]: pid for pid, plan in catalogue.plans.items()}
+    subscriptions = get_subscriptions(cursor, tenant_id).by_user
+    conn.close()
+
+    if not users or not plan_options:
+        st.info("Add users and plans to this tenant first.")
+        return
 
     # UI for selection
-    selected_user = st.selectbox("Select User", usernames)
+    selected_user = st.selectbox("Select User", list(users), format_func=users.get)
     selected_plan_name = st.selectbox("Select Plan", list(plan_options.keys()))
     selected_plan_id = plan_options[selected_plan_name]
 
-    if st.button("Assign Plan"):
-        # Check if user already subscribed
-        existing = cursor.execute("""
-            SELECT id FROM subscriptions WHERE user_id = ? AND tenant_id = ?
-        """, (selected_user, tenant_id)).fetchone()
-
-        if existing:
-            # Update existing subscription
-            cursor.execute("""
-                UPDATE subscriptions SET plan_id = ? WHERE user_id = ? AND tenant_id = ?
-            """, (selected_plan_id, selected_user, tenant_id))
-            st.success("Plan updated for user.")
+    col1, col2 = st.columns(2)
+    if col1.button("Assign Plan"):
+        # Subscription change, audit event and cache invalidation in one step
+        action = assign_plan(tenant_id, selected_user, selected_plan_id)
+        if action is None:
+            st.info("User is already on this plan.")
         else:
-            # Create new subscription
-            cursor.execute("""
-                INSERT INTO subscriptions (user_id, plan_id, tenant_id, start_date)
-                VALUES (?, ?, ?, ?)
-            """, (selected_user, selected_plan_id, tenant_id, "2025-07-31"))
-            st.success("Plan assigned to user.")
-
-        conn.commit()
+            st.success("Plan updated for user." if action == "switched" else "Plan assigned to user.")
+            st.rerun()
+    if col2.button("Cancel Subscription", disabled=selected_user not in subscriptions):
+        cancel_subscription(tenant_id, selected_user)
+        st.success("Subscription cancelled.")
+        st.rerun()
 
     # Show current assignments
     st.markdown("### 📋 Current Subscriptions")
-    assignments = cursor.execute("""
-        SELECT s.user_id, p.name
-        FROM subscriptions s
-        JOIN plans p ON s.plan_id = p.id
-        WHERE p.tenant_id = ?
-    """, (tenant_id,)).fetchall()
-
-    for user, plan in assignments:
-        st.markdown(f"- **{user}** → Plan: **{plan}**")
-
-    conn.close()
+    for user_id, (_, plan_id, start_date) in subscriptions.items():
+        plan = catalogue.plans.get(plan_id)
+        st.markdown(f"- **{users.get(user_id, user_id)}** → Plan: **{plan[0] if plan else plan_id}** (since {start_date})")
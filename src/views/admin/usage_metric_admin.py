@@ -2,16 +2,18 @@
 
 import streamlit as st
 from db.database import get_db_connection
-from utils.session_guard import require_login
+from utils.session_guard import requires, current_principal
+from services.catalogue import bump_catalogue_version, get_catalogue
+from services.invoice_preview_cache import invalidate_pricing
 
+@requires("metrics.manage")
 def usage_metric_admin():
-    require_login('admin')
     st.title("📊 Manage Usage Metrics")
 
-    user = st.session_state.get("user")
+    user = current_principal()
     tenant_id = user["tenant_id"]
 
-    conn = get_db_connection()
+    conn = get_db_connection(tenant_id)
     cursor = conn.cursor()
 
     st.subheader("➕ Add New Metric")
@@ -25,15 +27,16 @@ def usage_metric_admin():
             else:
                 try:
                     cursor.execute("INSERT INTO usage_metrics (tenant_id, name, unit) VALUES (?, ?, ?)", (tenant_id, name.strip(), unit.strip()))
+                    bump_catalogue_version(cursor, tenant_id)
                     conn.commit()
+                    invalidate_pricing(tenant_id)
                     st.success(f"✅ Metric '{name}' added.")
                     st.rerun()
                 except Exception as e:
                     st.error(f"Error: {str(e)}")
 
     st.subheader("📋 Existing Metrics")
-    cursor.execute("SELECT id, name, unit FROM usage_metrics WHERE tenant_id = ?", (tenant_id,))
-    metrics = cursor.fetchall()
+    metrics = [(mid, name, unit) for mid, (name, unit) in get_catalogue(cursor, tenant_id).metrics.items()]
 
     if metrics:
         for mid, name, unit in metrics:
@@ -42,7 +45,9 @@ def usage_metric_admin():
             col2.markdown(f"Unit: `{unit}`")
             if col3.button("🗑 Delete", key=f"delete_{mid}"):
                 cursor.execute("DELETE FROM usage_metrics WHERE id = ?", (mid,))
+                bump_catalogue_version(cursor, tenant_id)
                 conn.commit()
+                invalidate_pricing(tenant_id)
                 st.success(f"Metric '{name}' deleted.")
                 st.rerun()
     else:
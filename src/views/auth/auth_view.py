@@ -4,9 +4,10 @@ import streamlit as st
 import os
 import requests
 from auth_manager import register_user, authenticate_user, verify_token, resend_verification_email
-from utils.session import init_session_state
+from utils.session import init_session_state, get_client_address
 from db.database import get_db_connection
-from utils.login_attempts import is_rate_limited
+from services.session_store import get_session_store
+from utils.login_attempts import is_rate_limited, log_attempt, clear_attempts
 from streamlit_js_eval import streamlit_js_eval
 
 RECAPTCHA_SITE_KEY = os.getenv("RECAPTCHA_SITE_KEY")
@@ -62,7 +63,8 @@ def auth_view():
 
         # --- Login Button ---
         if st.button("Login"):
-            if is_rate_limited(username):
+            client_address = get_client_address()
+            if is_rate_limited(username, client_address):
                 st.error("🚫 Too many login attempts. Please try again later.")
                 return
 
@@ -71,7 +73,15 @@ def auth_view():
             #     st.error("❌ CAPTCHA validation failed. Please try again.")
             #     return
 
-            result, role, tenant_id = authenticate_user(username, password)
+            try:
+                result, role, tenant_id = authenticate_user(username, password)
+            except TimeoutError:
+                st.error("⏳ The server is busy. Please try again in a moment.")
+                return
+            if result is True:
+                clear_attempts(username)
+            elif result is False:
+                log_attempt(username, client_address)
             st.session_state.login_attempted = True
             st.session_state.login_result = result
             st.session_state.username_temp = username
@@ -95,14 +105,20 @@ def auth_view():
                     else:
                         st.error(f"Error: {resend_result['error']}")
             elif result is True:
+                # Principal and permissions are resolved once here; renders read them from the session store
+                principal = get_session_store().create(username)
+                # One-shot: an expired session must not log straight back in from the old result
+                st.session_state.login_attempted = False
+                st.session_state.session_id = principal["session_id"]
                 st.session_state.authenticated = True
                 st.session_state.username = username
-                st.session_state.role = role
-                st.session_state.tenant_id = tenant_id
+                st.session_state.role = principal["role"]
+                st.session_state.tenant_id = principal["tenant_id"]
                 st.session_state.user = {
+                    "id": principal["user_id"],
                     "username": username,
-                    "role": role,
-                    "tenant_id": tenant_id
+                    "role": principal["role"],
+                    "tenant_id": principal["tenant_id"]
                 }
                 st.success("✅ Login successful.")
                 st.rerun()
@@ -4,7 +4,9 @@ import streamlit as st
 from db.database import get_db_connection
 from werkzeug.security import generate_password_hash
 from urllib.parse import parse_qs
-import bcrypt
+from services.password_hasher import hash_password
+from services.token_store import RESET, consume_token, peek_token
+from services.session_store import get_session_store
 import time
 
 def reset_password():
@@ -17,21 +19,10 @@ def reset_password():
         st.error("❌ Invalid or missing token.")
         return
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT user_id FROM password_resets
-        WHERE token = ? AND is_used = 0
-        AND datetime(created_at) >= datetime('now', '-30 minutes')
-    """, (token,))
-    row = cursor.fetchone()
-
-    if not row:
+    if peek_token(token, RESET) is None:
         st.error("⏳ Token is expired or invalid.")
         return
 
-    user_id = row[0]
     new_pass = st.text_input("New Password", type="password")
     confirm_pass = st.text_input("Confirm Password", type="password")
 
@@ -41,14 +32,24 @@ def reset_password():
         elif len(new_pass) < 8:
             st.error("🔐 Password must be at least 8 characters.")
         else:
-            hashed = bcrypt.hashpw(new_pass.encode(), bcrypt.gensalt())
-            cursor.execute("UPDATE users SET password = ? WHERE id = ?", (hashed, user_id))
-            cursor.execute("UPDATE password_resets SET is_used = 1 WHERE token = ?", (token,))
+            # Hashed before the token is redeemed, so a busy server doesn't burn the link
+            try:
+                hashed_pw = hash_password(new_pass)
+            except TimeoutError:
+                st.error("⏳ The server is busy. Please try again in a moment.")
+                return
+            # Redeemed only now, so a mistyped confirmation doesn't burn the link either
+            user_id = consume_token(token, RESET)
+            if user_id is None:
+                st.error("⏳ Token is expired or invalid.")
+                return
+            conn = get_db_connection()
+            conn.execute("UPDATE users SET password = ? WHERE id = ?", (hashed_pw, user_id))
             conn.commit()
+            conn.close()
+            # Sessions opened with the old password end now
+            get_session_store().end_user_sessions(user_id)
             st.success("✅ Password updated! Redirecting to login...")
             time.sleep(2)
             st.query_params.clear()  # ✅ Clears token param
             st.rerun()
-
-
-    conn.close()
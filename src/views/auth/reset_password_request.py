@@ -1,12 +1,12 @@
 
 
 import streamlit as st
-import secrets
 import smtplib
 from email.message import EmailMessage
 from db.database import get_db_connection
 from datetime import datetime
 from utils.email_utils import send_password_reset_email
+from services.token_store import RESET, issue_token
 
 def reset_password_request():
     st.title("🔑 Reset Your Password")
@@ -22,13 +22,7 @@ def reset_password_request():
 
         if user:
             user_id = user[0]
-            token = secrets.token_urlsafe(32)
-
-            cursor.execute("""
-                INSERT INTO password_resets (user_id, email, token)
-                VALUES (?, ?, ?)
-            """, (user_id, email_input, token))
-            conn.commit()
+            token = issue_token(user_id, RESET)
 
             # Get username fron users table
             cursor.execute("SELECT username FROM users WHERE id = ?", (user_id,))
@@ -1,8 +1,10 @@
 import streamlit as st
 from db.database import get_db_connection
-from utils.session import init_session_state
+from utils.session_guard import requires, current_principal
 from billing_engine import get_invoice_summary, generate_invoice_for_user
 from utils.pdf_utils import generate_invoice_pdf
+from services.catalogue import get_catalogue
+from services.subscriptions import active_subscription
 
 
 def get_tenant_info(cursor, tenant_id):
@@ -31,16 +33,8 @@ def get_client_info(cursor, user_id):
         }
     return {}
 
-def get_user_id(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users WHERE username = ?", (user_id,))
-    user_row = cursor.fetchone()
-    conn.close()
-    return user_row[0] if user_row else None
-    
-def get_payment_history(invoice_id):
-    conn = get_db_connection()
+def get_payment_history(invoice_id, tenant_id=None):
+    conn = get_db_connection(tenant_id)
     cursor = conn.cursor()
     cursor.execute("""
         SELECT amount, payment_date, payment_method, notes
@@ -52,37 +46,28 @@ def get_payment_history(invoice_id):
     conn.close()
     return history
 
+@requires("invoices.view")
 def client_billing_portal():
-    init_session_state()
-
-    if not st.session_state.get("authenticated"):
-        st.warning("🔒 Please log in to view your billing portal.")
-        st.stop()
-
-    user_id = st.session_state.username  
-    tenant_id = st.session_state.tenant_id
+    principal = current_principal()
+    user_id = principal["user_id"]
+    tenant_id = principal["tenant_id"]
 
     st.subheader("📦 My Current Plan & Billing Summary")
 
-    conn = get_db_connection()
+    conn = get_db_connection(tenant_id)
     cursor = conn.cursor()
     
     # 1. Fetch active subscription and plan
-    cursor.execute("""
-        SELECT p.name, p.description, p.monthly_fee, p.included_units, p.overage_rate, s.start_date
-        FROM subscriptions s
-        JOIN plans p ON s.plan_id = p.id
-        WHERE s.user_id = ? AND s.is_active = 1
-        ORDER BY s.start_date DESC LIMIT 1
-    """, (get_user_id(user_id),))
-    plan = cursor.fetchone()
+    subscription = active_subscription(cursor, tenant_id, user_id)
+    plan = get_catalogue(cursor, tenant_id).plans.get(subscription[1]) if subscription else None
 
     if not plan:
         st.warning("🚫 You are not currently subscribed to any plan.")
         conn.close()
         return
 
-    plan_name, description, monthly_fee, included_units, overage_rate, start_date = plan
+    plan_name, description, monthly_fee, included_units, overage_rate, _ = plan
+    start_date = subscription[2]
 
     st.markdown(f"**Plan Name:** `{plan_name}`")
     st.markdown(f"**Description:** {description or '_No description_'}")
@@ -101,7 +86,7 @@ def client_billing_portal():
         WHERE user_id = ? AND tenant_id = ?
         GROUP BY metric_name
         ORDER BY metric_name
-    """, (get_user_id(user_id), tenant_id))
+    """, (user_id, tenant_id))
     usage_data = cursor.fetchall()
 
     if usage_data:
@@ -126,7 +111,7 @@ def client_billing_portal():
         FROM invoices
         WHERE user_id = ?
         ORDER BY invoice_date DESC
-    """, (get_user_id(user_id),))
+    """, (user_id,))
     invoice_rows = cursor.fetchall()
 
     client_info = get_client_info(cursor=cursor, user_id=user_id)
@@ -136,11 +121,12 @@ def client_billing_portal():
     else:
         for invoice_row in invoice_rows:
             invoice_id = invoice_row[0]
-            invoice, items = get_invoice_summary(invoice_id)
+            invoice, items = get_invoice_summary(invoice_id, tenant_id)
 
             with st.expander(f"📄 Invoice #{invoice_id} - {invoice['invoice_date']}"):
                 st.markdown(f"**Status:** {invoice['is_paid'] and '✅ Paid' or '❌ Unpaid'}")
                 st.markdown(f"**Total Amount:** R{invoice['total_amount']:.2f}")
+                st.markdown(f"**Paid:** R{invoice['amount_paid']:.2f} · **Balance Due:** R{invoice['balance_due']:.2f}")
 
                 st.markdown("**📦 Invoice Items:**")
                 for item in items:
@@ -164,7 +150,7 @@ def client_billing_portal():
 
                 # Payment history
                 st.markdown("**💳 Payment History:**")
-                payments = get_payment_history(invoice_id)
+                payments = get_payment_history(invoice_id, tenant_id)
                 if payments:
                     for amt, date, payment_method, note in payments:
                         st.markdown(f"- R{amt:.2f} on `{date}` via `{payment_method}`" + (f" – _{note}_" if note else ""))
@@ -4,8 +4,11 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 from db.database import get_db_connection
-from utils.session import init_session_state
+from utils.session_guard import requires, current_principal
 from billing_engine import get_invoice_summary, generate_invoice_pdf
+from services.usage_alerts import get_period_notifications
+from services.catalogue import get_catalogue
+from services.subscriptions import active_subscription
 from io import StringIO, BytesIO
 from datetime import datetime
 from PyPDF2 import PdfReader
@@ -43,23 +46,11 @@ def get_client_info(user_id):
     conn.close()
     return {}
 
-def get_user_id(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users WHERE username = ?", (user_id,))
-    user_row = cursor.fetchone()
-    conn.close()
-    return user_row[0] if user_row else None
-
+@requires("client.dashboard")
 def client_dashboard():
-    init_session_state()
-
-    if not st.session_state.get("authenticated"):
-        st.warning("🔒 Please log in to view your dashboard.")
-        st.stop()
-
-    user_id = st.session_state.username
-    tenant_id = st.session_state.tenant_id
+    principal = current_principal()
+    user_id = principal["user_id"]
+    tenant_id = principal["tenant_id"]
     included_units = 0  # Fallback if no subscription exists
 
     st.title("📊 Client Dashboard")
@@ -72,23 +63,18 @@ def client_dashboard():
 
     # --- Plan Overview ---
     with tabs[0]:
-        conn = get_db_connection()
+        conn = get_db_connection(tenant_id)
         cursor = conn.cursor()
         
-        cursor.execute("""
-            SELECT p.name, p.description, p.monthly_fee, p.included_units, p.overage_rate, s.start_date
-            FROM subscriptions s
-            JOIN plans p ON s.plan_id = p.id
-            WHERE s.user_id = ? AND s.is_active = 1
-            ORDER BY s.start_date DESC LIMIT 1
-        """, (get_user_id(user_id),))
-        plan = cursor.fetchone()
+        subscription = active_subscription(cursor, tenant_id, user_id)
+        plan = get_catalogue(cursor, tenant_id).plans.get(subscription[1]) if subscription else None
         conn.close()
 
         if not plan:
             st.warning("🚫 You are not subscribed to a plan.")
         else:
-            plan_name, description, monthly_fee, included_units, overage_rate, start_date = plan
+            plan_name, description, monthly_fee, included_units, overage_rate, _ = plan
+            start_date = subscription[2]
 
             with st.expander("📦 Plan Summary", expanded=True):
                 st.markdown(f"**Plan Name:** `{plan_name}`")
@@ -99,7 +85,7 @@ def client_dashboard():
 
     # --- Usage Analytics ---
     with tabs[1]:
-        conn = get_db_connection()
+        conn = get_db_connection(tenant_id)
         cursor = conn.cursor()
 
         st.subheader("🔍 Filter Usage")
@@ -111,7 +97,7 @@ def client_dashboard():
             FROM usage_records
             WHERE user_id = ? AND tenant_id = ?
         """
-        params = [get_user_id(user_id), tenant_id]
+        params = [user_id, tenant_id]
 
         if metric_filter:
             query += " AND metric_type LIKE ?"
@@ -174,24 +160,24 @@ def client_dashboard():
             st.download_button(
                 label="Download CSV",
                 data=csv_buffer.getvalue(),
-                file_name=f"{user_id}_usage_export.csv",
+                file_name=f"{principal['username']}_usage_export.csv",
                 mime="text/csv"
             )
 
     # --- Latest Invoice ---
     with tabs[2]:
-        conn = get_db_connection()
+        conn = get_db_connection(tenant_id)
         cursor = conn.cursor()
         cursor.execute("""
             SELECT id FROM invoices
             WHERE user_id = ? ORDER BY invoice_date DESC LIMIT 1
-        """, (get_user_id(user_id),))
+        """, (user_id,))
         row = cursor.fetchone()
         conn.close()
 
         if row:
             invoice_id = row[0]
-            invoice, items = get_invoice_summary(invoice_id)
+            invoice, items = get_invoice_summary(invoice_id, tenant_id)
 
             st.markdown(f"**Invoice ID:** `{invoice['id']}`")
             st.markdown(f"**Period:** `{invoice['period_start']}` to `{invoice['period_end']}`")
@@ -208,7 +194,7 @@ def client_dashboard():
     with tabs[3]:
         st.subheader("📜 Historical Invoice History")
 
-        conn = get_db_connection()
+        conn = get_db_connection(tenant_id)
         cursor = conn.cursor()
 
         # Filters
@@ -217,7 +203,7 @@ def client_dashboard():
             status_filter = st.selectbox("Filter by Status", ["All", "Paid", "Unpaid"])
 
         query = "SELECT id, invoice_date, period_start, period_end, total_amount, is_paid FROM invoices WHERE user_id = ?"
-        params = [get_user_id(user_id)]
+        params = [user_id]
 
         if len(date_range) == 2:
             query += " AND invoice_date BETWEEN ? AND ?"
@@ -246,14 +232,14 @@ def client_dashboard():
             st.download_button(
                 label="⬇️ Download All Invoices as CSV",
                 data=df_inv_display.to_csv(index=False),
-                file_name=f"{user_id}_invoice_history.csv",
+                file_name=f"{principal['username']}_invoice_history.csv",
                 mime="text/csv"
             )
 
             # View PDF inline
             selected_id = st.selectbox("Select Invoice ID to Preview PDF", df_inv["ID"])
             if selected_id:
-                invoice, items = get_invoice_summary(selected_id)
+                invoice, items = get_invoice_summary(selected_id, tenant_id)
                 pdf_bytes = generate_invoice_pdf(invoice, items, tenant_info=tenant_info, client_info=client_info, logo_path="src/assets/logo.png")
 
                 b64 = base64.b64encode(pdf_bytes.getvalue()).decode('utf-8')
@@ -273,13 +259,13 @@ def client_dashboard():
     with tabs[4]:  
         st.subheader("🔔 Notifications")
 
-        conn = get_db_connection()
+        conn = get_db_connection(tenant_id)
         cursor = conn.cursor()
 
         # 1. Overdue Invoices
         st.markdown("### ❌ Overdue Invoices")
         cursor.execute("""
-            SELECT id, invoice_date, due_date, total_amount
+            SELECT id, invoice_date, due_date, balance_due
             FROM invoices
             WHERE user_id = ? AND is_paid = 0 AND due_date < DATE('now')
             ORDER BY due_date ASC
@@ -296,28 +282,15 @@ def client_dashboard():
         # 2. Usage Threshold Alert
         st.markdown("### 📊 Usage Threshold")
 
-        # Get current month start and end
-        today = datetime.now()
-        first_day = today.replace(day=1).date().isoformat()
-        last_day = today.date().isoformat()
-
-        cursor.execute("""
-            SELECT COALESCE(SUM(usage_amount), 0)
-            FROM usage_records
-            WHERE user_id = ? AND tenant_id = ? AND usage_date BETWEEN ? AND ?
-        """, (get_user_id(user_id), tenant_id, first_day, last_day))
-        monthly_usage = cursor.fetchone()[0] or 0
+        # Threshold crossings are recorded on ingest by services.usage_alerts
+        usage_alerts = get_period_notifications(tenant_id, user_id=user_id)
 
-        if included_units > 0:
-            usage_pct = (monthly_usage / included_units) * 100
-        else:
-            usage_pct = 0
-        
-        if usage_pct >= 100:
-            st.error(f"⚠️ You have **exceeded** your usage limit! ({monthly_usage} units used / {included_units} included)")
-        elif usage_pct >= 80:
-            st.warning(f"⏳ You have used **{usage_pct:.1f}%** of your monthly units. Consider upgrading.")
-        else:
-            st.info(f"📉 Usage is within limits: {monthly_usage} units used.")
+        if not usage_alerts:
+            st.info("📉 Usage is within limits for all metrics this month.")
+        for _, metric_name, threshold, used, limit, _ in usage_alerts:
+            if threshold >= 100:
+                st.error(f"⚠️ You have **exceeded** your {metric_name} limit! ({used} used / {limit} included)")
+            else:
+                st.warning(f"⏳ You have used **{threshold}%** of your monthly {metric_name}. Consider upgrading.")
 
         conn.close()
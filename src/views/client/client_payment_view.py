@@ -4,38 +4,27 @@ import streamlit as st
 import os
 from datetime import datetime
 from db.database import get_db_connection
-from utils.session_guard import require_login
-from pathlib import Path
-
-def get_user_id(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users WHERE username = ?", (user_id,))
-    user_row = cursor.fetchone()
-    conn.close()
-    return user_row[0] if user_row else None
+from utils.session_guard import requires, current_principal
+from services.receipt_store import store_receipt
 
+@requires("payments.submit")
 def client_payment_view():
     st.set_page_config(page_title="💰 My Payments", layout="wide")
-    require_login('client')
+    principal = current_principal()
 
-    user = st.session_state.get("user")
-    if not user:
-        st.stop()
-
-    user_id = st.session_state.username
+    user_id = principal["user_id"]
     st.title("💳 My Payments")
 
-    conn = get_db_connection()
+    conn = get_db_connection(principal["tenant_id"])
     cursor = conn.cursor()
 
     # --- Get unpaid invoices
     cursor.execute("""
-        SELECT id, invoice_date, total_amount
+        SELECT id, invoice_date, balance_due
         FROM invoices
         WHERE user_id = ? AND is_paid = 0
         ORDER BY invoice_date DESC
-    """, (get_user_id(user_id),))
+    """, (user_id,))
     invoices = cursor.fetchall()
 
     if not invoices:
@@ -43,7 +32,7 @@ def client_payment_view():
         return
 
     for invoice_id, invoice_date, amount in invoices:
-        st.subheader(f"🧾 Invoice #{invoice_id} — {invoice_date} — R{amount:.2f}")
+        st.subheader(f"🧾 Invoice #{invoice_id} — {invoice_date} — R{amount:.2f} due")
 
         with st.expander("💸 Submit Payment"):
             with st.form(f"payment_form_{invoice_id}", clear_on_submit=True):
@@ -56,26 +45,24 @@ def client_payment_view():
                     if not receipt_file:
                         st.warning("📎 Please upload a receipt.")
                     else:
-                        # Save file
-                        save_dir = Path("uploaded_receipts")
-                        save_dir.mkdir(exist_ok=True)
-                        filename = f"receipt_{invoice_id}_{user_id}_{receipt_file.name}"
-                        file_path = save_dir / filename
-
-                        with open(file_path, "wb") as f:
-                            f.write(receipt_file.read())
+                        # Save file (once per distinct content)
+                        receipt = store_receipt(receipt_file, receipt_file.name, receipt_file.type)
 
                         # Insert payment record
                         cursor.execute("""
-                            INSERT INTO payments (user_id, invoice_id, amount, payment_date, payment_method, receipt_path, is_verified)
-                            VALUES (?, ?, ?, ?, ?, ?, 0)
+                            INSERT INTO payments (user_id, invoice_id, amount, payment_date, payment_method, receipt_path,
+                                                  receipt_size, receipt_sha256, receipt_mime, is_verified)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
                         """, (
-                            get_user_id(user_id),
+                            user_id,
                             invoice_id,
                             amount,
                             payment_date.strftime("%Y-%m-%d"),
                             payment_method,
-                            str(file_path)
+                            receipt["path"],
+                            receipt["size"],
+                            receipt["sha256"],
+                            receipt["mime"]
                         ))
 
                         conn.commit()
@@ -4,77 +4,44 @@ import streamlit as st
 from datetime import datetime
 import os
 import pandas as pd
-from utils.session_guard import require_login
+from utils.session_guard import requires, current_principal
 from db.database import get_db_connection
 from billing_engine import estimate_invoice_for_user, finalize_invoice_for_user, get_client_info, get_tenant_info
 from utils.pdf_utils import generate_invoice_pdf
+from services.usage_meter import get_usage_meter
+from services.subscriptions import active_subscription
 
 
-def get_user_id(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users WHERE username = ?", (user_id,))
-    user_row = cursor.fetchone()
-    conn.close()
-    return user_row[0] if user_row else None
-
+@requires("usage.view")
 def client_usage_dashboard():
     st.set_page_config(page_title="Usage Dashboard", layout="wide")
-    require_login("client")
-
-    user = st.session_state.get("user")
-    if not user:
-        st.stop()
+    principal = current_principal()
  
     st.title("📊 My Usage Dashboard")
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    user_id = principal["user_id"]
+    tenant_id = principal["tenant_id"]
 
-    user_id = st.session_state.username 
-    tenant_id = st.session_state.tenant_id
+    conn = get_db_connection(tenant_id)
+    cursor = conn.cursor()
 
     # --- Fetch active subscription ---
-    cursor.execute("""
-        SELECT plan_id FROM subscriptions 
-        WHERE user_id = ? AND is_active = 1
-    """, (get_user_id(user_id),))
-    row = cursor.fetchone()
-    if not row:
+    if not active_subscription(cursor, tenant_id, user_id):
         st.warning("No active subscription found.")
         conn.close()
         return
 
-    plan_id = row[0]
+    # --- Month-to-date usage vs plan limits from the live usage meter ---
+    metric_usage = get_usage_meter().user_usage(tenant_id, user_id)
 
-    # --- Fetch plan metric limits ---
-    cursor.execute("""
-        SELECT um.name, pml.metric_limit
-        FROM plan_metric_limits pml
-        JOIN usage_metrics um ON pml.metric_id = um.id
-        WHERE pml.plan_id = ?
-    """, (plan_id,))
-    limits = dict(cursor.fetchall())
-
-    if not limits:
+    if not metric_usage:
         st.warning(f"Your plan has no metric limits defined.")
         conn.close()
         return
 
-    # --- Fetch usage for current month ---
-    current_month = datetime.utcnow().strftime('%Y-%m')
-    cursor.execute("""
-        SELECT metric_name, SUM(usage_amount)
-        FROM usage_records
-        WHERE user_id = ?
-          AND strftime('%Y-%m', usage_date) = ?
-        GROUP BY metric_name
-    """, (get_user_id(user_id), current_month))
-    usage = dict(cursor.fetchall())
-
     # --- Display usage per metric ---
-    for metric_name, limit in limits.items():
-        used = usage.get(metric_name, 0)
+    for metric in metric_usage:
+        metric_name, used, limit = metric["metric_name"], metric["used"], metric["limit"]
         percent_used = min(int((used / limit) * 100), 100) if limit else 0
 
         st.subheader(f"🔹 {metric_name}")
@@ -95,32 +62,32 @@ def client_usage_dashboard():
     st.subheader("💳 Invoice & Payment History")
 
     cursor.execute("""
-        SELECT i.id, i.period_start, i.period_end, i.total_amount, 
-            IFNULL(p.amount, 0), IFNULL(p.payment_date, '-'), 
-            CASE 
-                WHEN p.is_verified = 1 THEN '✅ Verified'
-                WHEN p.id IS NOT NULL THEN '⏳ Pending Verification'
+        SELECT i.id, i.period_start, i.period_end, i.total_amount, i.amount_paid, i.balance_due,
+            CASE
+                WHEN i.is_paid = 1 THEN '✅ Paid'
+                WHEN EXISTS (SELECT 1 FROM payments p WHERE p.invoice_id = i.id AND p.is_verified = 0)
+                    THEN '⏳ Pending Verification'
+                WHEN i.amount_paid > 0 THEN '🟡 Part Paid'
                 ELSE '❌ Unpaid'
             END as status
         FROM invoices i
-        LEFT JOIN payments p ON i.id = p.invoice_id
         WHERE i.user_id = ?
         ORDER BY i.period_start DESC
-    """, (get_user_id(user_id),))
+    """, (user_id,))
 
     rows = cursor.fetchall()
 
     if rows:
         df = pd.DataFrame(rows, columns=[
             "Invoice ID", "Period Start", "Period End", "Amount",
-            "Paid Amount", "Payment Date", "Status"
+            "Paid Amount", "Balance Due", "Status"
         ])
         st.dataframe(df, use_container_width=True)
     else:
         st.info("No invoice or payment records found.")
 
     # --- Estimate invoice ---
-    items, estimated_total = estimate_invoice_for_user(get_user_id(user_id), tenant_id)
+    items, estimated_total = estimate_invoice_for_user(user_id, tenant_id)
 
     if not items:
         st.info("No invoice data available. Make sure you're subscribed and have usage records.")
@@ -153,13 +120,13 @@ def client_usage_dashboard():
     st.download_button(
         label="📥 Download PDF Preview",
         data=pdf_bytes,
-        file_name=f"invoice_preview_{user_id}.pdf",
+        file_name=f"invoice_preview_{principal['username']}.pdf",
         mime="application/pdf"
     )
 
     # --- Finalize invoice ---
     if st.button("💳 Bill Now"):
-        success, result = finalize_invoice_for_user(get_user_id(user_id), user["tenant_id"])
+        success, result = finalize_invoice_for_user(user_id, tenant_id)
         if success:
             st.success(f"✅ Invoice #{result} created successfully.")
             st.rerun()
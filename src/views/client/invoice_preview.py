@@ -3,15 +3,14 @@
 import streamlit as st
 import sqlite3
 from datetime import datetime
-from utils.session_guard import require_login
+from utils.session_guard import requires, current_principal
 from billing_engine import estimate_invoice_for_user
 
+@requires("invoices.view")
 def invoice_preview():
-    user = st.session_state.get("user")
-    if not user:
-        st.stop()
+    user = current_principal()
     st.title("🧾 Invoice Preview")
-    user_id = user["username"]
+    user_id = user["user_id"]
     tenant_id = user["tenant_id"]
 
     if not user_id or not tenant_id:
@@ -1,61 +1,40 @@
 #src/views/subscription_client.py
 
 import streamlit as st
-import sqlite3
-from datetime import datetime
-from utils.session_guard import require_login
+from utils.session_guard import requires, current_principal
 from db.database import get_db_connection
+from services.catalogue import get_catalogue
+from services.subscriptions import active_subscription, assign_plan, cancel_subscription
 
+@requires("subscription.manage")
 def subscription_client():
     st.set_page_config(page_title="My Subscription", layout="centered")
 
-    require_login('client')
-
-    user = st.session_state.get("user")
-    if not user:
-        st.stop()
-
-    user_id = st.session_state.username
+    user = current_principal()
+    u_id = user["user_id"]
     st.title("📦 My Subscription Plan")
 
-    conn = get_db_connection()
+    conn = get_db_connection(user["tenant_id"])
     cursor = conn.cursor()
-
-    # --- Get user ID from users table
-    cursor.execute("SELECT id FROM users WHERE username = ?", (user_id,))
-    user_row = cursor.fetchone()
-    
-    u_id = user_row[0] if user_row else None
     
     # --- Get active subscription
-    cursor.execute("""
-        SELECT s.id, p.name, p.description, p.monthly_fee, p.included_units, p.overage_rate, s.start_date, s.end_date, s.is_active
-        FROM subscriptions s
-        JOIN plans p ON s.plan_id = p.id
-        WHERE s.user_id = ? AND s.is_active = 1
-    """, (u_id,))
-    active_subscription = cursor.fetchone()
-
-    if active_subscription:
+    catalogue = get_catalogue(cursor, user["tenant_id"])
+    subscription = active_subscription(cursor, user["tenant_id"], u_id)
+    current_plan = catalogue.plans.get(subscription[1]) if subscription else None
+
+    if current_plan:
         st.subheader("📄 Current Subscription")
-        st.markdown(f"**Plan:** {active_subscription[1]}")
-        st.markdown(f"**Description:** {active_subscription[2]}")
-        st.markdown(f"**Monthly Fee:** R{active_subscription[3]:.2f}")
-        st.markdown(f"**Included Units:** {active_subscription[4]} units")
-        st.markdown(f"**Overage Rate:** R{active_subscription[5]:.2f} per unit")
-        st.markdown(f"**Started On:** {active_subscription[6]}")
-        st.markdown(f"**Ends On:** {active_subscription[7] or 'Ongoing'}")
+        st.markdown(f"**Plan:** {current_plan[0]}")
+        st.markdown(f"**Description:** {current_plan[1]}")
+        st.markdown(f"**Monthly Fee:** R{current_plan[2]:.2f}")
+        st.markdown(f"**Included Units:** {current_plan[3]} units")
+        st.markdown(f"**Overage Rate:** R{current_plan[4]:.2f} per unit")
+        st.markdown(f"**Started On:** {subscription[2]}")
+        st.markdown("**Ends On:** Ongoing")
 
         # Optional: Cancel button
         if st.button("❌ Cancel Subscription"):
-            cursor.execute("UPDATE subscriptions SET is_active = 0, end_date = ? WHERE id = ?", (datetime.utcnow().strftime("%Y-%m-%d"), active_subscription[0]))
-            
-            cursor.execute("""
-                INSERT INTO subscription_audit (user_id, tenant_id, action, old_plan_id, new_plan_id, timestamp)
-                VALUES (?, ?, 'cancelled', ?, NULL, ?)
-            """, (u_id, user["tenant_id"], active_subscription[0], datetime.utcnow().isoformat()))
-
-            conn.commit()
+            cancel_subscription(user["tenant_id"], u_id)
             st.success("Subscription cancelled.")
             st.rerun()
 
@@ -65,8 +44,7 @@ def subscription_client():
     # --- List available plans
     st.subheader("📋 Available Plans")
 
-    cursor.execute("SELECT id, name, description, monthly_fee, included_units, overage_rate FROM plans WHERE tenant_id = ?", (user["tenant_id"],))
-    plans = cursor.fetchall()
+    plans = [(plan_id,) + plan[:5] for plan_id, plan in catalogue.plans.items()]
 
     if not plans:
         st.warning("No plans available for your tenant.")
@@ -93,21 +71,8 @@ def subscription_client():
             st.info("Actual usage may vary. You’ll be billed at the end of the period based on real usage.")
             
         if st.button("✅ Subscribe to this plan"):
-            # End current subscription if any
-            cursor.execute("UPDATE subscriptions SET is_active = 0, end_date = ? WHERE user_id = ? AND is_active = 1", 
-                        (datetime.utcnow().strftime("%Y-%m-%d"), u_id))
-
-            # Add new subscription
-            cursor.execute("""
-                INSERT INTO subscriptions (user_id, tenant_id, plan_id, start_date, is_active)
-                VALUES (?, ?, ?, ?, 1)
-            """, (u_id, user["tenant_id"], selected_plan[0], datetime.utcnow().strftime("%Y-%m-%d")))
-
-            cursor.execute("""
-                INSERT INTO subscription_audit (user_id, tenant_id, action, old_plan_id, new_plan_id, timestamp)
-                VALUES (?, ?, 'subscribed', NULL, ?, ?)
-            """, (u_id, user["tenant_id"], selected_plan[0], datetime.utcnow().isoformat()))
-            conn.commit()
+            # Ends the current subscription and records the switch in one transaction
+            assign_plan(user["tenant_id"], u_id, selected_plan[0])
 
             st.success("🎉 You’ve successfully subscribed to a new plan!")
             st.rerun()
@@ -1,16 +1,18 @@
 #src/views/superadmin/admin_analytics_dashboard.py
 import streamlit as st
+from utils.session_guard import requires
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from db.database import get_db_connection
+from db.database import get_analytics_connection, query_all_tenants
 from datetime import datetime, timedelta
 from dateutil import parser
 
+@requires("analytics.view")
 def render_admin_analytics_dashboard():
     st.title("📊 Admin Analytics Dashboard")
 
-    conn = get_db_connection()
+    conn = get_analytics_connection()
     cursor = conn.cursor()
 
     # --- Sidebar Filters ---
@@ -30,13 +32,13 @@ def render_admin_analytics_dashboard():
 
     with tab1:
         st.subheader("💰 Key Metrics")
-        cursor.execute("""
+        # Tenant-scoped tables are fanned out across tenant databases and re-aggregated here
+        revenue_data = query_all_tenants("""
             SELECT tenant_id, strftime('%Y-%m', invoice_date) as month, SUM(total_amount) as revenue
             FROM invoices
             WHERE invoice_date BETWEEN ? AND ?
             GROUP BY tenant_id, month
-        """, (start_date, end_date))
-        revenue_data = cursor.fetchall()
+        """, (start_date, end_date), snapshot=True)
 
         df_rev = pd.DataFrame(revenue_data, columns=["tenant_id", "month", "revenue"])
         df_mrr = df_rev.groupby("month").agg(mrr=("revenue", "sum")).reset_index()
@@ -45,15 +47,15 @@ def render_admin_analytics_dashboard():
         st.metric("📈 Total MRR (last month)", f"R{df_mrr['mrr'].iloc[-1]:,.2f}" if not df_mrr.empty else "N/A")
         st.metric("📊 Avg ARPU per Tenant", f"R{df_arpu['arpu'].mean():.2f}" if not df_arpu.empty else "N/A")
 
-        cursor.execute("""
+        subs = query_all_tenants("""
             SELECT strftime('%Y-%m', start_date) as month, COUNT(DISTINCT user_id)
             FROM subscriptions
             WHERE is_active = 1
             GROUP BY month
             ORDER BY month
-        """)
-        subs = cursor.fetchall()
+        """, snapshot=True)
         df_churn = pd.DataFrame(subs, columns=["month", "active_users"])
+        df_churn = df_churn.groupby("month", as_index=False)["active_users"].sum()
         df_churn["churn"] = df_churn["active_users"].diff(-1) * -1
 
         st.line_chart(df_churn.set_index("month")["active_users"], height=250, use_container_width=True)
@@ -61,14 +63,13 @@ def render_admin_analytics_dashboard():
 
     with tab2:
         st.subheader("💡 Customer Lifetime Value (CLV)")
-        cursor.execute("""
+        rows = query_all_tenants("""
             SELECT s.tenant_id, s.user_id, t.name, MIN(s.start_date), MAX(s.start_date)
             FROM subscriptions s
             JOIN tenants t ON s.tenant_id = t.id
             WHERE s.is_active = 1
             GROUP BY s.tenant_id, s.user_id
-        """)
-        rows = cursor.fetchall()
+        """, snapshot=True)
         data = []
         for t_id, u_id, tenant_name, min_date, max_date in rows:
             months = (parser.parse(str(max_date)) - parser.parse(str(min_date))).days / 30
@@ -93,12 +94,16 @@ def render_admin_analytics_dashboard():
     with tab4:
         st.subheader("⚠️ Inactive Clients")
         inactive_cutoff = datetime.today() - timedelta(days=30)
-        cursor.execute("""
+        stale = query_all_tenants("""
             SELECT DISTINCT u.username FROM users u
-            LEFT JOIN usage_records um ON u.id = um.user_id
-            WHERE (um.usage_date IS NULL OR um.usage_date < ?) AND u.role = 'client'
-        """, (inactive_cutoff,))
-        inactive_clients = [row[0] for row in cursor.fetchall()]
+            JOIN usage_records um ON u.id = um.user_id
+            WHERE um.usage_date < ? AND u.role = 'client'
+        """, (inactive_cutoff,), snapshot=True)
+        with_usage = query_all_tenants("SELECT DISTINCT user_id FROM usage_records", snapshot=True)
+        cursor.execute("SELECT id, username FROM users WHERE role = 'client'")
+        used_ids = {row[0] for row in with_usage}
+        never_used = {username for user_id, username in cursor.fetchall() if user_id not in used_ids}
+        inactive_clients = sorted({row[0] for row in stale} | never_used)
         if inactive_clients:
             st.warning(f"⚠️ {len(inactive_clients)} clients inactive in last 30 days:")
             st.write(inactive_clients)
@@ -107,34 +112,31 @@ def render_admin_analytics_dashboard():
 
     with tab5:
         st.subheader("💵 Revenue Breakdown by Plan")
-        cursor.execute("""
+        plan_rev = query_all_tenants("""
             SELECT p.name AS plan_name, SUM(i.total_amount) AS revenue
             FROM invoices i
             JOIN subscriptions s ON i.user_id = s.user_id AND s.is_active = 1
             JOIN plans p ON s.plan_id = p.id
             WHERE i.tenant_id = s.tenant_id
             GROUP BY p.name
-        """)
-        plan_rev = cursor.fetchall()
-        df_plan = pd.DataFrame(plan_rev, columns=["Plan", "Revenue"])
+        """, snapshot=True)
+        df_plan = pd.DataFrame(plan_rev, columns=["Plan", "Revenue"]).groupby("Plan", as_index=False)["Revenue"].sum()
         st.bar_chart(df_plan.set_index("Plan"))
 
-        cursor.execute("""
+        tenant_rev = query_all_tenants("""
             SELECT t.name AS tenant_name, SUM(i.total_amount) AS revenue
             FROM invoices i
             JOIN tenants t ON i.tenant_id = t.id
             GROUP BY t.name
-        """)
-        tenant_rev = cursor.fetchall()
-        df_trev = pd.DataFrame(tenant_rev, columns=["Tenant", "Revenue"])
+        """, snapshot=True)
+        df_trev = pd.DataFrame(tenant_rev, columns=["Tenant", "Revenue"]).groupby("Tenant", as_index=False)["Revenue"].sum()
         st.subheader("🏢 Revenue Breakdown by Tenant")
         st.bar_chart(df_trev.set_index("Tenant"))
 
     with tab6:
         st.subheader("🧾 Invoice Payment Status")
-        cursor.execute("SELECT is_paid, COUNT(*) FROM invoices GROUP BY is_paid")
-        status_counts = cursor.fetchall()
-        df_status = pd.DataFrame(status_counts, columns=["is_paid", "count"])
+        status_counts = query_all_tenants("SELECT is_paid, COUNT(*) FROM invoices GROUP BY is_paid", snapshot=True)
+        df_status = pd.DataFrame(status_counts, columns=["is_paid", "count"]).groupby("is_paid", as_index=False)["count"].sum()
         df_status["label"] = df_status["is_paid"].map({0: "Unpaid", 1: "Paid"})
         fig, ax = plt.subplots()
         ax.pie(df_status["count"], labels=df_status["label"], autopct='%1.1f%%', startangle=90)
@@ -145,15 +147,14 @@ def render_admin_analytics_dashboard():
 
         # --- Overdue Invoices by Tenant ---
         st.markdown("### 🚨 Tenants with Overdue Invoices")
-        cursor.execute("""
-            SELECT t.name, t.id, COUNT(*) as overdue_count, SUM(i.total_amount) as total_due
+        overdue = query_all_tenants("""
+            SELECT t.name, t.id, COUNT(*) as overdue_count, SUM(i.balance_due) as total_due
             FROM invoices i
             JOIN tenants t ON i.tenant_id = t.id
             WHERE i.is_paid = 0
             GROUP BY i.tenant_id
             HAVING overdue_count > 0
-        """)
-        overdue = cursor.fetchall()
+        """, snapshot=True)
         if overdue:
             df_overdue = pd.DataFrame(overdue, columns=["Tenant Name", "Tenant ID", "Overdue Count", "Total Due"])
             st.warning(f"{len(df_overdue)} tenants have overdue invoices.")
@@ -163,7 +164,8 @@ def render_admin_analytics_dashboard():
 
         # --- Tenants near usage limits ---
         st.markdown("### ⚠️ Tenants Near Usage Limits")
-        cursor.execute("""
+        usage_alerts = []
+        for row in query_all_tenants("""
             SELECT t.name, SUM(um.usage_amount) as total_usage, p.included_units
             FROM usage_records um
             JOIN tenants t ON um.tenant_id = t.id
@@ -171,9 +173,7 @@ def render_admin_analytics_dashboard():
             JOIN plans p ON s.plan_id = p.id
             WHERE s.is_active = 1
             GROUP BY s.tenant_id, p.included_units
-        """)
-        usage_alerts = []
-        for row in cursor.fetchall():
+        """, snapshot=True):
             name, used, limit = row
             if limit and used >= 0.8 * limit:
                 usage_alerts.append((name, used, limit))
@@ -187,13 +187,12 @@ def render_admin_analytics_dashboard():
 
         # --- Inactive Tenants (No usage in last 30 days) ---
         st.markdown("### 📉 Inactive Tenants")
-        cursor.execute("""
+        active_tenants = {r[0] for r in query_all_tenants("""
             SELECT DISTINCT t.name
             FROM usage_metrics um
             JOIN tenants t ON um.tenant_id = t.id
             WHERE um.usage_date >= DATE('now', '-30 day')
-        """)
-        active_tenants = {r[0] for r in cursor.fetchall()}
+        """, snapshot=True)}
 
         cursor.execute("SELECT DISTINCT name FROM tenants")
         all_tenants = {r[0] for r in cursor.fetchall()}
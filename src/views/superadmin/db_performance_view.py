@@ -0,0 +1,62 @@
+# src/views/superadmin/db_performance_view.py
+
+import os
+
+import pandas as pd
+import streamlit as st
+
+from config import settings
+from db.query_stats import query_stats
+from utils.session_guard import requires
+
+
+def read_slow_query_log(limit=200):
+    if not settings.SLOW_QUERY_LOG or not os.path.exists(settings.SLOW_QUERY_LOG):
+        return []
+    with open(settings.SLOW_QUERY_LOG, encoding="utf-8") as f:
+        return f.readlines()[-limit:]
+
+
+@requires("diagnostics.view")
+def db_performance_view():
+    st.title("🐢 DB Performance")
+    st.caption("Query timings recorded by this app process since start-up (or the last reset).")
+
+    if not settings.QUERY_STATS:
+        st.info("Query instrumentation is disabled (QUERY_STATS=0).")
+        return
+
+    stats = query_stats.snapshot()
+    if not stats:
+        st.info("No queries recorded yet.")
+    else:
+        df = pd.DataFrame([
+            {**row, "call_sites": ", ".join(f"{site} ×{count}" for site, count in row["call_sites"].items())}
+            for row in stats
+        ])
+        k1, k2, k3 = st.columns(3)
+        k1.metric("🧮 Distinct Queries", len(df))
+        k2.metric("🔁 Executions", int(df["calls"].sum()))
+        k3.metric("⏱️ Total Time", f"{df['total_ms'].sum():,.1f} ms")
+
+        st.subheader("📋 Queries by Total Time")
+        st.dataframe(df[["total_ms", "calls", "avg_ms", "max_ms", "rows", "sql", "call_sites"]],
+                     use_container_width=True)
+
+        st.download_button(
+            label="⬇️ Export Stats as JSON",
+            data=query_stats.to_json(),
+            file_name="query_stats.json",
+            mime="application/json"
+        )
+
+    if st.button("♻️ Reset Stats"):
+        query_stats.reset()
+        st.rerun()
+
+    st.subheader(f"🐌 Slow Queries (≥ {settings.SLOW_QUERY_MS:g} ms)")
+    lines = read_slow_query_log()
+    if lines:
+        st.code("".join(reversed(lines)), language="text")
+    else:
+        st.success("✅ No slow queries logged.")
@@ -0,0 +1,56 @@
+# src/views/superadmin/render_profile_view.py
+
+import os
+
+import pandas as pd
+import streamlit as st
+
+from config import settings
+from utils.render_profiler import Profiler, render_stats
+from utils.session_guard import requires
+
+
+def list_captures():
+    if not os.path.isdir(settings.RENDER_PROFILE_DIR):
+        return []
+    names = [name for name in os.listdir(settings.RENDER_PROFILE_DIR) if name.endswith((".html", ".prof"))]
+    return sorted(names, key=lambda name: os.path.getmtime(os.path.join(settings.RENDER_PROFILE_DIR, name)),
+                  reverse=True)
+
+
+@requires("diagnostics.view")
+def render_profile_view():
+    st.title("⏱️ Page Performance")
+    st.caption("Render timings recorded by this app process; every render is also logged to "
+               f"`{settings.RENDER_PROFILE_LOG}`.")
+
+    if not settings.RENDER_PROFILING:
+        st.info("Render profiling is disabled (RENDER_PROFILING=0).")
+        return
+
+    pages = render_stats.slowest()
+    if pages:
+        st.subheader("🐌 Slowest Views")
+        st.dataframe(pd.DataFrame(pages), use_container_width=True)
+    else:
+        st.info("No renders recorded yet.")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        tool = "pyinstrument" if Profiler is not None else "cProfile"
+        if st.button(f"🔬 Capture the next page I open ({tool})"):
+            st.session_state.capture_next_render = True
+            st.success("The next page you open will be profiled.")
+    with col2:
+        if st.button("♻️ Reset Stats"):
+            render_stats.reset()
+            st.rerun()
+
+    st.subheader("📁 Captures")
+    captures = list_captures()
+    if not captures:
+        st.info("No captures yet.")
+        return
+    selected = st.selectbox("Capture", captures)
+    with open(os.path.join(settings.RENDER_PROFILE_DIR, selected), "rb") as f:
+        st.download_button("⬇️ Download Capture", f.read(), file_name=selected)
@@ -1,6 +1,7 @@
 # src/views/superadmin/resend_log_view.py
 
 import streamlit as st
+from utils.session_guard import requires
 import pandas as pd
 from db.database import get_db_connection
 
@@ -19,6 +20,7 @@ def fetch_resend_attempts():
     columns = ["Log ID", "Username", "Email", "Timestamp", "IP Address", "Status", "Reason"]
     return pd.DataFrame(rows, columns=columns)
 
+@requires("diagnostics.view")
 def resend_log_view():
     st.title("🔍 Verification Resend Log Viewer")
     st.caption("Audit log for all verification email resend attempts.")
@@ -2,19 +2,24 @@
 
 import streamlit as st
 from datetime import datetime, timedelta
-from db.database import get_db_connection
-from utils.session_guard import require_login
+from db.database import get_analytics_connection, query_all_tenants
+from utils.session_guard import requires
 from utils.report_utils import generate_superadmin_pdf_report
 import pandas as pd
 import matplotlib.pyplot as plt
 
 
+def fan_out_count(sql, params=(), tenant_ids=None):
+    """Sum a single-value aggregate over every tenant database."""
+    return sum(row[0] or 0 for row in query_all_tenants(sql, params, tenant_ids, snapshot=True))
+
+
+@requires("platform.view")
 def superadmin_dashboard():
     st.set_page_config(page_title="📊 SuperAdmin Dashboard", layout="wide")
-    require_login("superadmin")
     st.title("📊 SuperAdmin Reporting & Analytics")
 
-    conn = get_db_connection()
+    conn = get_analytics_connection()
     cursor = conn.cursor()
 
     # --- Filters ---
@@ -27,15 +32,19 @@ def superadmin_dashboard():
 
         cursor.execute("SELECT id, name FROM tenants ORDER BY name")
         tenants = cursor.fetchall()
+        conn.close()
         tenant_options = ["All"] + [f"{tid}: {tname}" for tid, tname in tenants]
         selected_tenant = st.selectbox("🏢 Tenant", tenant_options)
 
     tenant_filter_sql = ""
     tenant_filter_param = ()
+    # Tenant-scoped tables may be sharded; a selected tenant only queries its own database
+    tenant_ids = None
     if selected_tenant != "All":
         tenant_id = int(selected_tenant.split(":")[0])
         tenant_filter_sql = "AND u.tenant_id = ?"
         tenant_filter_param = (tenant_id,)
+        tenant_ids = [tenant_id]
 
     start_date_str = start_date.strftime("%Y-%m-%d")
     end_date_str = end_date.strftime("%Y-%m-%d")
@@ -53,35 +62,31 @@ def superadmin_dashboard():
         st.subheader("🔢 Key Metrics")
 
         # Total tenants
-        cursor.execute("SELECT COUNT(*) FROM tenants")
-        total_tenants = cursor.fetchone()[0]
+        total_tenants = len(tenants)
 
         # Active subscriptions
-        cursor.execute(f"""
+        active_subs = fan_out_count(f"""
             SELECT COUNT(*) FROM subscriptions s
             JOIN users u ON s.user_id = u.id
             WHERE s.is_active = 1 {tenant_filter_sql}
-        """, tenant_filter_param)
-        active_subs = cursor.fetchone()[0]
+        """, tenant_filter_param, tenant_ids)
 
         # Revenue
-        cursor.execute(f"""
+        total_revenue = fan_out_count(f"""
             SELECT COALESCE(SUM(total_amount), 0) FROM invoices i
             JOIN users u ON i.user_id = u.id
             WHERE i.invoice_date BETWEEN ? AND ? {tenant_filter_sql}
-        """, (start_date_str, end_date_str, *tenant_filter_param))
-        total_revenue = cursor.fetchone()[0]
+        """, (start_date_str, end_date_str, *tenant_filter_param), tenant_ids)
 
         # ARPU
         arpu = total_revenue / active_subs if active_subs > 0 else 0
 
         # Usage logs
-        cursor.execute(f"""
+        usage_logs = fan_out_count(f"""
             SELECT COUNT(*) FROM usage_records ur
             JOIN users u ON ur.user_id = u.id
             WHERE ur.usage_date BETWEEN ? AND ? {tenant_filter_sql}
-        """, (start_date_str, end_date_str, *tenant_filter_param))
-        usage_logs = cursor.fetchone()[0]
+        """, (start_date_str, end_date_str, *tenant_filter_param), tenant_ids)
 
         k1, k2, k3, k4, k5 = st.columns(5)
         k1.metric("🏢 Tenants", total_tenants)
@@ -92,14 +97,15 @@ def superadmin_dashboard():
 
         # --- Top Subscribed Plans ---
         st.subheader("🏆 Top Subscribed Plans")
-        cursor.execute(f"""
+        # Each database's top 5 contains every plan of the overall top 5
+        top_plans = query_all_tenants(f"""
             SELECT p.name, COUNT(*) as count FROM subscriptions s
             JOIN plans p ON s.plan_id = p.id
             JOIN users u ON s.user_id = u.id
             WHERE s.is_active = 1 {tenant_filter_sql}
             GROUP BY s.plan_id ORDER BY count DESC LIMIT 5
-        """, tenant_filter_param)
-        top_plans = cursor.fetchall()
+        """, tenant_filter_param, tenant_ids, snapshot=True)
+        top_plans = sorted(top_plans, key=lambda row: row[1], reverse=True)[:5]
 
 
         if top_plans:
@@ -128,7 +134,8 @@ def superadmin_dashboard():
     # ---------------------- TAB 2: Revenue Trends ----------------------
     with tab2:
         st.subheader("📈 Monthly Revenue Trend")
-        cursor.execute(f"""
+        monthly_revenue = {}
+        for month, revenue in query_all_tenants(f"""
             SELECT strftime('%Y-%m', i.invoice_date) AS month,
                    SUM(i.total_amount)
             FROM invoices i
@@ -136,8 +143,9 @@ def superadmin_dashboard():
             WHERE i.invoice_date BETWEEN ? AND ? {tenant_filter_sql}
             GROUP BY month
             ORDER BY month
-        """, (start_date_str, end_date_str, *tenant_filter_param))
-        revenue_data = cursor.fetchall()
+        """, (start_date_str, end_date_str, *tenant_filter_param), tenant_ids, snapshot=True):
+            monthly_revenue[month] = monthly_revenue.get(month, 0) + revenue
+        revenue_data = sorted(monthly_revenue.items())
 
         if revenue_data:
             df_rev = pd.DataFrame(revenue_data, columns=["Month", "Revenue"])
@@ -150,21 +158,19 @@ def superadmin_dashboard():
         st.subheader("📉 Churn & Retention")
 
         # Churned subs
-        cursor.execute(f"""
+        churned = fan_out_count(f"""
             SELECT COUNT(*) FROM subscriptions s
             JOIN users u ON s.user_id = u.id
             WHERE s.is_active = 0
             AND s.end_date BETWEEN ? AND ? {tenant_filter_sql}
-        """, (start_date_str, end_date_str, *tenant_filter_param))
-        churned = cursor.fetchone()[0]
+        """, (start_date_str, end_date_str, *tenant_filter_param), tenant_ids)
 
         # New subs
-        cursor.execute(f"""
+        new_subs = fan_out_count(f"""
             SELECT COUNT(*) FROM subscriptions s
             JOIN users u ON s.user_id = u.id
             WHERE s.start_date BETWEEN ? AND ? {tenant_filter_sql}
-        """, (start_date_str, end_date_str, *tenant_filter_param))
-        new_subs = cursor.fetchone()[0]
+        """, (start_date_str, end_date_str, *tenant_filter_param), tenant_ids)
 
         st.metric("⬇️ Churned Subscriptions", churned)
         st.metric("⬆️ New Subscriptions", new_subs)
@@ -185,5 +191,3 @@ def superadmin_dashboard():
 
         if st.button("📥 Download Top Plans CSV"):
             st.download_button("⬇️ Download Plans", df.to_csv(index=False), file_name="top_plans.csv")
-
-    conn.close()
@@ -1,5 +1,6 @@
 #src/views/superadmin/tenant_manager.py
 import streamlit as st
+from utils.session_guard import requires
 from db.database import get_db_connection
 
 def load_tenants():
@@ -24,13 +25,10 @@ def update_tenant(tenant_id, name, industry):
     conn.commit()
     conn.close()
 
+@requires("tenants.manage")
 def tenant_manager():
     st.subheader("🏢 Tenant Management")
 
-    if st.session_state.get("role") != "superadmin":
-        st.warning("Access denied. SuperAdmin only.")
-        st.stop()
-
     tenants = load_tenants()
     tenant_names = [t[1] for t in tenants]
     selected = st.selectbox("Select Tenant to Edit", ["-- New Tenant --"] + tenant_names)
@@ -0,0 +1,284 @@
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def limiter(tmp_path, monkeypatch):
+    from config import settings
+    from utils import login_attempts
+
+    monkeypatch.setattr(settings, "LOGIN_ATTEMPTS_DB", str(tmp_path / "login_attempts.db"))
+    return login_attempts
+
+
+def test_login_limiter_sliding_window_per_user_and_address(limiter):
+    now = 1_000_000 * limiter.WINDOW_SECONDS + 10
+    for _ in range(limiter.MAX_ATTEMPTS):
+        assert not limiter.is_rate_limited("Alice", "10.0.0.1", now=now)
+        limiter.log_attempt("Alice", "10.0.0.1", now=now)
+    assert limiter.is_rate_limited("alice", now=now)
+    assert not limiter.is_rate_limited("bob", "10.0.0.1", now=now)
+
+    # Early in the next window most of the previous one is still weighted in; by its end little is
+    limiter.log_attempt("alice", now=now)
+    assert limiter.is_rate_limited("alice", now=now + limiter.WINDOW_SECONDS)
+    assert not limiter.is_rate_limited("alice", now=now + 2 * limiter.WINDOW_SECONDS - 20)
+
+    # Spraying usernames from one address trips the address limit
+    for i in range(limiter.MAX_ATTEMPTS_PER_ADDRESS):
+        limiter.log_attempt(f"user{i}", "10.0.0.2", now=now)
+    assert limiter.is_rate_limited("someone-new", "10.0.0.2", now=now)
+
+    limiter.clear_attempts("ALICE")
+    assert not limiter.is_rate_limited("alice", now=now)
+
+
+def test_login_limiter_counts_concurrent_attempts_exactly(limiter):
+    import sqlite3
+
+    def hammer():
+        for _ in range(200):
+            limiter.log_attempt("target", "10.0.0.9")
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    conn = sqlite3.connect(limiter.limiter_db_path())
+    rows = dict(conn.execute("SELECT key, count + prev_count FROM login_attempts").fetchall())
+    conn.close()
+    assert rows == {"user:target": 1600, "addr:10.0.0.9": 1600}
+
+
+def test_password_hasher_calibrates_and_rehashes_on_login(tmp_path, monkeypatch):
+    import sqlite3
+
+    import bcrypt
+
+    from auth_manager import authenticate_user
+    from config import settings
+    from db.init_billing_schema import init_billing_schema
+    from services import password_hasher
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    init_billing_schema(db_path)
+
+    assert password_hasher.calibrate_cost(target_ms=0) == password_hasher.MIN_COST == 12
+    assert password_hasher.MIN_COST <= password_hasher.calibrate_cost() <= password_hasher.MAX_COST
+
+    monkeypatch.setattr(password_hasher, "_cost", 5)
+    old_hash = bcrypt.hashpw(b"S3cret!pass", bcrypt.gensalt(rounds=4))
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        INSERT INTO users (id, tenant_id, first_name, last_name, company_name, username, password, email, is_verified)
+        VALUES (1, 1, 'Ada', 'L', 'Co', 'ada', ?, 'ada@example.com', 1)
+    """, (old_hash,))
+    conn.commit()
+
+    assert authenticate_user("ada", "wrong") == (False, None, None)
+    assert authenticate_user("ada", "S3cret!pass")[0] is True
+    # The rehash runs in the pool after the login returns
+    deadline = time.monotonic() + 5
+    while (new_hash := conn.execute("SELECT password FROM users WHERE id = 1").fetchone()[0]) == old_hash:
+        assert time.monotonic() < deadline, "password was not rehashed"
+        time.sleep(0.01)
+    # A rehash finishing after a password reset must not restore the old password
+    from auth_manager import save_password_hash
+    assert not save_password_hash(1, bcrypt.hashpw(b"S3cret!pass", bcrypt.gensalt(rounds=5)), old_hash)
+    assert conn.execute("SELECT password FROM users WHERE id = 1").fetchone()[0] == new_hash
+    conn.close()
+    assert password_hasher.hash_cost(new_hash) == 5
+    assert password_hasher.verify_password("S3cret!pass", new_hash)
+    assert not password_hasher.needs_rehash(new_hash)
+    # A stronger stored hash is never rewritten at a lower cost
+    assert not password_hasher.needs_rehash(bcrypt.hashpw(b"S3cret!pass", bcrypt.gensalt(rounds=6)))
+
+
+def test_resend_logging_needs_no_network_and_is_batched(tmp_path, monkeypatch):
+    import socket
+    import sqlite3
+
+    import auth_manager
+    from config import settings
+    from db.init_billing_schema import init_billing_schema
+    from services.resend_log import get_resend_log_writer
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    init_billing_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        INSERT INTO users (id, first_name, last_name, company_name, username, password, email, is_verified)
+        VALUES (1, 'Ada', 'L', 'Co', 'ada', 'x', 'ada@example.com', 0)
+    """)
+    conn.commit()
+
+    def no_network(*args, **kwargs):
+        raise OSError("network disabled in this test")
+
+    for name in ("socket", "create_connection", "gethostbyname", "gethostname", "getaddrinfo"):
+        monkeypatch.setattr(socket, name, no_network)
+    monkeypatch.setattr(auth_manager, "send_verification_email", lambda **kwargs: None)
+
+    started = time.perf_counter()
+    assert auth_manager.resend_verification_email("ada") == {"success": True}
+    assert auth_manager.resend_verification_email("ada")["success"] is False  # too soon
+    for _ in range(50):
+        auth_manager.log_resend_attempt(1, "blocked", "load")
+    assert time.perf_counter() - started < 0.5
+
+    get_resend_log_writer().flush()
+    statuses = [row[0] for row in conn.execute("SELECT status FROM verification_resend_log ORDER BY id")]
+    addresses = {row[0] for row in conn.execute("SELECT ip_address FROM verification_resend_log")}
+    conn.close()
+    assert statuses[:2] == ["sent", "blocked"] and len(statuses) == 52
+    assert addresses == {"unknown"}
+
+
+def test_token_store_single_use_expiry_and_sweep(tmp_path, monkeypatch):
+    import sqlite3
+
+    from auth_manager import verify_token
+    from config import settings
+    from db.init_billing_schema import init_billing_schema
+    from services import token_store
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    init_billing_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        INSERT INTO users (id, first_name, last_name, company_name, username, password, email, is_verified,
+                           verification_token)
+        VALUES (1, 'Ada', 'L', 'Co', 'ada', 'x', 'ada@example.com', 0, 'legacy-link')
+    """)
+    conn.commit()
+    init_billing_schema(db_path)  # migrates the outstanding legacy link
+
+    now = 1_700_000_000
+    first = token_store.issue_token(1, token_store.RESET, now=now)
+    second = token_store.issue_token(1, token_store.RESET, now=now)
+    assert token_store.peek_token(first, token_store.RESET, now=now) is None  # replaced
+    assert token_store.peek_token(second, token_store.VERIFY, now=now) is None  # wrong purpose
+    assert token_store.peek_token(second, token_store.RESET, now=now) == 1
+    assert token_store.consume_token(second, token_store.RESET, now=now) == 1
+    assert token_store.consume_token(second, token_store.RESET, now=now) is None
+
+    expiring = token_store.issue_token(1, token_store.RESET, ttl=60, now=now)
+    assert token_store.consume_token(expiring, token_store.RESET, now=now + 60) is None
+    stored = [row[0] for row in conn.execute("SELECT token_hash FROM auth_tokens")]
+    assert token_store.hash_token(expiring) in stored and expiring not in stored
+    assert token_store.sweep_expired(now=now + 60) == 1
+
+    assert verify_token("legacy-link") == {"success": True}
+    assert verify_token("legacy-link")["success"] is False
+    assert conn.execute("SELECT is_verified, verification_token FROM users").fetchone() == (1, None)
+    plan = " ".join(row[-1] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT user_id FROM auth_tokens WHERE token_hash = ? AND purpose = ? AND expires_at > ?",
+        ("h", "reset", now)
+    ))
+    conn.close()
+    assert "USING INDEX" in plan and "SCAN" not in plan
+
+    # A hashing timeout leaves the reset link usable
+    from streamlit.testing.v1 import AppTest
+    link = token_store.issue_token(1, token_store.RESET)
+    app = AppTest.from_string(
+        "import views.auth.reset_password as view\n"
+        "def busy(password):\n"
+        "    raise TimeoutError\n"
+        "view.hash_password = busy\n"
+        "view.reset_password()\n"
+    )
+    app.query_params["token"] = link
+    app.run()
+    app.text_input[0].input("N3w-password")
+    app.text_input[1].input("N3w-password")
+    app.button[0].click().run()
+    assert not app.exception and "busy" in app.error[0].value
+    assert token_store.peek_token(link, token_store.RESET) == 1
+
+
+def test_session_store_caches_principal_and_guards_views(tmp_path, monkeypatch):
+    import sqlite3
+
+    from streamlit.testing.v1 import AppTest
+
+    from config import settings
+    from db.init_billing_schema import init_billing_schema
+    from services.session_store import SESSION_REVALIDATE_SECONDS, SessionStore, get_session_store
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    init_billing_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        INSERT INTO users (id, tenant_id, first_name, last_name, company_name, username, password, email, role)
+        VALUES (7, 3, 'Ada', 'L', 'Co', 'ada', 'x', 'ada@example.com', 'admin')
+    """)
+    conn.commit()
+
+    now = 1_700_000_000
+    store = SessionStore(capacity=2)
+    assert store.create("nobody", now=now) is None
+    principal = store.create("ada", now=now)
+    assert (principal["user_id"], principal["role"], principal["tenant_id"]) == (7, "admin", 3)
+    assert "payments.verify" in principal["permissions"] and "tenants.manage" not in principal["permissions"]
+
+    # Another process sees the same principal from the table; this one answers from its cache
+    assert SessionStore().get(principal["session_id"], now=now + 1)["permissions"] == principal["permissions"]
+    conn.execute("DELETE FROM sessions")
+    conn.commit()
+    assert store.get(principal["session_id"], now=now + 1) is principal
+    assert store.get(principal["session_id"], now=now + SESSION_REVALIDATE_SECONDS) is None
+
+    principal = store.create("ada", now=now)
+    assert store.get(principal["session_id"], now=now + settings.SESSION_TTL) is None
+    assert store.sweep_expired(now=now + settings.SESSION_TTL) == 1
+    principal = store.create("ada", now=now)
+    store.end(principal["session_id"])
+    assert store.get(principal["session_id"], now=now) is None
+    # A password change logs the user out everywhere
+    principal = store.create("ada", now=now)
+    store.end_user_sessions(7)
+    assert store.get(principal["session_id"], now=now) is None
+    assert SessionStore().get(principal["session_id"], now=now) is None
+
+    script = (
+        "from utils.session_guard import requires\n"
+        "import streamlit as st\n"
+        "@requires('{}')\n"
+        "def page():\n"
+        "    st.write('rendered')\n"
+        "page()\n"
+    )
+    session_id = get_session_store().create("ada")["session_id"]
+    conn.executemany("""
+        INSERT INTO invoices (id, tenant_id, user_id, period_start, period_end, invoice_date, total_amount)
+        VALUES (?, ?, 7, '2025-06-01', '2025-06-30', '2025-07-01', 100.0)
+    """, [(1, 3), (2, 4)])
+    conn.commit()
+    for permission, allowed in (("payments.verify", True), ("tenants.manage", False)):
+        app = AppTest.from_string(script.format(permission))
+        app.session_state["session_id"] = session_id
+        app.run()
+        assert [m.value for m in app.markdown] == (["rendered"] if allowed else [])
+        assert bool(app.warning) is not allowed
+    app = AppTest.from_string(script.format("payments.verify"))
+    app.run()
+    assert "log in" in app.warning[0].value
+
+    # Admin pages only list and pay the principal's own tenant's invoices
+    app = AppTest.from_string("from views.admin.payment_admin import payment_admin\npayment_admin()\n")
+    app.session_state["session_id"] = session_id
+    app.run()
+    assert [o.split(" –")[0] for o in app.selectbox[0].options] == ["Invoice 1"]
+    app.button[0].click().run()
+    assert not app.exception and app.success
+    assert conn.execute("SELECT id, is_paid FROM invoices ORDER BY id").fetchall() == [(1, 1), (2, 0)]
+    conn.close()
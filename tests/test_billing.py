@@ -0,0 +1,1002 @@
+import os
+import random
+import sqlite3
+
+import numpy as np
+import pytest
+
+from db.init_billing_schema import init_billing_schema
+from services.pricing_kernel import TierSchedule, load_pricing_inputs, price_inputs, price_pairs
+
+
+def _per_row_totals(pair_subscriber, usage, limits, rates, base_fees):
+    # Reference: the per-metric loop estimate_invoice_for_user used to run
+    totals = [float(fee) for fee in base_fees]
+    for row, used, limit, rate in zip(pair_subscriber, usage, limits, rates):
+        overage = max(0, int(used) - int(limit))
+        if overage > 0:
+            totals[row] += overage * float(rate)
+    return totals
+
+
+def test_price_pairs_matches_per_row_loop_exactly():
+    rng = random.Random(42)
+    n_subscribers = 500
+    pair_subscriber, usage, limits, rates = [], [], [], []
+    for row in range(n_subscribers):
+        for _ in range(rng.randint(0, 6)):
+            pair_subscriber.append(row)
+            usage.append(rng.randint(0, 5000))
+            limits.append(rng.randint(0, 4000))
+            rates.append(round(rng.uniform(0, 3), 3))
+    base_fees = [round(rng.uniform(50, 1500), 2) for _ in range(n_subscribers)]
+
+    _, _, totals = price_pairs(pair_subscriber, usage, limits, rates, base_fees)
+
+    expected = _per_row_totals(pair_subscriber, usage, limits, rates, base_fees)
+    assert totals.tolist() == expected
+
+
+def test_price_inputs_builds_overage_lines(tmp_path):
+    db_path = str(tmp_path / "billing.db")
+    init_billing_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO tenants (id, name) VALUES (1, 'Tenant Alpha')")
+    cursor.execute("INSERT INTO plans (id, tenant_id, name, monthly_fee) VALUES (1, 1, 'Growth', 100.0)")
+    cursor.executemany("INSERT INTO usage_metrics (id, tenant_id, name) VALUES (?, 1, ?)",
+                       [(1, "SMS"), (2, "Data")])
+    cursor.executemany("INSERT INTO plan_metric_limits (plan_id, metric_id, metric_limit, overage_rate) VALUES (1, ?, ?, ?)",
+                       [(1, 100, 0.5), (2, 1000, 0.1)])
+    cursor.executemany("INSERT INTO subscriptions (user_id, plan_id, tenant_id) VALUES (?, 1, 1)", [(10,), (11,)])
+    cursor.executemany("""
+        INSERT INTO usage_records (tenant_id, user_id, metric_id, usage_amount, usage_date)
+        VALUES (1, ?, ?, ?, ?)
+    """, [(10, 1, 80, "2025-07-02"), (10, 1, 70, "2025-07-20"), (11, 2, 500, "2025-07-03"),
+          (11, 2, 900, "2025-08-01")])
+    conn.commit()
+
+    inputs = load_pricing_inputs(cursor, 1, "2025-07-01", "2025-07-31")
+    priced = price_inputs(inputs, "Base Plan: {plan_name}", "Overage - {metric_name} (Limit: {limit})")
+    conn.close()
+
+    items, total = priced[10]
+    assert [item["description"] for item in items] == ["Base Plan: Growth", "Overage - SMS (Limit: 100)"]
+    assert items[1]["quantity"] == 50
+    assert total == 100.0 + 50 * 0.5
+
+    items, total = priced[11]
+    assert len(items) == 1
+    assert total == 100.0
+
+
+def test_tier_schedule_graduated_and_volume():
+    tiers = [(100, 1.0), (500, 0.5), (None, 0.2)]
+    graduated = TierSchedule("graduated", tiers)
+    volume = TierSchedule("volume", tiers)
+    units = [0, 50, 100, 101, 500, 1000]
+
+    assert [graduated.price(u) for u in units] == [0.0, 50.0, 100.0, 100.5, 300.0, 400.0]
+    assert [volume.price(u) for u in units] == [0.0, 50.0, 100.0, 50.5, 250.0, 200.0]
+    assert graduated.price_many(units).tolist() == [graduated.price(u) for u in units]
+    assert volume.price_many(units).tolist() == [volume.price(u) for u in units]
+
+    with pytest.raises(ValueError, match="unbounded"):
+        TierSchedule("graduated", [(100, 1.0), (None, 0.5), (None, 0.2)])
+
+
+def test_tiered_limit_with_charge_cap(tmp_path):
+    db_path = str(tmp_path / "billing.db")
+    init_billing_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO plans (id, tenant_id, name, monthly_fee) VALUES (1, 1, 'Telecom', 200.0)")
+    cursor.execute("INSERT INTO usage_metrics (id, tenant_id, name) VALUES (1, 1, 'Minutes')")
+    cursor.execute("""
+        INSERT INTO plan_metric_limits (id, plan_id, metric_id, metric_limit, overage_rate, pricing_model, max_charge)
+        VALUES (1, 1, 1, 100, 9.9, 'graduated', 250.0)
+    """)
+    cursor.executemany("INSERT INTO plan_metric_tiers (plan_metric_limit_id, up_to, unit_price) VALUES (1, ?, ?)",
+                       [(100, 1.0), (None, 0.5)])
+    cursor.executemany("INSERT INTO subscriptions (user_id, plan_id, tenant_id) VALUES (?, 1, 1)", [(10,), (11,)])
+    cursor.executemany("""
+        INSERT INTO usage_records (tenant_id, user_id, metric_id, usage_amount, usage_date)
+        VALUES (1, ?, 1, ?, '2025-07-10')
+    """, [(10, 300), (11, 900)])
+    conn.commit()
+
+    inputs = load_pricing_inputs(cursor, 1, "2025-07-01", "2025-07-31")
+    priced = price_inputs(inputs, "Base Plan: {plan_name}", "Overage - {metric_name} (Limit: {limit})")
+
+    # A saved schedule with two unbounded tiers is ignored (flat overage) instead of pricing to inf
+    from services.pricing_kernel import load_tier_schedules
+    cursor.execute("INSERT INTO plan_metric_limits (id, plan_id, metric_id, pricing_model) VALUES (2, 1, 2, 'volume')")
+    cursor.executemany("INSERT INTO plan_metric_tiers (plan_metric_limit_id, up_to, unit_price) VALUES (2, NULL, ?)",
+                       [(1.0,), (0.5,)])
+    assert list(load_tier_schedules(cursor, [1, 2])) == [1]
+    conn.close()
+
+    # 200 units over: 100 at R1.00 + 100 at R0.50
+    items, total = priced[10]
+    assert items[1]["quantity"] == 200
+    assert items[1]["total_price"] == 150.0
+    assert total == 350.0
+
+    # 800 units over would be R450, capped at R250
+    items, total = priced[11]
+    assert items[1]["total_price"] == 250.0
+    assert total == 450.0
+
+
+def test_usage_meter_syncs_and_resumes_from_checkpoint(tmp_path, monkeypatch):
+    from config import settings
+    from services.usage_meter import UsageMeter, current_period
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    init_billing_schema(db_path)
+    _, start_date, _ = current_period()
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO plans (id, tenant_id, name, monthly_fee) VALUES (1, 1, 'Growth', 100.0)")
+    conn.execute("INSERT INTO usage_metrics (id, tenant_id, name) VALUES (1, 1, 'SMS')")
+    conn.execute("INSERT INTO plan_metric_limits (plan_id, metric_id, metric_limit) VALUES (1, 1, 100)")
+    conn.execute("INSERT INTO subscriptions (user_id, plan_id, tenant_id) VALUES (10, 1, 1)")
+    conn.executemany("""
+        INSERT INTO usage_records (tenant_id, user_id, metric_id, usage_amount, usage_date)
+        VALUES (?, 10, 1, ?, ?)
+    """, [(1, 40, start_date), (1, 500, "2000-01-01"), (2, 999, start_date)])
+    conn.commit()
+
+    meter = UsageMeter(sync_interval=3600)
+    assert meter.usage_vs_limit(1, 10, 1) == (40, 100)
+
+    conn.execute("""
+        INSERT INTO usage_records (tenant_id, user_id, metric_id, usage_amount, usage_date)
+        VALUES (1, 10, 1, 55, ?)
+    """, (start_date,))
+    conn.commit()
+    conn.close()
+
+    assert meter.sync(1) == {(10, 1): 95}
+    assert meter.user_usage(1, 10) == [{"metric_id": 1, "metric_name": "SMS", "used": 95, "limit": 100}]
+
+    # Between syncs, lookups are served from memory without touching the database
+    import services.usage_meter as usage_meter
+    with monkeypatch.context() as m:
+        m.setattr(usage_meter, "get_db_connection", None)
+        assert meter.usage_vs_limit(1, 10, 1) == (95, 100)
+        assert meter.user_usage(1, 11) == []
+
+    meter.checkpoint()
+    assert UsageMeter().usage(1, 10, 1) == 95
+
+    # Another process checkpoints later usage; this meter's older snapshot must not replace it
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        INSERT INTO usage_records (tenant_id, user_id, metric_id, usage_amount, usage_date)
+        VALUES (1, 10, 1, 5, ?)
+    """, (start_date,))
+    conn.commit()
+    conn.close()
+    other = UsageMeter()
+    assert other.usage(1, 10, 1) == 100
+    other.checkpoint()
+    meter.checkpoint()
+    assert UsageMeter().usage(1, 10, 1) == 100
+
+
+def test_usage_alerts_fire_once_per_threshold(tmp_path, monkeypatch):
+    from config import settings
+    import services.usage_alerts as usage_alerts
+    from services.usage_meter import UsageMeter, current_period
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    init_billing_schema(db_path)
+    period, start_date, _ = current_period()
+
+    sent, failed = [], []
+    monkeypatch.setattr(usage_alerts, "RETRY_SECONDS", 3600)
+
+    def send(*args):
+        # The first 90% alert fails and stays undelivered until deliver_pending() retries it
+        if args[5] == 90 and not failed:
+            failed.append(args)
+            return False
+        sent.append(args)
+        return True
+    monkeypatch.setattr(usage_alerts, "send_usage_alert_email", send)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        INSERT INTO users (id, tenant_id, first_name, last_name, company_name, username, password, email)
+        VALUES (10, 1, 'Bob', 'Alpha', 'AlphaTel', 'bob', 'x', 'bob@alpha.com')
+    """)
+    conn.execute("INSERT INTO plans (id, tenant_id, name, monthly_fee) VALUES (1, 1, 'Growth', 100.0)")
+    conn.execute("INSERT INTO usage_metrics (id, tenant_id, name) VALUES (1, 1, 'SMS')")
+    conn.execute("INSERT INTO plan_metric_limits (plan_id, metric_id, metric_limit) VALUES (1, 1, 100)")
+    conn.execute("INSERT INTO subscriptions (user_id, plan_id, tenant_id) VALUES (10, 1, 1)")
+    conn.commit()
+
+    meter = UsageMeter(sync_interval=3600)
+    engine = usage_alerts.UsageAlertEngine(meter)
+    meter.add_listener(engine.on_usage_changed)
+
+    def ingest(amount):
+        conn.execute("""
+            INSERT INTO usage_records (tenant_id, user_id, metric_id, usage_amount, usage_date)
+            VALUES (1, 10, 1, ?, ?)
+        """, (amount, start_date))
+        conn.commit()
+        meter.sync(1)
+        engine._outbox.join()
+
+    # A failed insert leaves the 80% crossing unrecorded, so the next change retries it
+    conn.execute("ALTER TABLE usage_notifications RENAME TO usage_notifications_away")
+    conn.commit()
+    ingest(85)
+    conn.execute("ALTER TABLE usage_notifications_away RENAME TO usage_notifications")
+    conn.commit()
+    ingest(6)    # crosses 80% and 90%
+    ingest(5)    # still below 100%
+    ingest(10)   # crosses 100%
+    ingest(10)   # already over, nothing new
+
+    query = "SELECT threshold, used, delivered_at IS NOT NULL FROM usage_notifications ORDER BY threshold"
+    assert conn.execute(query).fetchall() == [(80, 91, 1), (90, 91, 0), (100, 106, 1)]
+    assert [args[5] for args in sent] == [80, 100]
+    assert engine.deliver_pending() == 1
+    engine._outbox.join()
+    assert conn.execute(query).fetchall() == [(80, 91, 1), (90, 91, 1), (100, 106, 1)]
+    assert [args[5] for args in sent] == [80, 100, 90]
+
+    # A second sender (another process, or a retry) can't email a notification that is being sent
+    notification_id = conn.execute("""
+        INSERT INTO usage_notifications (tenant_id, user_id, metric_id, period, threshold, used, metric_limit)
+        VALUES (1, 10, 1, '2000-01', 80, 80, 100)
+    """).lastrowid
+    conn.commit()
+    other = usage_alerts.UsageAlertEngine(meter)
+
+    def send_racing(*args):
+        other._deliver(1, notification_id)
+        return send(*args)
+    monkeypatch.setattr(usage_alerts, "send_usage_alert_email", send_racing)
+    engine._deliver(1, notification_id)
+    assert len(sent) == 4
+    conn.close()
+    assert [row[2] for row in usage_alerts.get_period_notifications(1, period=period)] == [100]
+
+
+def test_invoice_preview_cache_updates_on_usage_and_invalidation(tmp_path, monkeypatch):
+    from config import settings
+    from services.catalogue import bump_catalogue_version
+    from services.invoice_preview_cache import InvoicePreviewCache
+    from services.usage_meter import UsageMeter, current_period
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    init_billing_schema(db_path)
+    _, start_date, _ = current_period()
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO plans (id, tenant_id, name, monthly_fee) VALUES (1, 1, 'Growth', 100.0)")
+    conn.execute("INSERT INTO usage_metrics (id, tenant_id, name) VALUES (1, 1, 'SMS')")
+    conn.execute("INSERT INTO plan_metric_limits (plan_id, metric_id, metric_limit, overage_rate) VALUES (1, 1, 100, 0.5)")
+    conn.execute("INSERT INTO subscriptions (user_id, plan_id, tenant_id) VALUES (10, 1, 1)")
+    conn.execute("""
+        INSERT INTO usage_records (tenant_id, user_id, metric_id, usage_amount, usage_date)
+        VALUES (1, 10, 1, 120, ?)
+    """, (start_date,))
+    conn.commit()
+
+    meter = UsageMeter(sync_interval=3600)
+    cache = InvoicePreviewCache(meter)
+    meter.add_listener(cache.on_usage_changed)
+
+    items, total = cache.get(1, 10)
+    assert total == 110.0
+    assert items[1]["quantity"] == 20
+
+    conn.execute("""
+        INSERT INTO usage_records (tenant_id, user_id, metric_id, usage_amount, usage_date)
+        VALUES (1, 10, 1, 30, ?)
+    """, (start_date,))
+    conn.commit()
+    meter.sync(1)
+    assert cache.get(1, 10)[1] == 125.0
+
+    # A change made elsewhere is picked up through the catalogue version, without invalidate()
+    conn.execute("UPDATE plans SET monthly_fee = 200.0 WHERE id = 1")
+    conn.execute("UPDATE plan_metric_limits SET metric_limit = 140 WHERE plan_id = 1")
+    bump_catalogue_version(conn.cursor(), 1)
+    conn.commit()
+    conn.close()
+    assert cache.get(1, 10)[1] == 205.0
+    # The meter checks the version alongside its next sync, not on every lookup
+    assert meter.usage_vs_limit(1, 10, 1) == (150, 100)
+    meter.sync(1)
+    assert meter.usage_vs_limit(1, 10, 1) == (150, 140)
+
+
+def test_invoice_runs_are_idempotent_per_period(tmp_path, monkeypatch):
+    from config import settings
+    from auto_generate_invoices import auto_generate_invoices
+    from billing_engine import finalize_invoice_for_user
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    init_billing_schema(db_path)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO plans (id, tenant_id, name, monthly_fee) VALUES (1, 1, 'Growth', 100.0)")
+    conn.executemany(
+        "INSERT INTO subscriptions (user_id, plan_id, tenant_id) VALUES (?, 1, 1)", [(10,), (11,)]
+    )
+    conn.commit()
+
+    auto_generate_invoices()
+    auto_generate_invoices()
+    assert conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0] == 2
+    # Same engine, and so the same lines, as billing_engine's run
+    assert {row[0] for row in conn.execute("SELECT description FROM invoice_items")} == {"Base Plan: Growth"}
+    assert conn.execute("SELECT COUNT(*) FROM billing_ledger").fetchone()[0] == 2
+
+    success, message = finalize_invoice_for_user(10, 1)
+    assert not success and "already" in message
+    assert conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0] == 2
+    conn.close()
+
+
+def test_simulated_run_reports_deltas_without_writing(tmp_path, monkeypatch):
+    from config import settings
+    from services.billing_simulation import simulate_billing_run
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    init_billing_schema(db_path)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO tenants (id, name) VALUES (1, 'Alpha')")
+    conn.execute("INSERT INTO plans (id, tenant_id, name, monthly_fee) VALUES (1, 1, 'Growth', 100.0)")
+    conn.execute("INSERT INTO usage_metrics (id, tenant_id, name) VALUES (1, 1, 'SMS')")
+    conn.execute("INSERT INTO plan_metric_limits (plan_id, metric_id, metric_limit, overage_rate) VALUES (1, 1, 100, 0.5)")
+    conn.executemany(
+        "INSERT INTO subscriptions (user_id, plan_id, tenant_id) VALUES (?, 1, 1)", [(10,), (11,)]
+    )
+    conn.execute("""
+        INSERT INTO usage_records (tenant_id, user_id, metric_id, usage_amount, usage_date)
+        VALUES (1, 10, 1, 140, '2025-07-05')
+    """)
+    conn.execute("""
+        INSERT INTO invoices (tenant_id, user_id, period_start, period_end, total_amount)
+        VALUES (1, 10, '2025-06-01', '2025-06-30', 100.0)
+    """)
+    conn.commit()
+
+    report = simulate_billing_run("2025-07")
+    assert report["tenants"] == [{
+        "tenant_id": 1, "tenant_name": "Alpha", "invoices": 2, "already_billed": 0,
+        "total": 220.0, "last_month": 100.0, "delta": 120.0,
+    }]
+    assert report["plans"][0]["plan_name"] == "Growth"
+    assert report["plans"][0]["delta"] == 120.0
+    assert conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0] == 1
+    conn.close()
+
+
+def test_simulated_run_keeps_sharded_plan_ids_apart(tmp_path, monkeypatch):
+    from config import settings
+    from db.database import get_db_connection
+    from services.billing_simulation import simulate_billing_run
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    monkeypatch.setattr(settings, "DB_SHARD_DIR", str(tmp_path / "tenants"))
+    init_billing_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO tenants (id, name) VALUES (?, ?)", [(1, "Alpha"), (2, "Beta")])
+    conn.commit()
+    conn.close()
+
+    # Each shard numbers its plans from 1
+    for tenant_id, fee, last_month in ((1, 100.0, 100.0), (2, 300.0, 250.0)):
+        shard = get_db_connection(tenant_id)
+        shard.execute("INSERT INTO plans (id, tenant_id, name, monthly_fee) VALUES (1, ?, 'Main', ?)", (tenant_id, fee))
+        shard.execute("INSERT INTO subscriptions (user_id, plan_id, tenant_id) VALUES (?, 1, ?)",
+                      (tenant_id * 10, tenant_id))
+        shard.execute("""
+            INSERT INTO invoices (tenant_id, user_id, period_start, period_end, total_amount)
+            VALUES (?, ?, '2025-06-01', '2025-06-30', ?)
+        """, (tenant_id, tenant_id * 10, last_month))
+        shard.commit()
+        shard.close()
+
+    report = simulate_billing_run("2025-07")
+    assert [(p["tenant_id"], p["plan_id"], p["last_month"], p["delta"]) for p in report["plans"]] == [
+        (1, 1, 100.0, 0.0), (2, 1, 250.0, 50.0)
+    ]
+
+
+def test_catalogue_reloads_only_when_version_bumped(tmp_path):
+    from services.catalogue import bump_catalogue_version, get_catalogue
+
+    db_path = str(tmp_path / "billing.db")
+    init_billing_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO plans (id, tenant_id, name, monthly_fee) VALUES (1, 1, 'Growth', 100.0)")
+    conn.commit()
+
+    catalogue = get_catalogue(cursor, 1)
+    assert catalogue.plans[1][2] == 100.0
+
+    cursor.execute("UPDATE plans SET monthly_fee = 150.0 WHERE id = 1")
+    conn.commit()
+    assert get_catalogue(cursor, 1) is catalogue
+
+    bump_catalogue_version(cursor, 1)
+    conn.commit()
+    assert get_catalogue(cursor, 1).plans[1][2] == 150.0
+    conn.close()
+
+
+def test_proration_splits_fees_and_allowances_by_days(tmp_path):
+    db_path = str(tmp_path / "billing.db")
+    init_billing_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO plans (id, tenant_id, name, monthly_fee) VALUES (?, 1, ?, ?)",
+                       [(1, "Basic", 100.0), (2, "Pro", 310.0)])
+    cursor.execute("INSERT INTO usage_metrics (id, tenant_id, name) VALUES (1, 1, 'SMS')")
+    cursor.executemany("INSERT INTO plan_metric_limits (plan_id, metric_id, metric_limit, overage_rate) VALUES (?, 1, ?, ?)",
+                       [(1, 100, 2.0), (2, 310, 1.0)])
+    cursor.executemany("INSERT INTO subscriptions (user_id, plan_id, tenant_id, is_active) VALUES (?, ?, 1, ?)",
+                       [(10, 2, 1), (11, 1, 0), (12, 1, 1), (13, 1, 1)])
+    cursor.executemany("""
+        INSERT INTO subscription_audit (user_id, tenant_id, action, old_plan_id, new_plan_id, timestamp)
+        VALUES (?, 1, ?, ?, ?, ?)
+    """, [
+        (10, "subscribed", None, 1, "2025-06-01T09:00:00"),
+        (10, "switched", 1, 2, "2025-07-11T09:00:00"),
+        (11, "subscribed", None, 1, "2025-06-01T09:00:00"),
+        (11, "cancelled", 1, None, "2025-07-16T09:00:00"),
+        (12, "subscribed", None, 1, "2025-07-21T09:00:00"),
+    ])
+    cursor.execute("""
+        INSERT INTO usage_records (tenant_id, user_id, metric_id, usage_amount, usage_date)
+        VALUES (1, 10, 1, 300, '2025-07-20')
+    """)
+    conn.commit()
+
+    inputs = load_pricing_inputs(cursor, 1, "2025-07-01", "2025-07-31")
+    priced = price_inputs(inputs, "Base Plan: {plan_name}", "Overage - {metric_name} (Limit: {limit})")
+    conn.close()
+
+    # 10 days of Basic, 21 of Pro; 242 pooled units, 58 over at Pro's rate
+    items, total = priced[10]
+    assert [item["description"] for item in items] == [
+        "Base Plan: Basic (10/31 days)", "Base Plan: Pro (21/31 days)", "Overage - SMS (Limit: 242)"
+    ]
+    assert total == 32.26 + 210.0 + 58.0
+
+    assert priced[11][1] == 48.39                  # cancelled on the 16th
+    assert priced[12][1] == 35.48                  # joined on the 21st
+    assert priced[13][1] == 100.0                  # no plan changes: full month
+
+
+def test_proration_opens_on_old_plan_without_earlier_events(tmp_path):
+    db_path = str(tmp_path / "billing.db")
+    init_billing_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO plans (id, tenant_id, name, monthly_fee) VALUES (?, 1, ?, ?)",
+                       [(1, "A", 300.0), (2, "B", 600.0)])
+    cursor.executemany("INSERT INTO subscriptions (user_id, plan_id, tenant_id, is_active) VALUES (?, ?, 1, ?)",
+                       [(10, 2, 1), (11, 1, 0)])
+    # Subscribed before audit events were recorded: the first row is already in the month
+    cursor.executemany("""
+        INSERT INTO subscription_audit (user_id, tenant_id, action, old_plan_id, new_plan_id, timestamp)
+        VALUES (?, 1, ?, ?, ?, ?)
+    """, [
+        (10, "switched", 1, 2, "2025-06-16T09:00:00"),
+        (11, "cancelled", 1, None, "2025-06-16T09:00:00"),
+    ])
+    conn.commit()
+
+    inputs = load_pricing_inputs(cursor, 1, "2025-06-01", "2025-06-30")
+    priced = price_inputs(inputs, "Base {plan_name}", "Overage {metric_name}")
+    conn.close()
+
+    items, total = priced[10]
+    assert [item["description"] for item in items] == ["Base A (15/30 days)", "Base B (15/30 days)"]
+    assert total == 450.0
+    assert [item["description"] for item in priced[11][0]] == ["Base A (15/30 days)"]
+    assert priced[11][1] == 150.0
+
+
+def test_proration_bills_metrics_dropped_by_a_downgrade(tmp_path):
+    db_path = str(tmp_path / "billing.db")
+    init_billing_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO plans (id, tenant_id, name, monthly_fee) VALUES (?, 1, ?, ?)",
+                       [(1, "Pro", 300.0), (2, "Lite", 60.0)])
+    cursor.executemany("INSERT INTO usage_metrics (id, tenant_id, name) VALUES (?, 1, ?)", [(1, "SMS"), (2, "Calls")])
+    cursor.executemany("INSERT INTO plan_metric_limits (plan_id, metric_id, metric_limit, overage_rate) VALUES (?, ?, ?, ?)",
+                       [(1, 1, 300, 1.0), (1, 2, 600, 0.5), (2, 1, 60, 2.0)])
+    cursor.execute("INSERT INTO subscriptions (user_id, plan_id, tenant_id, is_active) VALUES (10, 2, 1, 1)")
+    cursor.execute("""
+        INSERT INTO subscription_audit (user_id, tenant_id, action, old_plan_id, new_plan_id, timestamp)
+        VALUES (10, 1, 'switched', 1, 2, '2025-06-11T09:00:00')
+    """)
+    cursor.executemany("""
+        INSERT INTO usage_records (tenant_id, user_id, metric_id, usage_amount, usage_date)
+        VALUES (1, 10, ?, ?, '2025-06-20')
+    """, [(1, 100), (2, 1000)])
+    conn.commit()
+
+    inputs = load_pricing_inputs(cursor, 1, "2025-06-01", "2025-06-30")
+    priced = price_inputs(inputs, "Base {plan_name}", "Overage {metric_name} (Limit: {limit})")
+    conn.close()
+
+    # 10 days of Pro, 20 of Lite: SMS pools 100 + 40 units (not exceeded); Calls, dropped
+    # by the downgrade, keeps Pro's 200 units and rate: 800 over at R0.50
+    items, total = priced[10]
+    assert [item["description"] for item in items] == [
+        "Base Pro (10/30 days)", "Base Lite (20/30 days)", "Overage Calls (Limit: 200)"
+    ]
+    assert items[2]["total_price"] == 400.0
+    assert total == 540.0
+
+def test_sharded_tenants_route_and_fan_out(tmp_path, monkeypatch):
+    from config import settings
+    from auto_generate_invoices import auto_generate_invoices
+    from db.database import get_db_connection, query_all_tenants
+    from db.shard_tenants import shard_all_tenants
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    init_billing_schema(db_path)
+
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO tenants (id, name) VALUES (?, ?)", [(1, "Alpha"), (2, "Beta")])
+    conn.executemany("""
+        INSERT INTO users (id, tenant_id, first_name, last_name, company_name, username, password, email)
+        VALUES (?, ?, '', '', '', ?, '', '')
+    """, [(10, 1, "alice"), (20, 2, "bob")])
+    conn.executemany("INSERT INTO plans (id, tenant_id, name, monthly_fee) VALUES (?, ?, ?, ?)",
+                     [(1, 1, "Growth", 100.0), (2, 2, "Scale", 300.0)])
+    conn.executemany("INSERT INTO subscriptions (user_id, plan_id, tenant_id) VALUES (?, ?, ?)",
+                     [(10, 1, 1), (20, 2, 2)])
+    conn.execute("INSERT INTO subscription_versions (tenant_id, version) VALUES (2, 3)")
+    conn.commit()
+
+    monkeypatch.setattr(settings, "DB_SHARD_DIR", str(tmp_path / "tenants"))
+    copied = shard_all_tenants(prune=True)
+    assert copied[1]["plans"] == 1 and copied[2]["subscriptions"] == 1
+    # The shard keeps the subscription version, so cached subscriptions aren't served stale
+    assert copied[2]["subscription_versions"] == 1
+    assert conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0] == 0
+    conn.close()
+
+    auto_generate_invoices()
+    shard = get_db_connection(2)
+    # Tenant tables come from the shard, users from the attached global database
+    assert shard.execute("""
+        SELECT u.username, i.total_amount FROM invoices i JOIN users u ON u.id = i.user_id
+    """).fetchall() == [("bob", 300.0)]
+    shard.close()
+
+    assert sorted(query_all_tenants("SELECT tenant_id, SUM(total_amount) FROM invoices GROUP BY tenant_id")) == [
+        (1, 100.0), (2, 300.0)
+    ]
+    assert query_all_tenants("SELECT COUNT(*) FROM invoices", tenant_ids=[1]) == [(1,)]
+
+
+def test_analytics_reads_refreshed_snapshot_read_only(tmp_path, monkeypatch):
+    from config import settings
+    from db.database import get_analytics_connection, get_db_connection, query_all_tenants
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    monkeypatch.setattr(settings, "ANALYTICS_SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    monkeypatch.setattr(settings, "ANALYTICS_SNAPSHOT_TTL", 3600)
+    init_billing_schema(db_path)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO tenants (id, name) VALUES (1, 'Alpha')")
+    conn.commit()
+
+    reader = get_db_connection(read_only=True)
+    with pytest.raises(sqlite3.OperationalError):
+        reader.execute("INSERT INTO tenants (id, name) VALUES (2, 'Beta')")
+    reader.close()
+
+    assert query_all_tenants("SELECT COUNT(*) FROM tenants", snapshot=True) == [(1,)]
+    conn.execute("INSERT INTO tenants (id, name) VALUES (2, 'Beta')")
+    conn.commit()
+    conn.close()
+
+    # Within the TTL the snapshot is reused; an expired one is re-copied
+    snapshot = get_analytics_connection()
+    assert snapshot.execute("SELECT COUNT(*) FROM tenants").fetchone() == (1,)
+    snapshot.close()
+    monkeypatch.setattr(settings, "ANALYTICS_SNAPSHOT_TTL", 0)
+    assert query_all_tenants("SELECT COUNT(*) FROM tenants", snapshot=True) == [(2,)]
+
+
+def test_query_stats_time_rows_and_slow_log(tmp_path, monkeypatch):
+    import json
+    from config import settings
+    from db.database import get_db_connection
+    from db.query_stats import query_stats
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    monkeypatch.setattr(settings, "SLOW_QUERY_MS", 0)
+    monkeypatch.setattr(settings, "SLOW_QUERY_LOG", str(tmp_path / "logs" / "slow_queries.log"))
+    init_billing_schema(db_path)
+    query_stats.reset()
+
+    conn = get_db_connection()
+    conn.executemany("INSERT INTO tenants (id, name) VALUES (?, ?)", [(1, "Alpha"), (2, "Beta")])
+    for tenant_id in (1, 2):
+        conn.execute(f"SELECT name FROM tenants WHERE id = {tenant_id}").fetchall()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM tenants WHERE name IN ('Alpha', 'Beta')")
+    assert [row[0] for row in cursor] == [1, 2]
+    conn.close()
+
+    stats = {row["sql"]: row for row in json.loads(query_stats.to_json())}
+    lookup = stats["SELECT name FROM tenants WHERE id = ?"]
+    assert lookup["calls"] == 2 and lookup["rows"] == 2
+    assert all(site.startswith(os.path.join("tests", "test_billing.py")) for site in lookup["call_sites"])
+    assert stats["SELECT id FROM tenants WHERE name IN (?...)"]["rows"] == 2
+    assert stats["INSERT INTO tenants (id, name) VALUES (?, ?)"]["rows"] == 2
+
+    with open(settings.SLOW_QUERY_LOG) as f:
+        assert "SELECT name FROM tenants WHERE id = ?" in f.read()
+
+
+def test_render_profiler_records_queries_and_captures(tmp_path, monkeypatch):
+    from config import settings
+    from db.database import get_db_connection
+    from utils.render_profiler import profile_render, render_stats
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    monkeypatch.setattr(settings, "RENDER_PROFILE_DIR", str(tmp_path / "profiles"))
+    monkeypatch.setattr(settings, "RENDER_PROFILE_LOG", str(tmp_path / "render_profile.log"))
+    init_billing_schema(db_path)
+    render_stats.reset()
+
+    def view():
+        conn = get_db_connection()
+        conn.executemany("INSERT INTO tenants (id, name) VALUES (?, ?)", [(1, "Alpha"), (2, "Beta")])
+        conn.execute("SELECT * FROM tenants").fetchall()
+        conn.close()
+
+    profile_render("admin/Dashboard", view)
+    profile_render("admin/Dashboard", lambda: None, capture=True)
+
+    page = render_stats.slowest()[0]
+    assert page["page"] == "admin/Dashboard" and page["renders"] == 2
+    assert page["avg_queries"] == 1.0 and page["avg_rows"] == 2.0
+    captures = os.listdir(settings.RENDER_PROFILE_DIR)
+    assert len(captures) == 1 and captures[0].startswith("admin_Dashboard")
+    assert page["peak_kb"] == 0.0  # memory tracing is opt-in
+
+    # With memory tracing, an outer render's peak survives an inner render, and
+    # tracing someone else started is left running
+    import tracemalloc
+    monkeypatch.setattr(settings, "RENDER_PROFILE_MEMORY", True)
+    render_stats.reset()
+
+    def outer():
+        block = bytearray(4_000_000)
+        del block
+        profile_render("inner", lambda: bytearray(1000))
+
+    profile_render("outer", outer)
+    peaks = {row["page"]: row["peak_kb"] for row in render_stats.slowest()}
+    assert peaks["outer"] >= 3900 and peaks["inner"] < 1000
+    assert not tracemalloc.is_tracing()
+    tracemalloc.start()
+    try:
+        profile_render("traced elsewhere", lambda: None)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_synthetic_dataset_is_reproducible(tmp_path):
+    from db.synthetic_data import generate_dataset
+
+    def build(name):
+        db_path = str(tmp_path / name)
+        counts = generate_dataset(db_path, tenants=2, users_per_tenant=5, events_per_user_per_day=3,
+                                  start_date="2025-01-01", end_date="2025-02-28", seed=7, batch_size=100)
+        conn = sqlite3.connect(db_path)
+        usage = conn.execute("""
+            SELECT tenant_id, user_id, metric_id, usage_amount, usage_date FROM usage_records ORDER BY id
+        """).fetchall()
+        invoices = conn.execute("SELECT tenant_id, user_id, period_start, total_amount, is_paid FROM invoices").fetchall()
+        conn.close()
+        return counts, usage, invoices
+
+    counts, usage, invoices = build("a.db")
+    assert counts["usage_records"] == 2 * 5 * 3 * 59
+    assert counts["invoices"] == 2 * 5 * 2 and len(invoices) == counts["invoices"]
+    assert (counts, usage, invoices) == build("b.db")
+
+
+def test_usage_csv_import_inserts_valid_rows(tmp_path, monkeypatch):
+    import io
+    from config import settings
+    from db.synthetic_data import generate_dataset
+    from services.usage_import import import_usage_csv
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    generate_dataset(db_path, tenants=1, users_per_tenant=2, events_per_user_per_day=0, start_date="2025-01-01",
+                     end_date="2025-01-31")
+    csv = io.StringIO(
+        "user_id,metric_name,usage_amount,usage_date\n"
+        "2,API Calls,10,2025-02-01\n"
+        "3,SMS,5,2025-02-02\n"
+        "2,Fax,1,2025-02-02\n"
+        "3,SMS,lots,2025-02-03\n"
+    )
+
+    valid, failed = import_usage_csv(1, csv)
+
+    assert valid == 2
+    assert [line for line, _ in failed] == [4, 5] and "Unknown metric" in failed[0][1]
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT SUM(usage_amount) FROM usage_records").fetchone()[0] == 15
+    conn.close()
+    with pytest.raises(ValueError):
+        import_usage_csv(1, io.StringIO("user_id,usage_amount\n2,1\n"))
+
+
+def test_invoice_balance_follows_payments_and_verification(tmp_path, monkeypatch):
+    from config import settings
+    from payment_logic import record_payment, verify_payment
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    conn = sqlite3.connect(db_path)
+    # Tables from before the running balance: a verified and an unverified part-payment
+    conn.executescript("""
+        CREATE TABLE invoices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, tenant_id INTEGER NOT NULL, user_id INTEGER NOT NULL,
+            period_start TEXT NOT NULL, period_end TEXT NOT NULL, invoice_date TEXT DEFAULT CURRENT_DATE,
+            total_amount REAL NOT NULL, is_paid INTEGER DEFAULT 0,
+            due_date TEXT DEFAULT (DATE('now', '+30 days')),
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP, updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, invoice_id INTEGER, amount REAL,
+            payment_date TEXT, payment_method TEXT, receipt_path TEXT, notes TEXT,
+            is_verified INTEGER DEFAULT 0, created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+        INSERT INTO invoices (id, tenant_id, user_id, period_start, period_end, total_amount, is_paid)
+        VALUES (1, 1, 10, '2025-06-01', '2025-06-30', 100.0, 0),
+               (2, 1, 10, '2025-05-01', '2025-05-31', 80.0, 1);
+        INSERT INTO payments (user_id, invoice_id, amount, is_verified)
+        VALUES (10, 1, 25.0, 1), (10, 1, 50.0, 0);
+    """)
+    init_billing_schema(db_path)
+    assert conn.execute("SELECT id, amount_paid, balance_due FROM invoices ORDER BY id").fetchall() == [
+        (1, 25.0, 75.0), (2, 80.0, 0.0)
+    ]
+
+    assert record_payment(1, 40.0, "eft")
+    assert conn.execute("SELECT amount_paid, balance_due, is_paid FROM invoices WHERE id = 1").fetchone() == (65.0, 35.0, 0)
+    assert not record_payment(99, 10.0)
+    assert not record_payment(1, 10.0, tenant_id=2)
+
+    # A client's submitted payment only counts once verified, and only once
+    pending = conn.execute("""
+        INSERT INTO payments (user_id, invoice_id, amount, is_verified) VALUES (10, 1, 35.0, 0) RETURNING id
+    """).fetchone()[0]
+    conn.commit()
+    assert conn.execute("SELECT balance_due FROM invoices WHERE id = 1").fetchone()[0] == 35.0
+    assert verify_payment(pending) == (1, 0.0, 1)
+    assert verify_payment(pending) is None
+    assert conn.execute("SELECT amount_paid, is_paid FROM invoices WHERE id = 1").fetchone() == (100.0, 1)
+    conn.close()
+
+
+def test_bank_statement_reconciles_in_one_pass(tmp_path, monkeypatch):
+    from config import settings
+    from services import reconciliation
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    init_billing_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executemany("""
+        INSERT INTO users (id, tenant_id, first_name, last_name, company_name, username, password, email)
+        VALUES (?, 1, 'C', 'L', 'Co', ?, 'x', ?)
+    """, [(10, "ana", "ana@example.com"), (11, "ben", "ben@example.com")])
+    conn.executemany("""
+        INSERT INTO invoices (id, tenant_id, user_id, period_start, period_end, invoice_date, due_date, total_amount)
+        VALUES (?, 1, ?, '2025-06-01', '2025-06-30', '2025-07-01', '2025-07-31', ?)
+    """, [(1, 10, 100.0), (2, 11, 80.0), (3, 11, 55.5), (4, 10, 55.5)])
+    conn.execute("""
+        INSERT INTO payments (id, user_id, invoice_id, amount, payment_date, is_verified)
+        VALUES (7, 11, 2, 80.0, '2025-07-10', 0)
+    """)
+    conn.commit()
+    queued = []
+    monkeypatch.setattr(reconciliation.get_mail_outbox(), "send_many", queued.extend)
+
+    statement = (
+        "Date,Amount,Reference\n"
+        "2025-07-09,40.00,INV-0001 part\n"      # invoice number, part payment
+        "2025-07-11,80.00,ACME TRANSFER\n"      # the one pending payment of that amount
+        "2025-07-12,55.50,BEN\n"                # two open invoices of 55.50: ambiguous
+        "2025-07-12,-20.00,Bank fees\n"         # debit, ignored
+        "2025-07-12,oops,INV 3\n"
+    )
+    lines, errors = reconciliation.parse_statement(statement.encode(), "statement.csv")
+    assert len(lines) == 3 and [n for n, _ in errors] == [6]
+
+    result = reconciliation.match_statement(1, lines)
+    assert [(m["kind"], m["invoice_id"]) for m in result["matched"]] == [("invoice", 1), ("pending", 2)]
+    assert [l["reference"] for l in result["unmatched"]] == ["BEN"]
+
+    assert reconciliation.apply_matches(1, result["matched"]) == {
+        "applied": 2, "skipped": 0, "conflicts": 0, "emails_queued": 2}
+    assert conn.execute("SELECT id, balance_due, is_paid FROM invoices ORDER BY id").fetchall() == [
+        (1, 60.0, 0), (2, 0.0, 1), (3, 55.5, 0), (4, 55.5, 0)
+    ]
+    assert conn.execute("SELECT is_verified FROM payments WHERE id = 7").fetchone() == (1,)
+    assert sorted(to for to, _, _ in queued) == ["ana@example.com", "ben@example.com"]
+
+    # Re-importing the same statement reconciles nothing new
+    again = reconciliation.match_statement(1, reconciliation.parse_statement(statement, "statement.csv")[0])
+    assert not again["matched"] and len(again["duplicates"]) == 2
+    # Matches computed before the first apply are reported as conflicts, not applied twice
+    assert reconciliation.apply_matches(1, result["matched"], notify=False) == {
+        "applied": 0, "skipped": 0, "conflicts": 2, "emails_queued": 0}
+
+    ofx = """<OFX><BANKTRANLIST>
+        <STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20250715120000<TRNAMT>55.50<FITID>F1<NAME>Invoice #3</STMTTRN>
+        </BANKTRANLIST></OFX>"""
+    lines, _ = reconciliation.parse_statement(ofx, "statement.ofx")
+    matched = reconciliation.match_statement(1, lines)["matched"]
+    assert [(m["invoice_id"], m["line"]["bank_ref"]) for m in matched] == [(3, "F1")]
+    assert reconciliation.apply_matches(1, matched, notify=False)["applied"] == 1
+
+    # Transaction ids are only unique within one tenant's bank account
+    conn.execute("""
+        INSERT INTO users (id, tenant_id, first_name, last_name, company_name, username, password, email)
+        VALUES (20, 2, 'C', 'L', 'Co', 'cat', 'x', 'cat@example.com')
+    """)
+    conn.execute("""
+        INSERT INTO invoices (id, tenant_id, user_id, period_start, period_end, invoice_date, due_date, total_amount)
+        VALUES (5, 2, 20, '2025-06-01', '2025-06-30', '2025-07-01', '2025-07-31', 55.5)
+    """)
+    conn.commit()
+    ofx = ofx.replace("Invoice #3", "Invoice #5")
+    matched = reconciliation.match_statement(2, reconciliation.parse_statement(ofx, "statement.ofx")[0])["matched"]
+    assert reconciliation.apply_matches(2, matched, notify=False)["applied"] == 1
+    assert conn.execute("SELECT is_paid FROM invoices WHERE id = 5").fetchone() == (1,)
+    conn.close()
+
+
+def test_bulk_verify_and_reject_pending_payments(tmp_path, monkeypatch):
+    from config import settings
+    import payment_logic
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    init_billing_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executemany("""
+        INSERT INTO users (id, tenant_id, first_name, last_name, company_name, username, password, email)
+        VALUES (?, ?, 'C', 'L', 'Co', ?, 'x', ?)
+    """, [(10, 1, "ana", "ana@example.com"), (20, 2, "zed", "zed@example.com")])
+    conn.executemany("""
+        INSERT INTO invoices (id, tenant_id, user_id, period_start, period_end, total_amount)
+        VALUES (?, ?, ?, '2025-06-01', '2025-06-30', 100.0)
+    """, [(1, 1, 10), (2, 1, 10), (3, 2, 20)])
+    conn.executemany("""
+        INSERT INTO payments (id, user_id, invoice_id, amount, payment_date, receipt_size, is_verified)
+        VALUES (?, ?, ?, ?, ?, ?, 0)
+    """, [(pid, 10, 1 + pid % 2, 10.0, f"2025-07-{pid:02d}", 1024 if pid % 3 else None) for pid in range(1, 13)]
+        + [(13, 20, 3, 100.0, "2025-07-01", None)])
+    conn.commit()
+    queued = []
+    monkeypatch.setattr(payment_logic.get_mail_outbox(), "send_many", queued.extend)
+
+    rows, total = payment_logic.pending_payments(1, limit=5, offset=5)
+    assert total == 12 and [r[0] for r in rows] == [7, 6, 5, 4, 3]
+    assert [r[8] for r in rows] == [1024, None, 1024, 1024, None]
+    assert payment_logic.pending_payments(1, search="#2")[1] == 6
+
+    verified = payment_logic.verify_payments(list(range(1, 11)) + [13], tenant_id=1)
+    assert len(verified) == 10  # another tenant's payment is ignored
+    assert payment_logic.verify_payments([1, 2], tenant_id=1) == []
+    rejected = payment_logic.reject_payments([10, 11, 12], "Unreadable receipt", tenant_id=1)
+    assert [r[0] for r in rejected] == [11, 12]
+    assert payment_logic.queue_payment_notices(1, verified=verified, rejected=rejected, reason="Unreadable receipt") == 12
+    assert any("Unreadable receipt" in body for _, _, body in queued)
+
+    assert conn.execute("SELECT id, amount_paid, is_paid FROM invoices ORDER BY id").fetchall() == [
+        (1, 50.0, 0), (2, 50.0, 0), (3, 0.0, 0)
+    ]
+    assert conn.execute("SELECT is_verified, rejection_reason FROM payments WHERE id = 12").fetchone() == (
+        -1, "Unreadable receipt"
+    )
+    assert payment_logic.pending_payments(1)[1] == 0
+    conn.close()
+
+
+def test_receipt_store_dedupes_by_content(tmp_path, monkeypatch):
+    import hashlib
+    import io
+    import os
+    from config import settings
+    from services import receipt_store
+
+    monkeypatch.setattr(settings, "RECEIPTS_DIR", str(tmp_path / "receipts"))
+    monkeypatch.setattr(receipt_store, "CHUNK_SIZE", 7)  # several chunks per upload
+    pdf = b"%PDF-1.4 proof of payment " * 10
+
+    first = receipt_store.store_receipt(io.BytesIO(pdf), "proof.bin", "application/octet-stream")
+    second = receipt_store.store_receipt(io.BytesIO(pdf), "again.pdf")
+    sha = hashlib.sha256(pdf).hexdigest()
+    assert first == {"path": str(tmp_path / "receipts" / sha[:2] / sha[2:4] / f"{sha}.pdf"), "sha256": sha,
+                     "size": len(pdf), "mime": "application/pdf", "deduplicated": False}
+    assert second == {**first, "deduplicated": True}
+    other = receipt_store.store_receipt(io.BytesIO(b"plain text"), "note.txt", None)
+    assert other["mime"] == "text/plain" and other["path"].endswith(other["sha256"])
+
+    files = [f for _, _, names in os.walk(tmp_path / "receipts") for f in names]
+    assert len(files) == 2  # no leftover temp files
+    assert receipt_store.read_receipt(first["path"]) == pdf
+    assert receipt_store.read_receipt(str(tmp_path / "missing.pdf")) is None
+
+
+def test_subscription_changes_are_audited_and_refresh_lookups(tmp_path, monkeypatch):
+    from config import settings
+    from services.subscriptions import active_plan, active_plans, assign_plan, cancel_subscription, get_subscriptions
+
+    db_path = str(tmp_path / "billing.db")
+    monkeypatch.setattr(settings, "DB_FILE", db_path)
+    init_billing_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO plans (id, tenant_id, name, monthly_fee) VALUES (?, 1, ?, ?)",
+                       [(1, "Starter", 50.0), (2, "Growth", 100.0)])
+    cursor.executemany("INSERT INTO subscriptions (user_id, tenant_id, plan_id, start_date, is_active) VALUES (?, 1, 1, '2025-06-01', 1)",
+                       [(10,), (11,)])
+    conn.commit()
+
+    snapshot = get_subscriptions(cursor, 1)
+    assert active_plans(cursor, 1) == {10: 1, 11: 1}
+    assert get_subscriptions(cursor, 1) is snapshot
+
+    assert assign_plan(1, 10, 2) == "switched"
+    assert assign_plan(1, 10, 2) is None
+    assert assign_plan(1, 12, 1) == "subscribed"
+    assert cancel_subscription(1, 11) == "cancelled"
+    assert cancel_subscription(1, 11) is None
+
+    assert active_plans(cursor, 1) == {10: 2, 12: 1}
+    assert active_plans(cursor, 1, [10, 11, 99]) == {10: 2}
+    assert active_plan(cursor, 1, 11) is None
+    assert cursor.execute("SELECT user_id, action, old_plan_id, new_plan_id FROM subscription_audit ORDER BY id").fetchall() == [
+        (10, "switched", 1, 2), (12, "subscribed", None, 1), (11, "cancelled", 1, None)
+    ]
+    assert cursor.execute("SELECT version FROM subscription_versions WHERE tenant_id = 1").fetchone() == (3,)
+    plan = " ".join(row[3] for row in cursor.execute(
+        "EXPLAIN QUERY PLAN SELECT plan_id FROM subscriptions WHERE user_id = ? AND is_active = 1", (10,)
+    ))
+    assert "idx_subscriptions_user_active" in plan
+    conn.close()